@@ -2,6 +2,14 @@ import tkinter as tk
 from tkinter import messagebox
 from datetime import datetime
 
+from credentials import Sessions
+from ledger import LimitExceeded
+from money import format_amount, parse_amount
+from archive import open_archive
+from history_view import FilterBar, HistoryView, query_source
+from screens import ScreenCache
+from terminal import open_terminal
+
 class ATMPhonePeApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -9,146 +17,220 @@ class ATMPhonePeApp(tk.Tk):
         self.geometry("560x500")
         self.configure(bg="#181818")
 
-        self.balance = 100000.0
-        self.atm_pin = "2004"
-        self.phonepe_pin = "2004"
-        self.transactions = []
+        self.card_number = "100002"
+        open_terminal(self, "ATM-INTERFACE", self.statement_rows, rows=5)
+        self.sessions = Sessions()  # the PhonePe PIN prompt reuses the login check
+        self.session = None
+        self.history = open_archive(self.card_number)  # kept on disk, read through mmap
 
         self.title_font = ("Segoe UI", 18, "bold")
         self.text_font = ("Segoe UI", 12)
 
+        # Every screen is built once and re-shown on later visits
+        self.screens = ScreenCache(self, bg="#181818")
+
         self.show_login_screen()
 
     # --- Screens ---
     def show_login_screen(self):
-        self.clear()
-        self._title("🔐 Login to ATM")
-        self.pin_entry = self._entry(show="*")
-        self._animated_button("Login", self.login)
+        frame = self._show("login", self.build_login_screen)
+        self.pin_entry = self._reset_entry(frame.pin_entry)
+
+    def build_login_screen(self, frame):
+        self._title(frame, "🔐 Login to ATM")
+        frame.pin_entry = self._entry(frame, show="*")
+        self._animated_button(frame, "Login", self.login)
 
     def login(self):
-        if self.pin_entry.get() == self.atm_pin:
+        if self.worker.busy:
+            return
+        pin = self.pin_entry.get()
+        self.worker.login(self.card_number, pin, on_success=lambda ok, balance: self.login_done(ok, balance, pin))
+
+    def login_done(self, ok, balance, pin):
+        if ok:
+            self.session = self.sessions.open(self.card_number, pin)
+            self.statements.put(self.card_number, balance)
             self.show_main_menu()
         else:
             messagebox.showerror("Error", "Incorrect PIN")
 
+    def session_expired(self):
+        self.sessions.close(self.session)
+        messagebox.showerror("Session expired", "Please enter your PIN again.")
+        self.show_login_screen()
+
     def show_main_menu(self):
-        self.clear()
-        self._title("🏦 Main Menu")
-        self._animated_button("💰 Check Balance", self.check_balance)
-        self._animated_button("📥 Deposit", self.deposit_screen)
-        self._animated_button("📤 Withdraw", self.withdraw_screen)
-        self._animated_button("📲 PhonePe Transfer", self.phonepe_screen)
-        self._animated_button("📄 Transaction History", self.show_transactions)
-        self._animated_button("🔐 Logout", self.show_login_screen)
+        self._show("menu", self.build_main_menu)
+
+    def build_main_menu(self, frame):
+        self._title(frame, "🏦 Main Menu")
+        self._animated_button(frame, "💰 Check Balance", self.check_balance)
+        self._animated_button(frame, "📥 Deposit", self.deposit_screen)
+        self._animated_button(frame, "📤 Withdraw", self.withdraw_screen)
+        self._animated_button(frame, "📲 PhonePe Transfer", self.phonepe_screen)
+        self._animated_button(frame, "📄 Transaction History", self.show_transactions)
+        self._animated_button(frame, "🔐 Logout", self.show_login_screen)
 
     def check_balance(self):
-        messagebox.showinfo("Balance", f"Your current balance is ₹{self.balance:.2f}")
+        self.statements.get(self.card_number, self.show_statement)
+
+    def show_statement(self, statement):
+        message = f"Your current balance is ₹{format_amount(statement.balance)}"
+        if statement.rows:
+            message += "\n\nRecent transactions:\n" + "\n".join(statement.rows)
+        messagebox.showinfo("Balance", message)
 
     def deposit_screen(self):
-        self.clear()
-        self._title("💵 Deposit Amount")
-        self.amount_entry = self._entry()
-        self._animated_button("Deposit", self.deposit)
-        self._animated_button("🔙 Back", self.show_main_menu)
+        frame = self._show("deposit", lambda f: self.build_amount_screen(f, "💵 Deposit Amount", "Deposit", self.deposit))
+        self.amount_entry = self._reset_entry(frame.amount_entry)
+
+    def build_amount_screen(self, frame, title, action, command):
+        self._title(frame, title)
+        frame.amount_entry = self._entry(frame)
+        self._animated_button(frame, action, command)
+        self._animated_button(frame, "🔙 Back", self.show_main_menu)
 
     def deposit(self):
+        if self.worker.busy:
+            return
         try:
-            amount = float(self.amount_entry.get())
-            if amount <= 0:
-                raise ValueError
-            self.balance += amount
-            self.add_transaction("Deposit", amount)
-            messagebox.showinfo("Success", f"Deposited ₹{amount:.2f}")
-            self.show_main_menu()
+            amount = parse_amount(self.amount_entry.get())
         except ValueError:
             messagebox.showerror("Error", "Enter a valid amount")
+            return
+        self.worker.submit("deposit", self.card_number, amount,
+                           on_success=lambda balance: self.transaction_done(
+                               "Deposit", amount, "", balance, f"Deposited ₹{format_amount(amount)}"),
+                           on_error=lambda exc: self.transaction_failed(exc, "Enter a valid amount"))
 
     def withdraw_screen(self):
-        self.clear()
-        self._title("💸 Withdraw Amount")
-        self.amount_entry = self._entry()
-        self._animated_button("Withdraw", self.withdraw)
-        self._animated_button("🔙 Back", self.show_main_menu)
+        frame = self._show("withdraw", lambda f: self.build_amount_screen(f, "💸 Withdraw Amount", "Withdraw", self.withdraw))
+        self.amount_entry = self._reset_entry(frame.amount_entry)
 
     def withdraw(self):
+        if self.worker.busy:
+            return
         try:
-            amount = float(self.amount_entry.get())
-            if amount <= 0 or amount > self.balance:
-                messagebox.showerror("Error", "Invalid or insufficient balance")
-                return
-            self.balance -= amount
-            self.add_transaction("Withdraw", amount)
-            messagebox.showinfo("Success", f"Withdrew ₹{amount:.2f}")
-            self.show_main_menu()
+            amount = parse_amount(self.amount_entry.get())
+            if amount <= 0:
+                raise ValueError
         except ValueError:
             messagebox.showerror("Error", "Enter a valid amount")
+            return
+        notes = self.cassettes.plan(amount)
+        if notes is None:
+            messagebox.showerror("Error", self.cassettes.refusal(amount))
+            return
+        self.worker.submit("withdraw", self.card_number, amount,
+                           on_success=lambda balance: self.cash_withdrawn(notes, amount, balance),
+                           on_error=lambda exc: self.transaction_failed(exc, "Invalid or insufficient balance"))
+
+    def cash_withdrawn(self, notes, amount, balance):
+        self.transaction_done("Withdraw", amount, "", balance,
+                              f"Withdrew ₹{format_amount(amount)}\n{self.cassettes.pay_out(notes)}")
 
     def phonepe_screen(self):
-        self.clear()
-        self._title("📲 PhonePe Transfer")
-        self.recipient_entry = self._entry("Recipient Name")
-        self.phonepe_amount_entry = self._entry("Amount")
-        self.phonepe_pin_entry = self._entry("PhonePe PIN", show="*")
-        self._animated_button("Send", self.phonepe_transfer)
-        self._animated_button("🔙 Back", self.show_main_menu)
+        frame = self._show("phonepe", self.build_phonepe_screen)
+        self.recipient_entry = self._reset_entry(frame.recipient_entry)
+        self.phonepe_amount_entry = self._reset_entry(frame.phonepe_amount_entry)
+        self.phonepe_pin_entry = self._reset_entry(frame.phonepe_pin_entry)
+
+    def build_phonepe_screen(self, frame):
+        self._title(frame, "📲 PhonePe Transfer")
+        frame.recipient_entry = self._entry(frame, "Recipient Name")
+        frame.phonepe_amount_entry = self._entry(frame, "Amount")
+        frame.phonepe_pin_entry = self._entry(frame, "PhonePe PIN", show="*")
+        self._animated_button(frame, "Send", self.phonepe_transfer)
+        self._animated_button(frame, "🔙 Back", self.show_main_menu)
 
     def phonepe_transfer(self):
+        if self.worker.busy:
+            return
         try:
             name = self.recipient_entry.get()
-            amount = float(self.phonepe_amount_entry.get())
+            amount = parse_amount(self.phonepe_amount_entry.get())
             pin = self.phonepe_pin_entry.get()
-            if pin != self.phonepe_pin:
-                messagebox.showerror("Error", "Incorrect PhonePe PIN")
-                return
-            if amount <= 0 or amount > self.balance or not name:
-                raise ValueError
-            self.balance -= amount
-            self.add_transaction("PhonePe", amount, name)
-            messagebox.showinfo("Success", f"Sent ₹{amount:.2f} to {name}")
-            self.show_main_menu()
         except ValueError:
             messagebox.showerror("Error", "Invalid input or insufficient balance")
+            return
+        if not self.sessions.verify(self.session, pin):
+            if not self.sessions.active(self.session):
+                self.session_expired()
+            else:
+                messagebox.showerror("Error", "Incorrect PhonePe PIN")
+            return
+        self.worker.submit("phonepe", self.card_number, amount, name,
+                           on_success=lambda balance: self.transaction_done(
+                               "PhonePe", amount, name, balance, f"Sent ₹{format_amount(amount)} to {name}"),
+                           on_error=lambda exc: self.transaction_failed(exc, "Invalid input or insufficient balance"))
+
+    def transaction_done(self, type, amount, recipient, balance, message):
+        self.add_transaction(type, amount, recipient)
+        self.statements.put(self.card_number, balance)
+        messagebox.showinfo("Success", message)
+        self.show_main_menu()
+
+    def transaction_failed(self, exc, message):
+        if isinstance(exc, LimitExceeded):
+            messagebox.showerror("Limit reached", str(exc))
+        elif isinstance(exc, ValueError):
+            messagebox.showerror("Error", message)
+        else:
+            raise exc
 
     def show_transactions(self):
-        self.clear()
-        self._title("📄 Transaction History")
+        frame = self._show("transactions", self.build_transactions_screen)
+        frame.table.scroll_to(0)
 
-        if not self.transactions:
-            tk.Label(self, text="No transactions yet.", font=self.text_font, fg="gray", bg="#181818").pack(pady=10)
-        else:
-            frame = tk.Frame(self, bg="#181818")
-            frame.pack(padx=20, pady=10)
-            for txn in reversed(self.transactions[-15:]):
-                label = tk.Label(
-                    frame, text=txn,
-                    anchor="w", justify="left",
-                    font=("Courier New", 10),
-                    bg="#262626", fg="white",
-                    padx=10, pady=5
-                )
-                label.pack(fill="x", pady=2)
-
-        self._animated_button("🔙 Back", self.show_main_menu)
+    def build_transactions_screen(self, frame):
+        self._title(frame, "📄 Transaction History")
+
+        # Newest first, paged through a fixed set of rows
+        frame.table = HistoryView(frame, ("Transaction",),
+                                  *query_source(self.history, self.format_transaction, newest_first=True),
+                                  font=("Courier New", 10), bg="#262626")
+        FilterBar(frame, frame.table, self.history, self.format_transaction, ("Deposit", "Withdraw", "PhonePe"),
+                  newest_first=True, font=("Courier New", 10), bg="#181818").pack(padx=20)
+        frame.table.pack(padx=20, pady=10)
+
+        self._animated_button(frame, "🔙 Back", self.show_main_menu)
 
     # --- Helper Functions ---
     def add_transaction(self, type, amount, recipient=""):
-        time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        entry = f"{time} | {type:<10} | ₹{amount:<10.2f} | {'To: ' + recipient if recipient else ''}"
-        self.transactions.append(entry)
+        self.history.add(type, amount, recipient)
+
+    def statement_rows(self, account, rows):
+        recent = self.history.query()[-rows:][::-1]
+        return [self.format_transaction(record) for record in recent]
+
+    def format_transaction(self, record):
+        time = datetime.fromtimestamp(record.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        recipient = record.counterparty
+        return f"{time} | {record.kind:<10} | ₹{format_amount(record.amount):<10} | {'To: ' + recipient if recipient else ''}"
+
+    def _show(self, name, build):
+        return self.screens.show(name, build, fill="both", expand=True)
 
-    def _title(self, text):
-        tk.Label(self, text=text, font=self.title_font, bg="#181818", fg="white").pack(pady=20)
+    def _title(self, parent, text):
+        tk.Label(parent, text=text, font=self.title_font, bg="#181818", fg="white").pack(pady=20)
 
-    def _entry(self, placeholder="", show=None):
-        entry = tk.Entry(self, font=self.text_font, width=32, bg="#2a2a2a", fg="white", insertbackground="white", bd=0, show=show)
+    def _entry(self, parent, placeholder="", show=None):
+        entry = tk.Entry(parent, font=self.text_font, width=32, bg="#2a2a2a", fg="white", insertbackground="white", bd=0, show=show)
         entry.pack(pady=6)
+        entry.placeholder = placeholder
         if placeholder:
             entry.insert(0, placeholder)
         return entry
 
-    def _animated_button(self, text, command):
-        btn = tk.Label(self, text=text, font=self.text_font, bg="#2f2f2f", fg="white", padx=10, pady=8, width=25, cursor="hand2")
+    def _reset_entry(self, entry):
+        entry.delete(0, tk.END)
+        if entry.placeholder:
+            entry.insert(0, entry.placeholder)
+        return entry
+
+    def _animated_button(self, parent, text, command):
+        btn = tk.Label(parent, text=text, font=self.text_font, bg="#2f2f2f", fg="white", padx=10, pady=8, width=25, cursor="hand2")
         btn.pack(pady=6)
         btn.bind("<Enter>", lambda e: btn.config(bg="#404040"))
         btn.bind("<Leave>", lambda e: btn.config(bg="#2f2f2f"))
@@ -160,10 +242,7 @@ class ATMPhonePeApp(tk.Tk):
         self.after(100, lambda: widget.config(bg=original))
         self.after(150, callback)
 
-    def clear(self):
-        for widget in self.winfo_children():
-            widget.destroy()
-
 if __name__ == "__main__":
     app = ATMPhonePeApp()
     app.mainloop()
+    app.worker.close()
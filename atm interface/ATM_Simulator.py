@@ -2,6 +2,14 @@ import tkinter as tk
 from tkinter import messagebox
 from datetime import datetime
 
+from credentials import Sessions
+from ledger import InsufficientBalance, LimitExceeded
+from money import format_amount, parse_amount
+from archive import open_archive
+from history_view import FilterBar, HistoryView, query_source
+from screens import ScreenCache
+from terminal import open_terminal
+
 class ATMPhonePeApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -10,151 +18,227 @@ class ATMPhonePeApp(tk.Tk):
         self.configure(bg="#121212")
 
         # State
-        self.balance = 100000.0  # Starting balance
-        self.atm_pin = "2004"
-        self.phonepe_pin = "2004"
-        self.transactions = []  # In-memory transaction log
+        self.card_number = "100002"
+        open_terminal(self, "ATM_Simulator", self.statement_rows, rows=5)
+        self.sessions = Sessions()  # the PhonePe PIN prompt reuses the login check
+        self.session = None
+        self.history = open_archive(self.card_number)  # transaction log on disk, read through mmap
 
         # Fonts
         self.title_font = ("Helvetica", 20, "bold")
         self.text_font = ("Helvetica", 13)
 
+        # Screens are built on first visit and reused afterwards
+        self.screens = ScreenCache(self, bg="#121212")
+
         self.show_login_screen()
 
+    def show_screen(self, name, build):
+        return self.screens.show(name, build, fill="both", expand=True)
+
     def show_login_screen(self):
-        self.clear()
-        tk.Label(self, text="🔐 Enter ATM PIN", font=self.title_font, bg="#121212", fg="white").pack(pady=20)
-        self.pin_entry = tk.Entry(self, show="*", font=self.text_font, width=20)
-        self.pin_entry.pack(pady=10)
-        tk.Button(self, text="Login", font=self.text_font, bg="#1f1f1f", fg="white", command=self.login).pack(pady=5)
+        frame = self.show_screen("login", self.build_login_screen)
+        self.pin_entry = frame.pin_entry
+        self.pin_entry.delete(0, tk.END)
+
+    def build_login_screen(self, frame):
+        tk.Label(frame, text="🔐 Enter ATM PIN", font=self.title_font, bg="#121212", fg="white").pack(pady=20)
+        frame.pin_entry = tk.Entry(frame, show="*", font=self.text_font, width=20)
+        frame.pin_entry.pack(pady=10)
+        tk.Button(frame, text="Login", font=self.text_font, bg="#1f1f1f", fg="white", command=self.login).pack(pady=5)
 
     def login(self):
-        if self.pin_entry.get() == self.atm_pin:
+        if self.worker.busy:
+            return
+        pin = self.pin_entry.get()
+        self.worker.login(self.card_number, pin, on_success=lambda ok, balance: self.login_done(ok, balance, pin))
+
+    def login_done(self, ok, balance, pin):
+        if ok:
+            self.session = self.sessions.open(self.card_number, pin)
+            self.statements.put(self.card_number, balance)
             self.show_main_menu()
         else:
             messagebox.showerror("Error", "Incorrect PIN")
 
+    def session_expired(self):
+        self.sessions.close(self.session)
+        messagebox.showerror("Session expired", "Please enter your PIN again.")
+        self.show_login_screen()
+
     def show_main_menu(self):
-        self.clear()
-        tk.Label(self, text="🏦 Main Menu", font=self.title_font, bg="#121212", fg="white").pack(pady=20)
-        self.create_button("💰 Check Balance", self.check_balance)
-        self.create_button("📤 Withdraw", self.withdraw_screen)
-        self.create_button("📥 Deposit", self.deposit_screen)
-        self.create_button("📲 PhonePe Transfer", self.phonepe_screen)
-        self.create_button("📄 Transaction History", self.show_transactions)
-        self.create_button("🔐 Logout", self.show_login_screen)
-
-    def create_button(self, text, command):
-        tk.Button(self, text=text, font=self.text_font, width=25, bg="#2c2c2c", fg="white", command=command).pack(pady=5)
+        self.show_screen("menu", self.build_main_menu)
+
+    def build_main_menu(self, frame):
+        tk.Label(frame, text="🏦 Main Menu", font=self.title_font, bg="#121212", fg="white").pack(pady=20)
+        self.create_button(frame, "💰 Check Balance", self.check_balance)
+        self.create_button(frame, "📤 Withdraw", self.withdraw_screen)
+        self.create_button(frame, "📥 Deposit", self.deposit_screen)
+        self.create_button(frame, "📲 PhonePe Transfer", self.phonepe_screen)
+        self.create_button(frame, "📄 Transaction History", self.show_transactions)
+        self.create_button(frame, "🔐 Logout", self.show_login_screen)
+
+    def create_button(self, parent, text, command):
+        tk.Button(parent, text=text, font=self.text_font, width=25, bg="#2c2c2c", fg="white", command=command).pack(pady=5)
 
     def check_balance(self):
-        messagebox.showinfo("Balance", f"Your current balance is ₹{self.balance:.2f}")
+        self.statements.get(self.card_number, self.show_statement)
+
+    def show_statement(self, statement):
+        message = f"Your current balance is ₹{format_amount(statement.balance)}"
+        if statement.rows:
+            message += "\n\nRecent transactions:\n" + "\n".join(statement.rows)
+        messagebox.showinfo("Balance", message)
 
     def withdraw_screen(self):
-        self.clear()
-        tk.Label(self, text="💸 Withdraw Money", font=self.title_font, bg="#121212", fg="white").pack(pady=20)
-        self.amount_entry = tk.Entry(self, font=self.text_font)
-        self.amount_entry.pack(pady=10)
-        tk.Button(self, text="Withdraw", font=self.text_font, bg="#2c2c2c", fg="white", command=self.withdraw).pack(pady=5)
-        self.create_button("🔙 Back", self.show_main_menu)
+        self.show_amount_screen("withdraw", "💸 Withdraw Money", "Withdraw", self.withdraw)
+
+    def show_amount_screen(self, name, title, action, command):
+        frame = self.show_screen(name, lambda f: self.build_amount_screen(f, title, action, command))
+        self.amount_entry = frame.amount_entry
+        self.amount_entry.delete(0, tk.END)
+
+    def build_amount_screen(self, frame, title, action, command):
+        tk.Label(frame, text=title, font=self.title_font, bg="#121212", fg="white").pack(pady=20)
+        frame.amount_entry = tk.Entry(frame, font=self.text_font)
+        frame.amount_entry.pack(pady=10)
+        tk.Button(frame, text=action, font=self.text_font, bg="#2c2c2c", fg="white", command=command).pack(pady=5)
+        self.create_button(frame, "🔙 Back", self.show_main_menu)
 
     def withdraw(self):
+        if self.worker.busy:
+            return
         try:
-            amount = float(self.amount_entry.get())
+            amount = parse_amount(self.amount_entry.get())
             if amount <= 0:
                 raise ValueError
-            if amount > self.balance:
-                messagebox.showerror("Error", "Insufficient balance")
-            else:
-                self.balance -= amount
-                self.log_transaction("Withdraw", amount)
-                messagebox.showinfo("Success", f"Withdrew ₹{amount:.2f}")
-                self.show_main_menu()
         except ValueError:
             messagebox.showerror("Error", "Enter a valid amount")
+            return
+        notes = self.cassettes.plan(amount)
+        if notes is None:
+            messagebox.showerror("Error", self.cassettes.refusal(amount))
+            return
+        self.worker.submit("withdraw", self.card_number, amount,
+                           on_success=lambda balance: self.cash_withdrawn(notes, amount, balance),
+                           on_error=lambda exc: self.transaction_failed(exc, "Enter a valid amount"))
+
+    def cash_withdrawn(self, notes, amount, balance):
+        self.transaction_done("Withdraw", amount, "", balance,
+                              f"Withdrew ₹{format_amount(amount)}\n{self.cassettes.pay_out(notes)}")
 
     def deposit_screen(self):
-        self.clear()
-        tk.Label(self, text="💵 Deposit Money", font=self.title_font, bg="#121212", fg="white").pack(pady=20)
-        self.amount_entry = tk.Entry(self, font=self.text_font)
-        self.amount_entry.pack(pady=10)
-        tk.Button(self, text="Deposit", font=self.text_font, bg="#2c2c2c", fg="white", command=self.deposit).pack(pady=5)
-        self.create_button("🔙 Back", self.show_main_menu)
+        self.show_amount_screen("deposit", "💵 Deposit Money", "Deposit", self.deposit)
 
     def deposit(self):
+        if self.worker.busy:
+            return
         try:
-            amount = float(self.amount_entry.get())
-            if amount <= 0:
-                raise ValueError
-            self.balance += amount
-            self.log_transaction("Deposit", amount)
-            messagebox.showinfo("Success", f"Deposited ₹{amount:.2f}")
-            self.show_main_menu()
+            amount = parse_amount(self.amount_entry.get())
         except ValueError:
             messagebox.showerror("Error", "Enter a valid amount")
+            return
+        self.worker.submit("deposit", self.card_number, amount,
+                           on_success=lambda balance: self.transaction_done(
+                               "Deposit", amount, "", balance, f"Deposited ₹{format_amount(amount)}"),
+                           on_error=lambda exc: self.transaction_failed(exc, "Enter a valid amount"))
 
     def phonepe_screen(self):
-        self.clear()
-        tk.Label(self, text="📲 PhonePe Transfer", font=self.title_font, bg="#121212", fg="white").pack(pady=10)
-        self.recipient_entry = tk.Entry(self, font=self.text_font)
+        frame = self.show_screen("phonepe", self.build_phonepe_screen)
+        self.recipient_entry = frame.recipient_entry
+        self.recipient_entry.delete(0, tk.END)
         self.recipient_entry.insert(0, "Recipient Name")
-        self.recipient_entry.pack(pady=5)
 
-        self.phonepe_amount_entry = tk.Entry(self, font=self.text_font)
+        self.phonepe_amount_entry = frame.phonepe_amount_entry
+        self.phonepe_amount_entry.delete(0, tk.END)
         self.phonepe_amount_entry.insert(0, "Amount")
-        self.phonepe_amount_entry.pack(pady=5)
 
-        self.phonepe_pin_entry = tk.Entry(self, show="*", font=self.text_font)
-        self.phonepe_pin_entry.pack(pady=5)
+        self.phonepe_pin_entry = frame.phonepe_pin_entry
+        self.phonepe_pin_entry.delete(0, tk.END)
+
+    def build_phonepe_screen(self, frame):
+        tk.Label(frame, text="📲 PhonePe Transfer", font=self.title_font, bg="#121212", fg="white").pack(pady=10)
+        frame.recipient_entry = tk.Entry(frame, font=self.text_font)
+        frame.recipient_entry.pack(pady=5)
+
+        frame.phonepe_amount_entry = tk.Entry(frame, font=self.text_font)
+        frame.phonepe_amount_entry.pack(pady=5)
 
-        tk.Button(self, text="Send", font=self.text_font, bg="#2c2c2c", fg="white", command=self.phonepe_transfer).pack(pady=5)
-        self.create_button("🔙 Back", self.show_main_menu)
+        frame.phonepe_pin_entry = tk.Entry(frame, show="*", font=self.text_font)
+        frame.phonepe_pin_entry.pack(pady=5)
+
+        tk.Button(frame, text="Send", font=self.text_font, bg="#2c2c2c", fg="white", command=self.phonepe_transfer).pack(pady=5)
+        self.create_button(frame, "🔙 Back", self.show_main_menu)
 
     def phonepe_transfer(self):
+        if self.worker.busy:
+            return
         try:
             name = self.recipient_entry.get()
-            amount = float(self.phonepe_amount_entry.get())
+            amount = parse_amount(self.phonepe_amount_entry.get())
             entered_pin = self.phonepe_pin_entry.get()
             if amount <= 0 or not name:
                 raise ValueError
-            if entered_pin != self.phonepe_pin:
-                messagebox.showerror("Error", "Incorrect PhonePe PIN")
-            elif amount > self.balance:
-                messagebox.showerror("Error", "Insufficient balance")
-            else:
-                self.balance -= amount
-                self.log_transaction("PhonePe", amount, name)
-                messagebox.showinfo("Success", f"Sent ₹{amount:.2f} to {name}")
-                self.show_main_menu()
         except ValueError:
             messagebox.showerror("Error", "Invalid details")
+            return
+        if not self.sessions.verify(self.session, entered_pin):
+            if not self.sessions.active(self.session):
+                self.session_expired()
+            else:
+                messagebox.showerror("Error", "Incorrect PhonePe PIN")
+            return
+        self.worker.submit("phonepe", self.card_number, amount, name,
+                           on_success=lambda balance: self.transaction_done(
+                               "PhonePe", amount, name, balance, f"Sent ₹{format_amount(amount)} to {name}"),
+                           on_error=lambda exc: self.transaction_failed(exc, "Invalid details"))
+
+    def transaction_done(self, type, amount, recipient, balance, message):
+        self.log_transaction(type, amount, recipient)
+        self.statements.put(self.card_number, balance)
+        messagebox.showinfo("Success", message)
+        self.show_main_menu()
+
+    def transaction_failed(self, exc, message):
+        if isinstance(exc, LimitExceeded):
+            messagebox.showerror("Limit reached", str(exc))
+        elif isinstance(exc, InsufficientBalance):
+            messagebox.showerror("Error", "Insufficient balance")
+        elif isinstance(exc, ValueError):
+            messagebox.showerror("Error", message)
+        else:
+            raise exc
 
     def show_transactions(self):
-        self.clear()
-        tk.Label(self, text="📄 Transaction History", font=self.title_font, bg="#121212", fg="white").pack(pady=10)
-        text_box = tk.Text(self, height=15, width=60, bg="#1e1e1e", fg="white", font=("Courier", 10))
-        text_box.pack()
+        frame = self.show_screen("transactions", self.build_transactions_screen)
+        frame.text_box.scroll_to(0)
 
-        if not self.transactions:
-            text_box.insert(tk.END, "No transactions yet.")
-        else:
-            for entry in self.transactions:
-                text_box.insert(tk.END, entry + "\n")
+    def build_transactions_screen(self, frame):
+        tk.Label(frame, text="📄 Transaction History", font=self.title_font, bg="#121212", fg="white").pack(pady=10)
+        frame.text_box = HistoryView(frame, ("Transaction",), *query_source(self.history, self.format_transaction),
+                                     font=("Courier", 10), bg="#1e1e1e")
+        FilterBar(frame, frame.text_box, self.history, self.format_transaction, ("Deposit", "Withdraw", "PhonePe"),
+                  font=("Courier", 10), bg="#121212").pack(pady=5)
+        frame.text_box.pack()
 
-        self.create_button("🔙 Back", self.show_main_menu)
+        self.create_button(frame, "🔙 Back", self.show_main_menu)
 
     def log_transaction(self, type, amount, recipient=""):
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        if recipient:
-            entry = f"{timestamp} | {type:<10} | ₹{amount:<10.2f} | To: {recipient}"
-        else:
-            entry = f"{timestamp} | {type:<10} | ₹{amount:<10.2f}"
-        self.transactions.append(entry)
+        self.history.add(type, amount, recipient)
+
+    def statement_rows(self, account, rows):
+        recent = self.history.query()[-rows:][::-1]
+        return [self.format_transaction(record) for record in recent]
 
-    def clear(self):
-        for widget in self.winfo_children():
-            widget.destroy()
+    def format_transaction(self, record):
+        # Formatted only when the row is scrolled into view
+        timestamp = datetime.fromtimestamp(record.timestamp).strftime("%Y-%m-%d %H:%M:%S")
+        entry = f"{timestamp} | {record.kind:<10} | ₹{format_amount(record.amount):<10}"
+        if record.counterparty:
+            return f"{entry} | To: {record.counterparty}"
+        return entry
 
 if __name__ == "__main__":
     app = ATMPhonePeApp()
     app.mainloop()
+    app.worker.close()
@@ -0,0 +1,126 @@
+"""Transaction history kept on disk as memory-mapped columns.
+
+Each account gets a directory holding one file per column of ``COLUMNS``
+(raw fixed-width values, e.g. ``amounts.q`` is little 8-byte integers) plus
+two text files naming the type and string codes. Reads go through a memory
+map, so opening years of history costs nothing up front and a slice of a
+column is a ``memoryview`` onto the page cache rather than a copy:
+
+    archive = open_archive("100001")
+    amounts = archive.column("amounts", -1000)   # last 1000 amounts, zero-copy
+    numpy.frombuffer(amounts, dtype=numpy.int64).sum()
+
+Appends are written straight through to the files. A crash can leave the
+columns at different lengths; the extra tail is cut off on the next open.
+"""
+import mmap
+import os
+from array import array
+
+from config import DATA_DIR
+from history import COLUMNS, History, Names
+
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+
+
+class Column:
+    """One column file, appended through the file and read through a map."""
+
+    def __init__(self, path, typecode):
+        self.typecode = typecode
+        self.itemsize = array(typecode).itemsize
+        self._file = open(path, "a+b", buffering=0)
+        self._length = self._file.seek(0, os.SEEK_END) // self.itemsize
+        self._view = memoryview(b"").cast(typecode)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        return self.view()[index]
+
+    def append(self, value):
+        self._file.write(array(self.typecode, (value,)))
+        self._length += 1
+
+    def truncate(self, length):
+        self._file.truncate(length * self.itemsize)
+        self._length = length
+        self._view = memoryview(b"").cast(self.typecode)
+
+    def view(self):
+        # Remap when the file has grown past the current map. The old map is
+        # left to the garbage collector, since callers may still hold slices
+        if len(self._view) < self._length:
+            mapped = mmap.mmap(self._file.fileno(), self._length * self.itemsize, access=mmap.ACCESS_READ)
+            self._view = memoryview(mapped).cast(self.typecode)
+        return self._view
+
+    def close(self):
+        self._view = memoryview(b"").cast(self.typecode)
+        self._file.close()
+
+
+class NameFile(Names):
+    """``Names`` persisted one per line, so codes mean the same after a restart."""
+
+    def __init__(self, path, names=()):
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                names = [line[:-1] for line in f if line.endswith("\n")]
+        super().__init__(names)
+        # Rewrite in full, dropping any torn last line, before appending
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.writelines(name + "\n" for name in self.names)
+        os.replace(path + ".tmp", path)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def number(self, name):
+        return super().number(name.replace("\n", " "))
+
+    def added(self, name):
+        self._file.write(name + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class Archive(History):
+    """A ``History`` whose columns live in memory-mapped files.
+
+    Drop-in for the in-memory history behind ``query_source`` and the
+    filter bar; only the type and counterparty indexes, built on the first
+    filtered query, are kept on the heap.
+    """
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        columns = {name: Column(os.path.join(directory, f"{name}.{typecode}"), typecode)
+                   for name, typecode in COLUMNS}
+        length = min(map(len, columns.values()))
+        for column in columns.values():
+            if len(column) > length:
+                column.truncate(length)  # torn append
+        self._attach(columns, NameFile(os.path.join(directory, "kinds.txt")),
+                     NameFile(os.path.join(directory, "strings.txt"), [""]))
+
+    def column(self, name, start=None, stop=None):
+        """Zero-copy ``memoryview`` of ``name`` (one of ``COLUMNS``) rows ``start:stop``."""
+        return getattr(self, name).view()[start:stop]
+
+    def clear(self):
+        for name, _ in COLUMNS:
+            getattr(self, name).truncate(0)
+        self._attach({name: getattr(self, name) for name, _ in COLUMNS}, self.kinds, self.strings)
+
+    def close(self):
+        for name, _ in COLUMNS:
+            getattr(self, name).close()
+        self.kinds.close()
+        self.strings.close()
+
+
+def open_archive(account, root=None):
+    return Archive(os.path.join(root or ARCHIVE_DIR, account))
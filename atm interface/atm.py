@@ -1,6 +1,10 @@
 import tkinter as tk
 from tkinter import messagebox
 
+from ledger import InsufficientBalance, LimitExceeded
+from money import format_amount, parse_amount
+from terminal import open_terminal
+
 class ATMApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -10,8 +14,8 @@ class ATMApp(tk.Tk):
         self.configure(bg="black")
 
         self.user_authenticated = False
-        self.balance = 100000.00
-        self.transaction_history = []
+        open_terminal(self, "atm")
+        self.account = None
 
         self.container = tk.Frame(self, bg="black")
         self.container.pack(fill="both", expand=True)
@@ -28,9 +32,15 @@ class ATMApp(tk.Tk):
     def show_screen(self, screen_name):
         frame = self.frames[screen_name]
         frame.tkraise()
+        # Screens that show account data refresh it each time they come up
+        on_show = getattr(frame, "on_show", None)
+        if on_show is not None:
+            on_show()
 
     def logout(self):
         self.user_authenticated = False
+        self.account = None
+        self.frames["BalanceScreen"].clear()
         self.show_screen("LoginScreen")
 
 
@@ -60,8 +70,16 @@ class LoginScreen(tk.Frame):
         user_id = self.user_entry.get()
         pin = self.pin_entry.get()
 
-        if user_id == "123456" and pin == "654321":
+        worker = self.controller.worker
+        if worker.busy:
+            return
+        worker.login(user_id, pin, on_success=lambda ok, balance: self.login_done(ok, balance, user_id))
+
+    def login_done(self, ok, balance, user_id):
+        if ok:
             self.controller.user_authenticated = True
+            self.controller.account = user_id
+            self.controller.statements.put(user_id, balance)
             messagebox.showinfo("Login Success", "Welcome!")
             self.controller.show_screen("MenuScreen")
             # Clear inputs after login
@@ -117,16 +135,26 @@ class DepositScreen(tk.Frame):
         back_btn.pack()
 
     def deposit_money(self):
+        if self.controller.worker.busy:
+            return
         try:
-            amount = float(self.amount_entry.get())
-            if amount <= 0:
-                raise ValueError
-            self.controller.balance += amount
-            self.controller.transaction_history.append(f"Deposited ${amount:.2f}")
-            messagebox.showinfo("Deposit Successful", f"${amount:.2f} deposited successfully!")
-            self.amount_entry.delete(0, tk.END)
+            amount = parse_amount(self.amount_entry.get())
         except ValueError:
-            messagebox.showerror("Invalid Input", "Please enter a valid positive number.")
+            self.deposit_failed(None)
+            return
+        self.controller.worker.submit("deposit", self.controller.account, amount,
+                                      on_success=lambda balance: self.deposit_done(amount, balance),
+                                      on_error=self.deposit_failed)
+
+    def deposit_done(self, amount, balance):
+        self.controller.statements.put(self.controller.account, balance)
+        messagebox.showinfo("Deposit Successful", f"${format_amount(amount)} deposited successfully!")
+        self.amount_entry.delete(0, tk.END)
+
+    def deposit_failed(self, exc):
+        if exc is not None and not isinstance(exc, ValueError):
+            raise exc
+        messagebox.showerror("Invalid Input", "Please enter a valid positive number.")
 
 
 class WithdrawScreen(tk.Frame):
@@ -152,19 +180,38 @@ class WithdrawScreen(tk.Frame):
         back_btn.pack()
 
     def withdraw_money(self):
+        if self.controller.worker.busy:
+            return
         try:
-            amount = float(self.amount_entry.get())
+            amount = parse_amount(self.amount_entry.get())
             if amount <= 0:
                 raise ValueError
-            if amount > self.controller.balance:
-                messagebox.showerror("Insufficient Funds", "You do not have enough balance.")
-            else:
-                self.controller.balance -= amount
-                self.controller.transaction_history.append(f"Withdrawn ${amount:.2f}")
-                messagebox.showinfo("Withdrawal Successful", f"${amount:.2f} withdrawn successfully!")
-                self.amount_entry.delete(0, tk.END)
         except ValueError:
+            self.withdraw_failed(None)
+            return
+        notes = self.controller.cassettes.plan(amount)
+        if notes is None:
+            messagebox.showerror("Cannot Dispense", self.controller.cassettes.refusal(amount))
+            return
+        self.controller.worker.submit("withdraw", self.controller.account, amount,
+                                      on_success=lambda balance: self.withdraw_done(notes, amount, balance),
+                                      on_error=self.withdraw_failed)
+
+    def withdraw_done(self, notes, amount, balance):
+        dispensed = self.controller.cassettes.pay_out(notes)
+        self.controller.statements.put(self.controller.account, balance)
+        messagebox.showinfo("Withdrawal Successful", f"${format_amount(amount)} withdrawn successfully!\n{dispensed}")
+        self.amount_entry.delete(0, tk.END)
+
+    def withdraw_failed(self, exc):
+        if isinstance(exc, LimitExceeded):
+            messagebox.showerror("Limit Reached", str(exc))
+        elif isinstance(exc, InsufficientBalance):
+            messagebox.showerror("Insufficient Funds", "You do not have enough balance.")
+        elif exc is None or isinstance(exc, ValueError):
             messagebox.showerror("Invalid Input", "Please enter a valid positive number.")
+        else:
+            raise exc
 
 
 class BalanceScreen(tk.Frame):
@@ -186,13 +233,26 @@ class BalanceScreen(tk.Frame):
         back_btn = tk.Button(self, text="Back to Menu", bg="dim gray", command=lambda: controller.show_screen("MenuScreen"), **btn_cfg)
         back_btn.pack()
 
+    def on_show(self):
         self.show_balance()
 
+    def clear(self):
+        # Nothing of the last cardholder may be left for the next one
+        self.balance_label.config(text="")
+
     def show_balance(self):
-        bal = self.controller.balance
-        self.balance_label.config(text=f"${bal:.2f}")
+        account = self.controller.account
+        if account is None:
+            return
+        self.controller.statements.get(account, lambda statement: self.balance_ready(account, statement))
+
+    def balance_ready(self, account, statement):
+        # The card may have logged out while the balance was being fetched
+        if account == self.controller.account:
+            self.balance_label.config(text=f"${format_amount(statement.balance)}")
 
 
 if __name__ == "__main__":
     app = ATMApp()
     app.mainloop()
+    app.worker.close()
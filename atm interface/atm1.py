@@ -1,5 +1,14 @@
 import tkinter as tk
-from tkinter import font, messagebox, ttk
+from tkinter import font, messagebox
+
+from credentials import Sessions
+from ledger import InsufficientBalance, LimitExceeded
+from money import format_amount, parse_amount
+from archive import open_archive
+from history_view import FilterBar, HistoryView, query_source
+from screens import ScreenCache
+from terminal import open_terminal
+from keypad import Keypad
 
 class ATMApp(tk.Tk):
     def __init__(self):
@@ -14,72 +23,47 @@ class ATMApp(tk.Tk):
         self.msg_font = font.Font(family="Segoe UI", size=18)
 
         # ATM data
-        self.user_pin = "1234"
-        self.balance = 100000.0
-        self.transaction_history = []
+        self.card_number = "100001"
+        open_terminal(self, "atm1", self.statement_rows)
+        self.sessions = Sessions()  # passcode prompts reuse the PIN check done at login
+        self.session = None
+        self.history = open_archive(self.card_number)  # kept on disk, read through mmap
 
         # Internal input state
         self.input_value = ""
         self.current_passcode = ""
         self.current_screen = None
 
-        # Container frame
+        # Container frame; each screen is built into it once and then reused
         self.container = tk.Frame(self, bg="black")
         self.container.pack(expand=True, fill="both")
+        self.screens = ScreenCache(self.container, bg="black")
+        # One keypad for the whole app, moved onto whichever screen needs it
+        self.keypad = Keypad(self.container, self.btn_font)
 
         # Start with login screen
         self.show_login_screen()
 
-    def clear_container(self):
-        for widget in self.container.winfo_children():
-            widget.destroy()
-
     def show_login_screen(self):
-        self.clear_container()
+        frame = self.screens.show("login", self.build_login_screen)
         self.current_screen = "login"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
+        self.input_value = ""
+        self.pin_display = frame.pin_display
+        self.pin_display.config(text="• " * 0)
+        self.keypad.attach(self.pin_display, self.on_pin_press, self.clear_input, self.login_attempt)
 
+    def build_login_screen(self, frame):
         tk.Label(frame, text="Welcome to ATM", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
         tk.Label(frame, text="Enter your 4-digit PIN", fg="white", bg="black", font=self.msg_font).pack(pady=10)
 
-        self.input_value = ""
-        self.pin_display = tk.Label(frame, text="• " * 0, fg="white", bg="#111", font=self.title_font,
-                                    width=10, height=2, relief="sunken", bd=4)
-        self.pin_display.pack(pady=10)
-
-        keypad = self.build_keypad(frame, self.on_pin_press, self.clear_input, self.login_attempt)
-        keypad.pack(pady=10)
+        frame.pin_display = tk.Label(frame, text="• " * 0, fg="white", bg="#111", font=self.title_font,
+                                     width=10, height=2, relief="sunken", bd=4)
+        frame.pin_display.pack(pady=10)
 
         self.btn_exit = tk.Button(frame, text="Exit", font=self.btn_font, bg="#b22222", fg="white",
                                   command=self.quit, width=10)
         self.btn_exit.pack(pady=10)
 
-    def build_keypad(self, parent, num_cmd, clear_cmd, enter_cmd):
-        keypad_frame = tk.Frame(parent, bg="black")
-        # Buttons 1-9
-        for i in range(1, 10):
-            btn = tk.Button(keypad_frame, text=str(i), font=self.btn_font, fg="white", bg="#222",
-                            activebackground="cyan", width=5, height=2,
-                            command=lambda x=i: num_cmd(x))
-            btn.grid(row=(i-1)//3, column=(i-1)%3, padx=8, pady=8)
-        # Clear, 0, Enter
-        btn_clear = tk.Button(keypad_frame, text="Clear", font=self.btn_font, fg="white", bg="#b22222",
-                              activebackground="#ff5555", width=5, height=2,
-                              command=clear_cmd)
-        btn_clear.grid(row=3, column=0, padx=8, pady=8)
-
-        btn_zero = tk.Button(keypad_frame, text="0", font=self.btn_font, fg="white", bg="#222",
-                             activebackground="cyan", width=5, height=2,
-                             command=lambda: num_cmd(0))
-        btn_zero.grid(row=3, column=1, padx=8, pady=8)
-
-        btn_enter = tk.Button(keypad_frame, text="Enter", font=self.btn_font, fg="white", bg="#228b22",
-                              activebackground="#55ff55", width=5, height=2,
-                              command=enter_cmd)
-        btn_enter.grid(row=3, column=2, padx=8, pady=8)
-        return keypad_frame
-
     def on_pin_press(self, num):
         if len(self.input_value) < 4:
             self.input_value += str(num)
@@ -93,18 +77,31 @@ class ATMApp(tk.Tk):
             self.input_display.config(text="")
 
     def login_attempt(self):
-        if self.input_value == self.user_pin:
+        if self.worker.busy:
+            return
+        pin = self.input_value
+        self.worker.login(self.card_number, pin, on_success=lambda ok, balance: self.login_done(ok, balance, pin),
+                          on_locked=self.clear_input)
+
+    def login_done(self, ok, balance, pin):
+        if ok:
+            self.session = self.sessions.open(self.card_number, pin)
+            self.statements.put(self.card_number, balance)
             self.show_main_menu()
         else:
             messagebox.showerror("Error", "Incorrect PIN. Try again.")
             self.clear_input()
 
+    def session_expired(self):
+        self.sessions.close(self.session)
+        messagebox.showerror("Session expired", "Please enter your PIN again.")
+        self.show_login_screen()
+
     def show_main_menu(self):
-        self.clear_container()
+        self.screens.show("menu", self.build_main_menu)
         self.current_screen = "menu"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
 
+    def build_main_menu(self, frame):
         tk.Label(frame, text="Select Operation", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
 
         buttons = [
@@ -122,118 +119,85 @@ class ATMApp(tk.Tk):
             btn.pack(pady=10)
 
     def show_deposit_screen(self):
-        self.clear_container()
-        self.current_screen = "deposit"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
-
-        tk.Label(frame, text="Deposit Amount", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
-
-        self.input_value = ""
-        self.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                      width=20, height=2, relief="sunken", bd=4)
-        self.input_display.pack(pady=10)
-
-        keypad = self.build_keypad(frame, self.on_input_press, self.clear_input, self.deposit_action)
-        keypad.pack(pady=10)
-
-        self.passcode_label = tk.Label(frame, text="Enter Passcode (4 or 6 digits)", fg="white", bg="black",
-                                      font=self.msg_font)
-        self.passcode_label.pack(pady=5)
-
-        self.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
-        self.passcode_entry.pack(pady=5)
-
-        btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
-                             activebackground="#ff5555", width=10, command=self.show_main_menu)
-        btn_back.pack(pady=10)
+        self.show_amount_screen("deposit", "Deposit Amount", self.deposit_action)
 
     def show_withdraw_screen(self):
-        self.clear_container()
-        self.current_screen = "withdraw"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
-
-        tk.Label(frame, text="Withdraw Amount", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
-
-        self.input_value = ""
-        self.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                      width=20, height=2, relief="sunken", bd=4)
-        self.input_display.pack(pady=10)
-
-        keypad = self.build_keypad(frame, self.on_input_press, self.clear_input, self.withdraw_action)
-        keypad.pack(pady=10)
-
-        self.passcode_label = tk.Label(frame, text="Enter Passcode (4 or 6 digits)", fg="white", bg="black",
-                                      font=self.msg_font)
-        self.passcode_label.pack(pady=5)
-
-        self.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
-        self.passcode_entry.pack(pady=5)
-
-        btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
-                             activebackground="#ff5555", width=10, command=self.show_main_menu)
-        btn_back.pack(pady=10)
+        self.show_amount_screen("withdraw", "Withdraw Amount", self.withdraw_action)
 
     def show_transfer_screen(self):
-        self.clear_container()
-        self.current_screen = "transfer"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
-
-        tk.Label(frame, text="Transfer Amount", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
+        self.show_amount_screen("transfer", "Transfer Amount", self.transfer_amount_entered, recipient=True)
 
+    def show_amount_screen(self, name, title, enter_cmd, recipient=False):
+        frame = self.screens.show(name, lambda f: self.build_amount_screen(f, title, recipient))
+        self.current_screen = name
         self.input_value = ""
-        self.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                      width=20, height=2, relief="sunken", bd=4)
-        self.input_display.pack(pady=10)
-
-        keypad = self.build_keypad(frame, self.on_input_press, self.clear_input, self.transfer_amount_entered)
-        keypad.pack(pady=10)
-
-        tk.Label(frame, text="Recipient Name", fg="white", bg="black", font=self.msg_font).pack(pady=5)
-        self.recipient_entry = tk.Entry(frame, font=self.btn_font, width=20)
-        self.recipient_entry.pack(pady=5)
-
-        self.passcode_label = tk.Label(frame, text="Enter Passcode (4 or 6 digits)", fg="white", bg="black",
-                                      font=self.msg_font)
-        self.passcode_label.pack(pady=5)
-
-        self.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
-        self.passcode_entry.pack(pady=5)
+        self.input_display = frame.input_display
+        self.input_display.config(text="")
+        self.keypad.attach(self.input_display, self.on_input_press, self.clear_input, enter_cmd)
+        self.passcode_entry = frame.passcode_entry
+        self.passcode_entry.delete(0, tk.END)
+        if recipient:
+            self.recipient_entry = frame.recipient_entry
+            self.recipient_entry.delete(0, tk.END)
+
+    def build_amount_screen(self, frame, title, recipient):
+        tk.Label(frame, text=title, fg="cyan", bg="black", font=self.title_font).pack(pady=20)
+
+        frame.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
+                                       width=20, height=2, relief="sunken", bd=4)
+        frame.input_display.pack(pady=10)
+
+        if recipient:
+            tk.Label(frame, text="Recipient Name", fg="white", bg="black", font=self.msg_font).pack(pady=5)
+            frame.recipient_entry = tk.Entry(frame, font=self.btn_font, width=20)
+            frame.recipient_entry.pack(pady=5)
+
+        passcode_label = tk.Label(frame, text="Enter your PIN to confirm", fg="white", bg="black",
+                                  font=self.msg_font)
+        passcode_label.pack(pady=5)
+
+        frame.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
+        frame.passcode_entry.pack(pady=5)
 
         btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
                              activebackground="#ff5555", width=10, command=self.show_main_menu)
         btn_back.pack(pady=10)
 
     def show_balance_screen(self):
-        self.clear_container()
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
+        frame = self.screens.show("balance", self.build_balance_screen)
+        self.current_screen = "balance"
+        self.statements.get(self.card_number, lambda statement: self.show_statement(frame, statement))
+
+    def show_statement(self, frame, statement):
+        frame.balance_label.config(text=f"₹ {format_amount(statement.balance, grouping=True)}")
+        frame.statement_label.config(text="\n".join(statement.rows) or "No transactions yet.")
+
+    def build_balance_screen(self, frame):
         tk.Label(frame, text="Account Balance", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
-        tk.Label(frame, text=f"₹ {self.balance:,.2f}", fg="white", bg="black", font=self.title_font).pack(pady=20)
+        frame.balance_label = tk.Label(frame, text="", fg="white", bg="black", font=self.title_font)
+        frame.balance_label.pack(pady=20)
+        tk.Label(frame, text="Recent Transactions", fg="cyan", bg="black", font=self.msg_font).pack()
+        frame.statement_label = tk.Label(frame, text="", fg="white", bg="black", font=self.btn_font, justify="left")
+        frame.statement_label.pack(pady=10)
         btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
                              activebackground="#ff5555", width=15, command=self.show_main_menu)
         btn_back.pack(pady=20)
 
     def show_transactions_screen(self):
-        self.clear_container()
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True, fill="both")
+        frame = self.screens.show("transactions", self.build_transactions_screen, expand=True, fill="both")
+        self.current_screen = "transactions"
+        frame.table.scroll_to(0)
 
+    def build_transactions_screen(self, frame):
         tk.Label(frame, text="Transaction History", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
 
-        # Table with scroll
+        # Table with scroll; only the visible rows are rendered
         columns = ("Type", "Amount", "Recipient", "Balance")
-        tree = ttk.Treeview(frame, columns=columns, show="headings", height=15)
-        tree.pack(pady=10, expand=True, fill="both")
-
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, anchor="center")
-
-        for txn in self.transaction_history:
-            tree.insert("", "end", values=txn)
+        frame.table = HistoryView(frame, columns, *query_source(self.history, self.format_history_row),
+                                  font=self.btn_font, bg="black")
+        FilterBar(frame, frame.table, self.history, self.format_history_row, ("Deposit", "Withdraw", "Transfer"),
+                  font=self.msg_font, bg="black").pack(pady=5)
+        frame.table.pack(pady=10, expand=True, fill="both")
 
         btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
                              activebackground="#ff5555", width=15, command=self.show_main_menu)
@@ -245,42 +209,37 @@ class ATMApp(tk.Tk):
             self.input_display.config(text=self.input_value)
 
     def deposit_action(self):
-        if not self.validate_amount():
+        if self.worker.busy or not self.validate_amount():
             return
-        amount = float(self.input_value)
+        amount = parse_amount(self.input_value)
         passcode = self.passcode_entry.get()
         if self.validate_passcode(passcode):
-            self.balance += amount
-            self.transaction_history.append(("Deposit", f"₹{amount:.2f}", "-", f"₹{self.balance:.2f}"))
-            messagebox.showinfo("Success", f"₹{amount:.2f} deposited successfully!")
-            self.show_main_menu()
-        else:
-            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
-            self.clear_input()
-            self.passcode_entry.delete(0, tk.END)
+            self.worker.submit("deposit", self.card_number, amount,
+                               on_success=lambda balance: self.transaction_done(
+                                   "Deposit", amount, "", balance,
+                                   f"₹{format_amount(amount)} deposited successfully!"))
 
     def withdraw_action(self):
-        if not self.validate_amount():
+        if self.worker.busy or not self.validate_amount():
+            return
+        amount = parse_amount(self.input_value)
+        notes = self.cassettes.plan(amount)
+        if notes is None:
+            messagebox.showerror("Error", self.cassettes.refusal(amount))
+            self.clear_input()
             return
-        amount = float(self.input_value)
         passcode = self.passcode_entry.get()
         if self.validate_passcode(passcode):
-            if amount > self.balance:
-                messagebox.showerror("Error", "Insufficient balance.")
-                self.clear_input()
-                self.passcode_entry.delete(0, tk.END)
-                return
-            self.balance -= amount
-            self.transaction_history.append(("Withdraw", f"₹{amount:.2f}", "-", f"₹{self.balance:.2f}"))
-            messagebox.showinfo("Success", f"₹{amount:.2f} withdrawn successfully!")
-            self.show_main_menu()
-        else:
-            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
-            self.clear_input()
-            self.passcode_entry.delete(0, tk.END)
+            self.worker.submit("withdraw", self.card_number, amount,
+                               on_success=lambda balance: self.cash_withdrawn(notes, amount, balance),
+                               on_error=self.transaction_failed)
+
+    def cash_withdrawn(self, notes, amount, balance):
+        self.transaction_done("Withdraw", amount, "", balance,
+                              f"₹{format_amount(amount)} withdrawn successfully!\n{self.cassettes.pay_out(notes)}")
 
     def transfer_amount_entered(self):
-        if not self.validate_amount():
+        if self.worker.busy or not self.validate_amount():
             return
         recipient = self.recipient_entry.get().strip()
         if not recipient:
@@ -288,27 +247,43 @@ class ATMApp(tk.Tk):
             return
         passcode = self.passcode_entry.get()
         if self.validate_passcode(passcode):
-            amount = float(self.input_value)
-            if amount > self.balance:
-                messagebox.showerror("Error", "Insufficient balance.")
-                self.clear_input()
-                self.passcode_entry.delete(0, tk.END)
-                return
-            self.balance -= amount
-            self.transaction_history.append(("Transfer", f"₹{amount:.2f}", recipient, f"₹{self.balance:.2f}"))
-            messagebox.showinfo("Success", f"₹{amount:.2f} transferred to {recipient} successfully!")
-            self.show_main_menu()
+            amount = parse_amount(self.input_value)
+            self.worker.submit("transfer", self.card_number, amount, recipient,
+                               on_success=lambda balance: self.transaction_done(
+                                   "Transfer", amount, recipient, balance,
+                                   f"₹{format_amount(amount)} transferred to {recipient} successfully!"),
+                               on_error=self.transaction_failed)
+
+    def transaction_done(self, kind, amount, recipient, balance, message):
+        self.history.add(kind, amount, recipient, balance)
+        self.statements.put(self.card_number, balance)
+        messagebox.showinfo("Success", message)
+        self.show_main_menu()
+
+    def statement_rows(self, account, rows):
+        recent = self.history.query()[-rows:][::-1]
+        return ["   ".join(self.format_history_row(record)) for record in recent]
+
+    def format_history_row(self, record):
+        return (record.kind, f"₹{format_amount(record.amount)}", record.counterparty or "-",
+                f"₹{format_amount(record.balance)}")
+
+    def transaction_failed(self, exc):
+        if isinstance(exc, LimitExceeded):
+            messagebox.showerror("Limit reached", str(exc))
+        elif isinstance(exc, InsufficientBalance):
+            messagebox.showerror("Error", "Insufficient balance.")
         else:
-            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
-            self.clear_input()
-            self.passcode_entry.delete(0, tk.END)
+            raise exc
+        self.clear_input()
+        self.passcode_entry.delete(0, tk.END)
 
     def validate_amount(self):
         if not self.input_value:
             messagebox.showerror("Error", "Please enter an amount.")
             return False
         try:
-            amount = float(self.input_value)
+            amount = parse_amount(self.input_value)
             if amount <= 0:
                 messagebox.showerror("Error", "Amount must be greater than zero.")
                 return False
@@ -318,9 +293,18 @@ class ATMApp(tk.Tk):
             return False
 
     def validate_passcode(self, passcode):
-        # Dummy validation: passcode must be length 4 or 6 digits, and numeric
-        return passcode.isdigit() and (len(passcode) == 4 or len(passcode) == 6)
+        # Checked against the PIN verified at login, without hashing it again
+        if self.sessions.verify(self.session, passcode):
+            return True
+        if not self.sessions.active(self.session):
+            self.session_expired()
+        else:
+            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
+            self.clear_input()
+            self.passcode_entry.delete(0, tk.END)
+        return False
 
 if __name__ == "__main__":
     app = ATMApp()
     app.mainloop()
+    app.worker.close()
@@ -1,5 +1,14 @@
 import tkinter as tk
-from tkinter import font, messagebox, ttk
+from tkinter import font, messagebox
+
+from credentials import Sessions
+from ledger import InsufficientBalance, LimitExceeded
+from money import format_amount, parse_amount
+from archive import open_archive
+from history_view import FilterBar, HistoryView, query_source
+from screens import ScreenCache
+from terminal import open_terminal
+from keypad import Keypad
 
 class ATMApp(tk.Tk):
     def __init__(self):
@@ -14,9 +23,11 @@ class ATMApp(tk.Tk):
         self.msg_font = font.Font(family="Segoe UI", size=18)
 
         # ATM data
-        self.user_pin = "1234"
-        self.balance = 100000.0
-        self.transaction_history = []
+        self.card_number = "100001"
+        open_terminal(self, "atm2", self.statement_rows)
+        self.sessions = Sessions()  # passcode prompts reuse the PIN check done at login
+        self.session = None
+        self.history = open_archive(self.card_number)  # kept on disk, read through mmap
 
         # Internal input states
         self.input_value = ""
@@ -24,34 +35,32 @@ class ATMApp(tk.Tk):
         self.phonepay_data = None
         self.current_screen = None
 
-        # Container frame
+        # Container frame; each screen is built into it once and then reused
         self.container = tk.Frame(self, bg="black")
         self.container.pack(expand=True, fill="both")
+        self.screens = ScreenCache(self.container, bg="black")
+        # One keypad for the whole app, moved onto whichever screen needs it
+        self.keypad = Keypad(self.container, self.btn_font)
 
         # Start with login screen
         self.show_login_screen()
 
-    def clear_container(self):
-        for widget in self.container.winfo_children():
-            widget.destroy()
-
     # --------- LOGIN SCREEN ----------
     def show_login_screen(self):
-        self.clear_container()
+        frame = self.screens.show("login", self.build_login_screen)
         self.current_screen = "login"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
+        self.input_value = ""
+        self.pin_display = frame.pin_display
+        self.pin_display.config(text="")
+        self.keypad.attach(self.pin_display, self.on_pin_press, self.clear_input, self.login_attempt)
 
+    def build_login_screen(self, frame):
         tk.Label(frame, text="Welcome to ATM", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
         tk.Label(frame, text="Enter your 4-digit PIN", fg="white", bg="black", font=self.msg_font).pack(pady=10)
 
-        self.input_value = ""
-        self.pin_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                    width=10, height=2, relief="sunken", bd=4)
-        self.pin_display.pack(pady=10)
-
-        keypad = self.build_keypad(frame, self.on_pin_press, self.clear_input, self.login_attempt)
-        keypad.pack(pady=10)
+        frame.pin_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
+                                     width=10, height=2, relief="sunken", bd=4)
+        frame.pin_display.pack(pady=10)
 
         tk.Button(frame, text="Exit", font=self.btn_font, bg="#b22222", fg="white", width=10,
                   command=self.quit).pack(pady=10)
@@ -74,19 +83,32 @@ class ATMApp(tk.Tk):
         self.passcode_value = ""
 
     def login_attempt(self):
-        if self.input_value == self.user_pin:
+        if self.worker.busy:
+            return
+        pin = self.input_value
+        self.worker.login(self.card_number, pin, on_success=lambda ok, balance: self.login_done(ok, balance, pin),
+                          on_locked=self.clear_input)
+
+    def login_done(self, ok, balance, pin):
+        if ok:
+            self.session = self.sessions.open(self.card_number, pin)
+            self.statements.put(self.card_number, balance)
             self.show_main_menu()
         else:
             messagebox.showerror("Error", "Incorrect PIN. Try again.")
             self.clear_input()
 
+    def session_expired(self):
+        self.sessions.close(self.session)
+        messagebox.showerror("Session expired", "Please enter your PIN again.")
+        self.show_login_screen()
+
     # --------- MAIN MENU ----------
     def show_main_menu(self):
-        self.clear_container()
+        self.screens.show("menu", self.build_main_menu)
         self.current_screen = "menu"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
 
+    def build_main_menu(self, frame):
         tk.Label(frame, text="Select Operation", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
 
         buttons = [
@@ -104,192 +126,145 @@ class ATMApp(tk.Tk):
                             activebackground="cyan", width=20, height=2, command=cmd)
             btn.pack(pady=10)
 
-    # --------- KEYPAD BUILDER ----------
-    def build_keypad(self, parent, num_cmd, clear_cmd, enter_cmd):
-        keypad_frame = tk.Frame(parent, bg="black")
-        # Buttons 1-9
-        for i in range(1, 10):
-            btn = tk.Button(keypad_frame, text=str(i), font=self.btn_font, fg="white", bg="#222",
-                            activebackground="cyan", width=5, height=2,
-                            command=lambda x=i: num_cmd(x))
-            btn.grid(row=(i-1)//3, column=(i-1)%3, padx=8, pady=8)
-        # Clear, 0, Enter
-        btn_clear = tk.Button(keypad_frame, text="Clear", font=self.btn_font, fg="white", bg="#b22222",
-                              activebackground="#ff5555", width=5, height=2,
-                              command=clear_cmd)
-        btn_clear.grid(row=3, column=0, padx=8, pady=8)
-
-        btn_zero = tk.Button(keypad_frame, text="0", font=self.btn_font, fg="white", bg="#222",
-                             activebackground="cyan", width=5, height=2,
-                             command=lambda: num_cmd(0))
-        btn_zero.grid(row=3, column=1, padx=8, pady=8)
-
-        btn_enter = tk.Button(keypad_frame, text="Enter", font=self.btn_font, fg="white", bg="#228b22",
-                              activebackground="#55ff55", width=5, height=2,
-                              command=enter_cmd)
-        btn_enter.grid(row=3, column=2, padx=8, pady=8)
-        return keypad_frame
-
     # --------- DEPOSIT ----------
     def show_deposit_screen(self):
-        self.clear_container()
-        self.current_screen = "deposit"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
+        self.show_amount_screen("deposit", "Deposit Amount", self.deposit_action)
 
-        tk.Label(frame, text="Deposit Amount", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
+    def show_amount_screen(self, name, title, enter_cmd):
+        frame = self.screens.show(name, lambda f: self.build_amount_screen(f, title))
+        self.current_screen = name
+        self.reset_amount_inputs(frame)
+        self.keypad.attach(self.input_display, self.on_input_press, self.clear_input, enter_cmd)
 
+    def reset_amount_inputs(self, frame):
         self.input_value = ""
-        self.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                      width=20, height=2, relief="sunken", bd=4)
-        self.input_display.pack(pady=10)
+        self.input_display = frame.input_display
+        self.input_display.config(text="")
+        self.passcode_entry = frame.passcode_entry
+        self.passcode_entry.delete(0, tk.END)
 
-        keypad = self.build_keypad(frame, self.on_input_press, self.clear_input, self.deposit_action)
-        keypad.pack(pady=10)
+    def build_amount_screen(self, frame, title):
+        tk.Label(frame, text=title, fg="cyan", bg="black", font=self.title_font).pack(pady=20)
 
-        self.passcode_label = tk.Label(frame, text="Enter Passcode (4 or 6 digits)", fg="white", bg="black",
-                                       font=self.msg_font)
-        self.passcode_label.pack(pady=5)
+        frame.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
+                                       width=20, height=2, relief="sunken", bd=4)
+        frame.input_display.pack(pady=10)
 
-        self.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
-        self.passcode_entry.pack(pady=5)
+        self.build_passcode_entry(frame)
 
         btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
                              activebackground="#ff5555", width=10, command=self.show_main_menu)
         btn_back.pack(pady=10)
 
+    def build_passcode_entry(self, frame):
+        passcode_label = tk.Label(frame, text="Enter your PIN to confirm", fg="white", bg="black",
+                                  font=self.msg_font)
+        passcode_label.pack(pady=5)
+
+        frame.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
+        frame.passcode_entry.pack(pady=5)
+
     def on_input_press(self, num):
         if len(self.input_value) < 12:
             self.input_value += str(num)
             self.input_display.config(text=self.input_value)
 
     def deposit_action(self):
-        if not self.validate_amount():
+        if self.worker.busy or not self.validate_amount():
             return
-        amount = float(self.input_value)
+        amount = parse_amount(self.input_value)
         passcode = self.passcode_entry.get()
         if self.validate_passcode(passcode):
-            self.balance += amount
-            self.transaction_history.append(("Deposit", f"₹{amount:.2f}", "-", f"₹{self.balance:.2f}"))
-            messagebox.showinfo("Success", f"₹{amount:.2f} deposited successfully!")
-            self.show_main_menu()
-        else:
-            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
-            self.clear_input()
-            self.passcode_entry.delete(0, tk.END)
+            self.worker.submit("deposit", self.card_number, amount,
+                               on_success=lambda balance: self.transaction_done(
+                                   "Deposit", amount, "", balance,
+                                   f"₹{format_amount(amount)} deposited successfully!"))
 
     # --------- WITHDRAW ----------
     def show_withdraw_screen(self):
-        self.clear_container()
-        self.current_screen = "withdraw"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
-
-        tk.Label(frame, text="Withdraw Amount", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
-
-        self.input_value = ""
-        self.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                      width=20, height=2, relief="sunken", bd=4)
-        self.input_display.pack(pady=10)
-
-        keypad = self.build_keypad(frame, self.on_input_press, self.clear_input, self.withdraw_action)
-        keypad.pack(pady=10)
-
-        self.passcode_label = tk.Label(frame, text="Enter Passcode (4 or 6 digits)", fg="white", bg="black",
-                                       font=self.msg_font)
-        self.passcode_label.pack(pady=5)
-
-        self.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
-        self.passcode_entry.pack(pady=5)
-
-        btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
-                             activebackground="#ff5555", width=10, command=self.show_main_menu)
-        btn_back.pack(pady=10)
+        self.show_amount_screen("withdraw", "Withdraw Amount", self.withdraw_action)
 
     def withdraw_action(self):
-        if not self.validate_amount():
+        if self.worker.busy or not self.validate_amount():
             return
-        amount = float(self.input_value)
-        if amount > self.balance:
-            messagebox.showerror("Error", "Insufficient balance.")
+        amount = parse_amount(self.input_value)
+        notes = self.cassettes.plan(amount)
+        if notes is None:
+            messagebox.showerror("Error", self.cassettes.refusal(amount))
             self.clear_input()
             return
         passcode = self.passcode_entry.get()
         if self.validate_passcode(passcode):
-            self.balance -= amount
-            self.transaction_history.append(("Withdraw", f"₹{amount:.2f}", "-", f"₹{self.balance:.2f}"))
-            messagebox.showinfo("Success", f"₹{amount:.2f} withdrawn successfully!")
-            self.show_main_menu()
-        else:
-            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
-            self.clear_input()
-            self.passcode_entry.delete(0, tk.END)
+            self.worker.submit("withdraw", self.card_number, amount,
+                               on_success=lambda balance: self.cash_withdrawn(notes, amount, balance),
+                               on_error=self.transaction_failed)
+
+    def cash_withdrawn(self, notes, amount, balance):
+        self.transaction_done("Withdraw", amount, "", balance,
+                              f"₹{format_amount(amount)} withdrawn successfully!\n{self.cassettes.pay_out(notes)}")
 
     # --------- TRANSFER ----------
     def show_transfer_screen(self):
-        self.clear_container()
+        frame = self.screens.show("transfer", self.build_transfer_screen)
         self.current_screen = "transfer"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
+        self.recipient_entry = frame.recipient_entry
+        self.recipient_entry.delete(0, tk.END)
+        self.reset_amount_inputs(frame)
+        self.keypad.attach(self.input_display, self.on_input_press, self.clear_input, self.transfer_action)
 
+    def build_transfer_screen(self, frame):
         tk.Label(frame, text="Transfer Money", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
 
         tk.Label(frame, text="Recipient Account Number", fg="white", bg="black", font=self.msg_font).pack(pady=5)
-        self.recipient_entry = tk.Entry(frame, font=self.btn_font, width=25)
-        self.recipient_entry.pack(pady=5)
+        frame.recipient_entry = tk.Entry(frame, font=self.btn_font, width=25)
+        frame.recipient_entry.pack(pady=5)
 
         tk.Label(frame, text="Amount", fg="white", bg="black", font=self.msg_font).pack(pady=5)
-        self.input_value = ""
-        self.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                      width=20, height=2, relief="sunken", bd=4)
-        self.input_display.pack(pady=5)
-
-        keypad = self.build_keypad(frame, self.on_input_press, self.clear_input, self.transfer_action)
-        keypad.pack(pady=10)
-
-        self.passcode_label = tk.Label(frame, text="Enter Passcode (4 or 6 digits)", fg="white", bg="black",
-                                       font=self.msg_font)
-        self.passcode_label.pack(pady=5)
+        frame.input_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
+                                       width=20, height=2, relief="sunken", bd=4)
+        frame.input_display.pack(pady=5)
 
-        self.passcode_entry = tk.Entry(frame, show="*", font=self.btn_font, width=15)
-        self.passcode_entry.pack(pady=5)
+        self.build_passcode_entry(frame)
 
         btn_back = tk.Button(frame, text="Back", font=self.btn_font, fg="white", bg="#b22222",
                              activebackground="#ff5555", width=10, command=self.show_main_menu)
         btn_back.pack(pady=10)
 
     def transfer_action(self):
+        if self.worker.busy:
+            return
         recipient = self.recipient_entry.get().strip()
         if not recipient.isdigit() or len(recipient) < 6:
             messagebox.showerror("Error", "Enter valid recipient account number (min 6 digits).")
             return
         if not self.validate_amount():
             return
-        amount = float(self.input_value)
-        if amount > self.balance:
-            messagebox.showerror("Error", "Insufficient balance.")
-            self.clear_input()
-            return
+        amount = parse_amount(self.input_value)
         passcode = self.passcode_entry.get()
         if self.validate_passcode(passcode):
-            self.balance -= amount
-            self.transaction_history.append(("Transfer", f"₹{amount:.2f}", recipient, f"₹{self.balance:.2f}"))
-            messagebox.showinfo("Success", f"₹{amount:.2f} transferred to {recipient} successfully!")
-            self.show_main_menu()
-        else:
-            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
-            self.clear_input()
-            self.passcode_entry.delete(0, tk.END)
+            self.worker.submit("transfer", self.card_number, amount, recipient,
+                               on_success=lambda balance: self.transaction_done(
+                                   "Transfer", amount, recipient, balance,
+                                   f"₹{format_amount(amount)} transferred to {recipient} successfully!"),
+                               on_error=self.transaction_failed)
 
     # --------- BALANCE ----------
     def show_balance_screen(self):
-        self.clear_container()
+        frame = self.screens.show("balance", self.build_balance_screen)
         self.current_screen = "balance"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
+        self.statements.get(self.card_number, lambda statement: self.show_statement(frame, statement))
 
+    def show_statement(self, frame, statement):
+        frame.balance_label.config(text=f"₹{format_amount(statement.balance)}")
+        frame.statement_label.config(text="\n".join(statement.rows) or "No transactions yet.")
+
+    def build_balance_screen(self, frame):
         tk.Label(frame, text="Current Balance", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
-        tk.Label(frame, text=f"₹{self.balance:.2f}", fg="white", bg="black", font=self.title_font).pack(pady=20)
+        frame.balance_label = tk.Label(frame, text="", fg="white", bg="black", font=self.title_font)
+        frame.balance_label.pack(pady=20)
+        tk.Label(frame, text="Recent Transactions", fg="cyan", bg="black", font=self.msg_font).pack()
+        frame.statement_label = tk.Label(frame, text="", fg="white", bg="black", font=self.btn_font, justify="left")
+        frame.statement_label.pack(pady=10)
 
         btn_back = tk.Button(frame, text="Back to Menu", font=self.btn_font, fg="white", bg="#222",
                              activebackground="cyan", width=20, command=self.show_main_menu)
@@ -297,21 +272,19 @@ class ATMApp(tk.Tk):
 
     # --------- TRANSACTIONS HISTORY ----------
     def show_transactions_screen(self):
-        self.clear_container()
+        frame = self.screens.show("transactions", self.build_transactions_screen, expand=True, fill="both")
         self.current_screen = "transactions"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True, fill="both")
+        frame.table.scroll_to(0)
 
+    def build_transactions_screen(self, frame):
         tk.Label(frame, text="Transaction History", fg="cyan", bg="black", font=self.title_font).pack(pady=10)
 
         columns = ("Type", "Amount", "Recipient/Remarks", "Balance After")
-        tree = ttk.Treeview(frame, columns=columns, show="headings", height=15)
-        for col in columns:
-            tree.heading(col, text=col)
-            tree.column(col, width=180, anchor=tk.CENTER)
-        for trx in self.transaction_history:
-            tree.insert("", tk.END, values=trx)
-        tree.pack(expand=True, fill="both", padx=10, pady=10)
+        frame.table = HistoryView(frame, columns, *query_source(self.history, self.format_history_row),
+                                  font=self.btn_font, bg="black")
+        FilterBar(frame, frame.table, self.history, self.format_history_row,
+                  ("Deposit", "Withdraw", "Transfer", "Phone Pay"), font=self.msg_font, bg="black").pack(pady=5)
+        frame.table.pack(expand=True, fill="both", padx=10, pady=10)
 
         btn_back = tk.Button(frame, text="Back to Menu", font=self.btn_font, fg="white", bg="#222",
                              activebackground="cyan", width=20, command=self.show_main_menu)
@@ -319,29 +292,32 @@ class ATMApp(tk.Tk):
 
     # --------- PHONE PAY ----------
     def show_phonepay_screen(self):
-        self.clear_container()
+        frame = self.screens.show("phonepay", self.build_phonepay_screen)
         self.current_screen = "phonepay"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
+        self.input_value = ""
+        self.phone_entry = frame.phone_entry
+        self.phone_entry.delete(0, tk.END)
+        self.amount_display = frame.amount_display
+        self.amount_display.config(text="")
+        self.keypad.attach(self.amount_display, self.on_amount_press, self.clear_amount, self.phonepay_next_step)
+        self.remarks_entry = frame.remarks_entry
+        self.remarks_entry.delete(0, tk.END)
 
+    def build_phonepay_screen(self, frame):
         tk.Label(frame, text="Phone Pay - Send Money", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
 
         tk.Label(frame, text="Recipient Phone Number (10 digits)", fg="white", bg="black", font=self.msg_font).pack(pady=5)
-        self.phone_entry = tk.Entry(frame, font=self.btn_font, width=25)
-        self.phone_entry.pack(pady=5)
+        frame.phone_entry = tk.Entry(frame, font=self.btn_font, width=25)
+        frame.phone_entry.pack(pady=5)
 
         tk.Label(frame, text="Amount (₹)", fg="white", bg="black", font=self.msg_font).pack(pady=5)
-        self.input_value = ""
-        self.amount_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                       width=20, height=2, relief="sunken", bd=4)
-        self.amount_display.pack(pady=5)
-
-        keypad = self.build_keypad(frame, self.on_amount_press, self.clear_amount, self.phonepay_next_step)
-        keypad.pack(pady=10)
+        frame.amount_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
+                                        width=20, height=2, relief="sunken", bd=4)
+        frame.amount_display.pack(pady=5)
 
         tk.Label(frame, text="Remarks (Optional)", fg="white", bg="black", font=self.msg_font).pack(pady=5)
-        self.remarks_entry = tk.Entry(frame, font=self.btn_font, width=25)
-        self.remarks_entry.pack(pady=5)
+        frame.remarks_entry = tk.Entry(frame, font=self.btn_font, width=25)
+        frame.remarks_entry.pack(pady=5)
 
         btn_cancel = tk.Button(frame, text="Cancel", font=self.btn_font, fg="white", bg="#b22222",
                                activebackground="#ff5555", width=15, command=self.show_main_menu)
@@ -365,7 +341,7 @@ class ATMApp(tk.Tk):
             messagebox.showerror("Error", "Enter amount to send.")
             return
         try:
-            amount = float(self.input_value)
+            amount = parse_amount(self.input_value)
             if amount <= 0:
                 raise ValueError
         except ValueError:
@@ -380,20 +356,19 @@ class ATMApp(tk.Tk):
         self.show_phonepay_passcode_screen()
 
     def show_phonepay_passcode_screen(self):
-        self.clear_container()
+        frame = self.screens.show("phonepay_passcode", self.build_phonepay_passcode_screen)
         self.current_screen = "phonepay_passcode"
-        frame = tk.Frame(self.container, bg="black")
-        frame.pack(expand=True)
-
-        tk.Label(frame, text="Enter Passcode to Confirm", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
-
         self.passcode_value = ""
-        self.passcode_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
-                                         width=20, height=2, relief="sunken", bd=4)
-        self.passcode_display.pack(pady=10)
+        self.passcode_display = frame.passcode_display
+        self.passcode_display.config(text="")
+        self.keypad.attach(self.passcode_display, self.on_passcode_press, self.clear_passcode, self.phonepay_confirm)
 
-        keypad = self.build_keypad(frame, self.on_passcode_press, self.clear_passcode, self.phonepay_confirm)
-        keypad.pack(pady=10)
+    def build_phonepay_passcode_screen(self, frame):
+        tk.Label(frame, text="Enter PIN to Confirm", fg="cyan", bg="black", font=self.title_font).pack(pady=20)
+
+        frame.passcode_display = tk.Label(frame, text="", fg="white", bg="#111", font=self.title_font,
+                                          width=20, height=2, relief="sunken", bd=4)
+        frame.passcode_display.pack(pady=10)
 
         btn_cancel = tk.Button(frame, text="Cancel", font=self.btn_font, fg="white", bg="#b22222",
                                activebackground="#ff5555", width=15, command=self.show_phonepay_screen)
@@ -409,35 +384,61 @@ class ATMApp(tk.Tk):
         self.passcode_display.config(text="")
 
     def phonepay_confirm(self):
-        if len(self.passcode_value) not in (4, 6):
-            messagebox.showerror("Error", "Passcode must be 4 or 6 digits.")
-            self.clear_passcode()
+        if self.worker.busy:
             return
-
-        amount = self.phonepay_data["amount"]
-        if amount > self.balance:
-            messagebox.showerror("Error", "Insufficient balance.")
-            self.show_main_menu()
+        if not self.sessions.verify(self.session, self.passcode_value):
+            if not self.sessions.active(self.session):
+                self.session_expired()
+            else:
+                messagebox.showerror("Error", "Incorrect passcode.")
+                self.clear_passcode()
             return
 
-        # Deduct balance and log transaction
-        self.balance -= amount
-        recipient = f"Phone: {self.phonepay_data['phone']}"
+        amount = self.phonepay_data["amount"]
+        phone = self.phonepay_data["phone"]
         remarks = self.phonepay_data.get("remarks", "")
-        if remarks:
-            recipient += f" ({remarks})"
 
-        self.transaction_history.append(("Phone Pay", f"₹{amount:.2f}", recipient, f"₹{self.balance:.2f}"))
-        messagebox.showinfo("Success", f"₹{amount:.2f} sent to {self.phonepay_data['phone']} successfully!")
+        # Deduct balance and log transaction
+        self.worker.submit("phonepe", self.card_number, amount, phone,
+                           on_success=lambda balance: self.transaction_done(
+                               "Phone Pay", amount, phone, balance,
+                               f"₹{format_amount(amount)} sent to {phone} successfully!", remarks),
+                           on_error=lambda exc: self.transaction_failed(exc, self.show_main_menu))
+
+    def transaction_done(self, kind, amount, recipient, balance, message, remarks=""):
+        self.history.add(kind, amount, recipient, balance, remarks)
+        self.statements.put(self.card_number, balance)
+        messagebox.showinfo("Success", message)
         self.show_main_menu()
 
+    def statement_rows(self, account, rows):
+        recent = self.history.query()[-rows:][::-1]
+        return ["   ".join(self.format_history_row(record)) for record in recent]
+
+    def format_history_row(self, record):
+        recipient = record.counterparty
+        if record.kind == "Phone Pay":
+            recipient = f"Phone: {recipient}"
+        if record.note:
+            recipient += f" ({record.note})"
+        return record.kind, f"₹{format_amount(record.amount)}", recipient or "-", f"₹{format_amount(record.balance)}"
+
+    def transaction_failed(self, exc, then=None):
+        if isinstance(exc, LimitExceeded):
+            messagebox.showerror("Limit reached", str(exc))
+        elif isinstance(exc, InsufficientBalance):
+            messagebox.showerror("Error", "Insufficient balance.")
+        else:
+            raise exc
+        (then or self.clear_input)()
+
     # --------- VALIDATORS ----------
     def validate_amount(self):
         if not self.input_value:
             messagebox.showerror("Error", "Enter amount.")
             return False
         try:
-            amount = float(self.input_value)
+            amount = parse_amount(self.input_value)
             if amount <= 0:
                 raise ValueError
         except ValueError:
@@ -446,8 +447,18 @@ class ATMApp(tk.Tk):
         return True
 
     def validate_passcode(self, passcode):
-        return passcode.isdigit() and len(passcode) in (4, 6)
+        # Checked against the PIN verified at login, without hashing it again
+        if self.sessions.verify(self.session, passcode):
+            return True
+        if not self.sessions.active(self.session):
+            self.session_expired()
+        else:
+            messagebox.showerror("Error", "Invalid passcode. Transaction canceled.")
+            self.clear_input()
+            self.passcode_entry.delete(0, tk.END)
+        return False
 
 if __name__ == "__main__":
     app = ATMApp()
     app.mainloop()
+    app.worker.close()
@@ -0,0 +1,147 @@
+"""Throughput benchmark for the ATM transaction logic.
+
+Replays synthetic terminal sessions (login, a mix of operations, a history
+view, logout) through the same Ledger the front-ends use, and reports p50/p99
+latency per operation, overall ops/sec and peak RSS.
+
+    python benchmark.py --frontend atm2 --accounts 100000 --sessions 20000
+    python benchmark.py --mix deposit=50,withdraw=50 --journal
+"""
+import argparse
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from credentials import hash_pin
+from history_view import list_source
+from ledger import InsufficientBalance, Ledger, LimitExceeded, open_ledger
+
+# Operations each front-end offers from its main menu
+FRONTENDS = {
+    "atm": ("deposit", "withdraw"),
+    "atm1": ("deposit", "withdraw", "transfer"),
+    "atm2": ("deposit", "withdraw", "transfer", "phonepe"),
+    "ATM-INTERFACE": ("deposit", "withdraw", "phonepe"),
+    "ATM_Simulator": ("deposit", "withdraw", "phonepe"),
+}
+PIN = "1234"
+FIRST_CARD = 500000000
+
+
+def parse_mix(text, frontend):
+    if not text:
+        return {op: 1 for op in FRONTENDS[frontend]}
+    mix = {}
+    for part in text.split(","):
+        op, _, weight = part.partition("=")
+        if op not in FRONTENDS[frontend]:
+            raise SystemExit(f"{frontend} has no {op!r} operation")
+        mix[op] = float(weight or 1)
+    return mix
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    samples.sort()
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def run(ledger, mix, n_accounts, sessions, ops_per_session, seed):
+    rng = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    latencies = {name: [] for name in ("login", *ops, "history", "logout")}
+    rejected = 0
+    clock = time.perf_counter
+
+    started = clock()
+    for _ in range(sessions):
+        card = str(FIRST_CARD + rng.randrange(n_accounts))
+        history = []
+
+        t = clock()
+        ledger.check_pin(card, PIN)
+        latencies["login"].append(clock() - t)
+
+        for op in rng.choices(ops, weights, k=ops_per_session):
+            amount = rng.randrange(100, 500000)
+            t = clock()
+            try:
+                if op == "deposit":
+                    balance = ledger.deposit(card, amount)
+                elif op == "withdraw":
+                    balance = ledger.withdraw(card, amount)
+                elif op == "transfer":
+                    balance = ledger.transfer(card, amount, str(FIRST_CARD + rng.randrange(n_accounts)))
+                else:
+                    balance = ledger.phonepe(card, amount, "98%08d" % rng.randrange(10 ** 8))
+                history.append((op, amount, balance))
+            except (InsufficientBalance, LimitExceeded):
+                rejected += 1
+            latencies[op].append(clock() - t)
+
+        t = clock()
+        row_count, fetch_rows = list_source(history, newest_first=True)
+        fetch_rows(0, 15)
+        latencies["history"].append(clock() - t)
+
+        t = clock()
+        history = None
+        latencies["logout"].append(clock() - t)
+    elapsed = clock() - started
+
+    return latencies, elapsed, rejected
+
+
+def report(frontend, latencies, elapsed, rejected, out=sys.stdout):
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"frontend: {frontend}", file=out)
+    print(f"{'operation':<10} {'count':>9} {'p50 us':>9} {'p99 us':>9}", file=out)
+    for name, samples in latencies.items():
+        print(f"{name:<10} {len(samples):>9} {percentile(samples, 0.50) * 1e6:>9.1f} "
+              f"{percentile(samples, 0.99) * 1e6:>9.1f}", file=out)
+    print(f"ops/sec: {total / elapsed:,.0f} ({total} ops in {elapsed:.2f}s, {rejected} rejected)", file=out)
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    print(f"peak RSS: {peak / scale:.1f} MiB", file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frontend", choices=sorted(FRONTENDS), default="atm2")
+    parser.add_argument("--mix", help="weights such as deposit=40,withdraw=40,transfer=10,phonepe=10")
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--ops-per-session", type=int, default=4)
+    parser.add_argument("--journal", action="store_true", help="write a real journal in a temp directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pin-cost", type=int, default=4,
+                        help="log2 PIN hash work factor; production uses ATM_PIN_COST (default 14)")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix, args.frontend)
+    tmpdir = None
+    if args.journal:
+        tmpdir = tempfile.mkdtemp(prefix="atm-bench-")
+        ledger = open_ledger(f"{tmpdir}/transactions.log", f"{tmpdir}/balance.txt", demo_accounts=())
+    else:
+        ledger = Ledger()
+    try:
+        pin_hash = hash_pin(PIN, args.pin_cost)  # one salt for every card keeps setup fast
+        for i in range(args.accounts):
+            ledger.accounts.add(str(FIRST_CARD + i), pin_hash, 10000000)
+        latencies, elapsed, rejected = run(ledger, mix, args.accounts,
+                                           args.sessions, args.ops_per_session, args.seed)
+        report(args.frontend, latencies, elapsed, rejected)
+    finally:
+        ledger.close()
+        if tmpdir:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
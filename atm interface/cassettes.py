@@ -0,0 +1,149 @@
+"""Cash cassettes: the notes a terminal holds and which ones a withdrawal gets.
+
+A terminal has a few cassettes, each holding notes of one denomination.
+``plan(amount)`` returns the mix with the fewest notes that the cassettes
+can actually pay out, or None, so a withdrawal can be refused before the
+account is debited; ``dispense`` takes the notes out once the debit has
+gone through. Mixes come from a table built by dynamic programming over
+every amount up to ``max_notes`` of the largest note, so a lookup is one
+index. While every cassette holds at least ``max_notes`` notes the counts
+cannot change the answer and the table is built once; after that it is
+rebuilt with the real counts after each dispense.
+
+Loads and dispenses are appended to a log per terminal, which is replayed
+on open to get the counts and read by ``forecast``:
+
+    <time> TAB load TAB 50000:2000,20000:2000,10000:2000    denomination:notes per cassette
+    <time> TAB dispense TAB 3,1,0                            notes per cassette
+"""
+import math
+import os
+import time
+
+from config import DATA_DIR
+from money import format_amount
+
+CASSETTE_DIR = os.path.join(DATA_DIR, "cassettes")
+DENOMINATIONS = (50000, 20000, 10000)  # paise: ₹500, ₹200 and ₹100 notes
+CAPACITY = 2000  # notes in a full cassette
+MAX_NOTES = 40   # notes the dispenser can present at once
+
+
+class Cassettes:
+    def __init__(self, path, max_notes=MAX_NOTES):
+        self.path = path
+        self.max_notes = max_notes
+        self.denominations = ()  # paise, largest first
+        self.counts = []
+        self._table = self._caps = None
+        for _, kind, fields in read_log(path):
+            if kind == "load":
+                self._set(dict(map(int, field.split(":")) for field in fields))
+            else:
+                self.counts = [count - int(n) for count, n in zip(self.counts, fields)]
+        self._file = open(path, "a+b", buffering=0)
+        self._file.seek(0)
+        self._file.truncate(self._file.read().rfind(b"\n") + 1)  # drop a torn last line
+        if not self.denominations:
+            self.load({denomination: CAPACITY for denomination in DENOMINATIONS})
+        self._build()
+
+    def load(self, notes):
+        """Swap in full cassettes: ``notes`` maps denomination in paise to a count."""
+        self._set(notes)
+        self._caps = None
+        self._write("load", ",".join(f"{d}:{c}" for d, c in zip(self.denominations, self.counts)))
+        self._build()
+
+    def available(self):
+        return sum(d * c for d, c in zip(self.denominations, self.counts))
+
+    def plan(self, amount):
+        """Notes to take from each cassette for ``amount`` paise, or None if it cannot be paid."""
+        units, rest = divmod(amount, self._unit)
+        if rest or not 0 < units < len(self._table):
+            return None
+        return self._table[units]
+
+    def refusal(self, amount):
+        # Why plan(amount) gave None, for the customer
+        if amount % self._unit:
+            return f"This ATM pays out multiples of ₹{self._unit // 100}"
+        if amount > self.available():
+            return f"This ATM has only ₹{format_amount(self.available(), True)} left"
+        largest = max((units for units, mix in enumerate(self._table) if mix), default=0) * self._unit
+        if amount > largest:
+            return f"At most ₹{format_amount(largest, True)} per withdrawal"
+        return f"₹{format_amount(amount, True)} cannot be made up from the notes left"
+
+    def dispense(self, notes):
+        if any(n > count for n, count in zip(notes, self.counts)):
+            raise ValueError(f"not enough notes for {notes}")
+        self.counts = [count - n for count, n in zip(self.counts, notes)]
+        self._write("dispense", ",".join(map(str, notes)))
+        self._build()
+
+    def pay_out(self, notes):
+        # Only once the account has been debited may the notes leave the
+        # cassettes; returns the line for the customer
+        self.dispense(notes)
+        return self.describe(notes)
+
+    def describe(self, notes):
+        # "2 x ₹500, 1 x ₹200"
+        return ", ".join(f"{n} x ₹{d // 100}" for d, n in zip(self.denominations, notes) if n)
+
+    def close(self):
+        self._file.close()
+
+    def _set(self, notes):
+        self.denominations = tuple(sorted(notes, reverse=True))
+        self.counts = [notes[d] for d in self.denominations]
+
+    def _write(self, kind, fields):
+        self._file.write(f"{time.time():.6f}\t{kind}\t{fields}\n".encode("utf-8"))
+        os.fsync(self._file.fileno())
+
+    def _build(self):
+        caps = [min(count, self.max_notes) for count in self.counts]
+        if caps == self._caps:
+            return
+        self._unit = math.gcd(*self.denominations)
+        size = self.max_notes * self.denominations[0] // self._unit + 1
+        # fewest[a]: fewest notes making up a units from the cassettes so far,
+        # mixes[a]: how many of each; largest notes are tried first, so ties
+        # keep the smaller notes for later withdrawals
+        fewest = [0] + [self.max_notes + 1] * (size - 1)
+        mixes = [()] + [None] * (size - 1)
+        for denomination, cap in zip(self.denominations, caps):
+            value = denomination // self._unit
+            next_fewest = fewest[:]
+            next_mixes = [None if mix is None else mix + (0,) for mix in mixes]
+            for units in range(value, size):
+                for n in range(1, min(cap, units // value) + 1):
+                    rest = units - n * value
+                    if fewest[rest] + n < next_fewest[units]:
+                        next_fewest[units] = fewest[rest] + n
+                        next_mixes[units] = mixes[rest] + (n,)
+            fewest, mixes = next_fewest, next_mixes
+        mixes[0] = None
+        self._table = [mix if notes <= self.max_notes else None for notes, mix in zip(fewest, mixes)]
+        self._caps = caps
+
+
+def read_log(path):
+    """Yield ``(timestamp, kind, fields)`` for each complete line of a cassette log."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                return  # torn by a crash
+            timestamp, kind, fields = line[:-1].split("\t")
+            yield float(timestamp), kind, fields.split(",")
+
+
+def open_cassettes(terminal, root=None):
+    root = root or CASSETTE_DIR
+    os.makedirs(root, exist_ok=True)
+    return Cassettes(os.path.join(root, f"{terminal}.log"))
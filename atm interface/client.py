@@ -0,0 +1,180 @@
+import itertools
+import os
+import socket
+import threading
+from concurrent.futures import Future
+
+from ledger import open_ledger
+from protocol import decode_reply, encode_request
+
+
+class Connection:
+    """One persistent socket to the switch with many requests in flight.
+
+    ``submit`` tags each request with an id, writes it and returns a
+    ``concurrent.futures.Future`` at once; a reader thread matches replies
+    to futures by id, so any number of threads can share the socket and
+    never wait on each other's round trips. With a ``terminal`` id the
+    connection opens with the ``hello`` handshake.
+    """
+
+    def __init__(self, address, timeout=10.0, terminal=None):
+        self._sock = connect(address, timeout)
+        self._sock.settimeout(None)  # the reader blocks until the server speaks
+        self._reader = self._sock.makefile("rb")
+        self._send_lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self.closed = False
+        self._thread = threading.Thread(target=self._read_replies, name="ledger-client", daemon=True)
+        self._thread.start()
+        if terminal:
+            self.submit("hello", terminal)  # first on the wire; the reply needs no wait
+
+    def submit(self, op, *args):
+        return self.submit_many([(op, *args)])[0]
+
+    def submit_many(self, calls):
+        # Pipelined: every request goes out in a single write
+        futures = [Future() for _ in calls]
+        with self._send_lock:
+            if self.closed:
+                raise ConnectionError("ledger connection is closed")
+            data = []
+            for future, (op, *args) in zip(futures, calls):
+                request_id = next(self._ids)
+                self._pending[request_id] = future
+                data.append(encode_request(request_id, op, args))
+            self._sock.sendall(b"".join(data))
+        return futures
+
+    def close(self):
+        with self._send_lock:
+            self.closed = True
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._thread.join()
+        self._reader.close()
+        self._sock.close()
+
+    def _read_replies(self):
+        try:
+            while True:
+                request_id, value = decode_reply(self._reader.readline())
+                future = self._pending.pop(request_id)
+                if isinstance(value, Exception):
+                    future.set_exception(value)
+                else:
+                    future.set_result(value)
+        except (OSError, ValueError):
+            pass
+        with self._send_lock:
+            self.closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("ledger server closed the connection"))
+
+
+class LedgerClient:
+    """Terminal-side stand-in for ``Ledger`` that talks to the switch server.
+
+    Exposes the calls the front-ends make (``check_pin``, ``balance``,
+    ``deposit``, ``withdraw``, ``transfer``, ``phonepe``, ``post``, ``close``)
+    with the same return values and exceptions as a local ledger, so a GUI
+    does not care which one it was given. Calls are spread over a small pool
+    of persistent ``Connection``s that are opened lazily and replaced if the
+    server drops them; ``pipeline`` sends several calls in one write and
+    ``call_async`` returns a future for callers that do their own waiting.
+    ``terminal`` names this terminal to the switch, which limits wrong PINs
+    per terminal.
+    """
+
+    def __init__(self, address, pool_size=2, timeout=10.0, terminal=None):
+        self.address = address
+        self.timeout = timeout
+        self.terminal = terminal
+        self._pool = [None] * pool_size
+        self._turn = itertools.count()
+        self._lock = threading.Lock()
+
+    def call_async(self, op, *args):
+        return self._connection().submit(op, *args)
+
+    def call(self, op, *args):
+        return self.call_async(op, *args).result(self.timeout)
+
+    def pipeline_async(self, calls):
+        return self._connection().submit_many(calls)
+
+    def pipeline(self, calls):
+        """Run ``[(op, *args), ...]`` in one round trip; returns what each call would."""
+        futures = self.pipeline_async(calls)
+        return [reply_value(op, future.result(self.timeout)) for (op, *_), future in zip(calls, futures)]
+
+    def check_pin(self, account, pin, terminal=None):
+        # The switch meters wrong PINs by the terminal named in the handshake
+        return reply_value("check_pin", self.call("check_pin", account, pin))
+
+    def balance(self, account):
+        return reply_value("balance", self.call("balance", account))
+
+    def deposit(self, account, amount):
+        return self.post("deposit", account, amount)
+
+    def withdraw(self, account, amount):
+        return self.post("withdraw", account, amount)
+
+    def transfer(self, account, amount, recipient):
+        return self.post("transfer", account, amount, recipient)
+
+    def phonepe(self, account, amount, phone):
+        return self.post("phonepe", account, amount, phone)
+
+    def post(self, kind, account, amount, counterparty=""):
+        return reply_value(kind, self.call(kind, account, amount, counterparty))
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, [None] * len(self._pool)
+        for connection in pool:
+            if connection is not None:
+                connection.close()
+
+    def _connection(self):
+        with self._lock:
+            index = next(self._turn) % len(self._pool)
+            connection = self._pool[index]
+            if connection is None or connection.closed:
+                connection = self._pool[index] = Connection(self.address, self.timeout, self.terminal)
+            return connection
+
+
+def reply_value(op, value):
+    # What a local Ledger returns for op, from the reply's text
+    if op == "check_pin":
+        return value == "1"
+    return value if op == "ping" else int(value)
+
+
+def connect(address, timeout=10.0):
+    # "host:port" is TCP, anything else a Unix socket path
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        sock = socket.create_connection((host, int(port)), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    sock.connect(address)
+    return sock
+
+
+def connect_ledger(address=None, terminal=None):
+    # Shared ledger on the switch when ATM_SERVER is set, otherwise the local
+    # journal next to the app
+    address = address or os.environ.get("ATM_SERVER")
+    if not address:
+        return open_ledger()
+    return LedgerClient(address, terminal=terminal)
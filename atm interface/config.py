@@ -0,0 +1,5 @@
+import os
+
+# Where the journal, snapshot, history archives and cassette logs live.
+# ATM_DATA_DIR lets benchmarks and test rigs keep their state out of the repo
+DATA_DIR = os.environ.get("ATM_DATA_DIR", os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,113 @@
+"""PIN hashing and verified sessions.
+
+PINs are stored as salted scrypt hashes, or PBKDF2-HMAC-SHA256 where the
+OpenSSL build has no scrypt. Both are slow on purpose: at the default cost
+one check takes tens of milliseconds, which is nothing for a customer at
+a terminal and ruinous for anyone guessing PINs from a stolen table. Each
+record carries its own algorithm and cost, so ``ATM_PIN_COST`` can be
+raised later without invalidating the hashes already stored. A record is
+34 bytes, kept in one flat column of the account table: 16 bytes of salt
+and the first 16 bytes of the digest, which is far more than a PIN's own
+entropy.
+
+Having paid for one slow check at login, a terminal opens a ``Sessions``
+entry so the passcode prompts later in the same session are answered from
+memory.
+"""
+import hashlib
+import hmac
+import os
+import secrets
+import struct
+import time
+
+SCRYPT, PBKDF2 = 1, 2
+# algorithm, log2 of the work factor, salt, digest
+RECORD = struct.Struct("<BB16s16s")
+RECORD_SIZE = RECORD.size
+# Records written before they were compacted: padding and a 32-byte digest
+LEGACY_RECORD = struct.Struct("<BB2x16s32s")
+DEFAULT_COST = int(os.environ.get("ATM_PIN_COST", 14))  # scrypt N = 2**cost
+ALGORITHM = SCRYPT if hasattr(hashlib, "scrypt") else PBKDF2
+
+
+def hash_pin(pin, cost=DEFAULT_COST, salt=None):
+    """Return the ``RECORD_SIZE``-byte hash record for ``pin``."""
+    salt = salt or os.urandom(16)
+    return RECORD.pack(ALGORITHM, cost, salt, _digest(ALGORITHM, cost, pin, salt))
+
+
+def verify_pin(pin, record):
+    algorithm, cost, salt, digest = RECORD.unpack(record)
+    return hmac.compare_digest(_digest(algorithm, cost, pin, salt), digest)
+
+
+def pin_record(text):
+    # The PIN field of an "open" journal record: a hex hash record, or a
+    # plaintext PIN in journals written before PINs were hashed
+    if len(text) == 2 * RECORD_SIZE:
+        return bytes.fromhex(text)
+    if len(text) == 2 * LEGACY_RECORD.size:
+        return compact(bytes.fromhex(text))
+    return hash_pin(text)
+
+
+def compact(legacy):
+    # Both KDFs give the first bytes of a longer key unchanged, so a legacy
+    # record keeps verifying with its digest cut to 16 bytes
+    algorithm, cost, salt, digest = LEGACY_RECORD.unpack(legacy)
+    return RECORD.pack(algorithm, cost, salt, digest[:16])
+
+
+def _digest(algorithm, cost, pin, salt):
+    secret = pin.encode("utf-8")
+    if algorithm == SCRYPT:
+        n = 1 << cost
+        return hashlib.scrypt(secret, salt=salt, n=n, r=8, p=1, maxmem=256 * n * 8 + (1 << 20), dklen=16)
+    if algorithm == PBKDF2:
+        return hashlib.pbkdf2_hmac("sha256", secret, salt, 1 << (cost + 4), dklen=16)
+    raise ValueError(f"unknown PIN hash algorithm {algorithm}")
+
+
+class Sessions:
+    """Short-lived proof that a card's PIN was verified on this terminal.
+
+    ``open`` is called after a successful login and keeps a keyed HMAC of
+    the PIN under a random token; ``verify`` then checks a passcode typed
+    later in the session against it in microseconds instead of paying for
+    the slow hash again. The key is random per process and never stored,
+    and a session lapses after ``ttl`` seconds without a successful check.
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._key = os.urandom(32)
+        self._sessions = {}  # token -> (account, verifier, expires)
+
+    def open(self, account, pin):
+        now = time.monotonic()
+        for token in [t for t, (_, _, expires) in self._sessions.items() if expires <= now]:
+            del self._sessions[token]
+        token = secrets.token_urlsafe(16)
+        self._sessions[token] = (account, self._verifier(account, pin), now + self.ttl)
+        return token
+
+    def active(self, token):
+        session = self._sessions.get(token)
+        return session is not None and session[2] > time.monotonic()
+
+    def verify(self, token, pin):
+        session = self._sessions.get(token)
+        if session is None or session[2] <= time.monotonic():
+            return False
+        account, verifier, _ = session
+        if not hmac.compare_digest(self._verifier(account, pin), verifier):
+            return False
+        self._sessions[token] = (account, verifier, time.monotonic() + self.ttl)
+        return True
+
+    def close(self, token):
+        self._sessions.pop(token, None)
+
+    def _verifier(self, account, pin):
+        return hmac.new(self._key, f"{account}\0{pin}".encode("utf-8"), hashlib.sha256).digest()
@@ -0,0 +1,155 @@
+"""Postings as immutable events, and the projections built from them.
+
+Every posting the ledger accepts is emitted as one event, after its checks
+have passed: ``Deposited``, ``Withdrawn``, ``Transferred``, ``PhonePeSent``
+(and ``AccountOpened``). The journal holds the same records with the same
+timestamps, so it is the event log. The account table is the projection
+the ledger checks balances against, and ``limits.LimitEngine`` the one that
+keeps its daily counters; any other view is a ``Projection`` that is either
+subscribed to a live ledger (``Ledger.subscribe``) or built after the fact
+by replaying the journal in bulk:
+
+    view = rebuild(MyView(), "transactions.log")
+
+Subscribed projections are applied with the account's stripe held (both
+stripes for a transfer), in journal order per account, so a projection
+keyed by account needs no lock of its own. They run on the posting path,
+so ``apply`` should be a few dictionary updates at most.
+
+Statement history (``history``, ``archive``) is not one of them. Each
+terminal records its own customer's transactions with what only it knows,
+the names on its buttons and the customer's remarks, and a terminal
+connected to the switch sees replies rather than the event stream.
+"""
+import datetime
+import os
+import time
+from typing import NamedTuple
+
+CHUNK = 1 << 20  # bytes read at a time by read_events
+
+
+class Event(NamedTuple):
+    timestamp: float    # seconds since the epoch
+    account: str
+    amount: int         # paise
+    counterparty: str = ""
+
+
+class AccountOpened(Event):
+    __slots__ = ()
+    kind = "open"       # amount is the opening balance
+
+
+class Deposited(Event):
+    __slots__ = ()
+    kind = "deposit"
+
+
+class Withdrawn(Event):
+    __slots__ = ()
+    kind = "withdraw"
+
+
+class Transferred(Event):
+    __slots__ = ()
+    kind = "transfer"   # counterparty is the recipient's account
+
+
+class PhonePeSent(Event):
+    __slots__ = ()
+    kind = "phonepe"    # counterparty is the phone number
+
+
+EVENTS = {cls.kind: cls for cls in (AccountOpened, Deposited, Withdrawn, Transferred, PhonePeSent)}
+_new = tuple.__new__  # builds an event without the keyword handling of Event(...)
+
+
+def make_event(timestamp, kind, account, amount, counterparty=""):
+    # None for postings that are not customer events (the shards' two-phase
+    # transfer legs)
+    cls = EVENTS.get(kind)
+    if cls is None:
+        return None
+    if cls is AccountOpened:
+        counterparty = ""  # the PIN hash stays out of events
+    return _new(cls, (timestamp, account, amount, counterparty))
+
+
+def read_events(path, offset=0, end=None):
+    """Yield the events journalled in ``path`` between byte ``offset`` and ``end``.
+
+    Reads the file in large chunks of whole lines and decodes each chunk at
+    once, which is faster than ``journal.replay`` for building a view over a
+    long journal. A torn last line is skipped.
+    """
+    if not os.path.exists(path):
+        return
+    events = EVENTS
+    new = _new
+    with open(path, "rb") as f:
+        f.seek(offset)
+        remaining = -1 if end is None else end - offset
+        tail = b""
+        while remaining:
+            chunk = f.read(CHUNK if remaining < 0 else min(CHUNK, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk) if remaining > 0 else 0
+            chunk = tail + chunk
+            cut = chunk.rfind(b"\n") + 1
+            tail = chunk[cut:]
+            for line in chunk[:cut].decode("utf-8").split("\n")[:-1]:
+                ts, kind, account, amount, counterparty = line.split("\t")
+                cls = events.get(kind)
+                if cls is not None:
+                    if cls is AccountOpened:
+                        counterparty = ""
+                    yield new(cls, (float(ts), account, int(amount), counterparty))
+
+
+def rebuild(projection, path, offset=0, end=None):
+    """Feed every event in the journal at ``path`` to ``projection``; returns it."""
+    projection.apply_many(read_events(path, offset, end))
+    return projection
+
+
+class Projection:
+    """A view kept up to date from events.
+
+    Subclasses implement ``apply``; ``apply_many`` is the bulk path used by
+    ``rebuild`` and batch settlement, and may be overridden with a faster
+    loop.
+    """
+
+    def apply(self, event):
+        raise NotImplementedError
+
+    def apply_many(self, events):
+        for event in events:
+            self.apply(event)
+
+
+class Days:
+    """Local calendar day (``date.toordinal()``) of a timestamp.
+
+    The bounds of the last day seen are cached, so local midnights are
+    worked out once per day rather than once per call.
+    """
+
+    def __init__(self):
+        self.bounds = (0, 0.0, 0.0)  # day, its first second, the next day's first second
+
+    def __call__(self, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        day, start, end = self.bounds
+        if not start <= timestamp < end:
+            date = datetime.date.fromtimestamp(timestamp)
+            day = date.toordinal()
+            # Swapped in whole: postings on other stripes may be reading it
+            self.bounds = (day, _midnight(date), _midnight(date + datetime.timedelta(days=1)))
+        return day
+
+
+def _midnight(date):
+    return datetime.datetime.combine(date, datetime.time()).timestamp()
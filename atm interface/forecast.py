@@ -0,0 +1,84 @@
+"""Forecast when each cash cassette of a terminal runs out.
+
+The notes dispensed over the last ``--days`` days are taken as the demand
+that will repeat. Notes drawn from each cassette are summed cumulatively
+over that window as one NumPy array, and the notes left in each cassette
+are located in it by whole windows plus one comparison per column, so the
+forecast costs the same however far ahead the cassettes last. Demand is
+matched to cassettes by denomination, so it carries over reloads with a
+different layout. Needs numpy.
+
+    python forecast.py atm1 --days 28
+"""
+import argparse
+import datetime
+import os
+import time
+
+import numpy as np
+
+from cassettes import CASSETTE_DIR, Cassettes, read_log
+
+DAY = 86400.0
+
+
+def load_demand(path, denominations):
+    """Dispense times and a (dispenses, cassettes) array of notes per denomination."""
+    times, drawn = [], []
+    column = {denomination: i for i, denomination in enumerate(denominations)}
+    layout = ()
+    for timestamp, kind, fields in read_log(path):
+        if kind == "load":
+            layout = [int(field.split(":")[0]) for field in fields]
+            continue
+        row = [0] * len(denominations)
+        for denomination, notes in zip(layout, fields):
+            if denomination in column:
+                row[column[denomination]] += int(notes)
+        times.append(timestamp)
+        drawn.append(row)
+    return np.array(times, dtype=np.float64), np.array(drawn, dtype=np.int64).reshape(-1, len(denominations))
+
+
+def forecast(times, drawn, counts, now, window):
+    """Time each cassette runs out if the ``window`` seconds before ``now`` repeat.
+
+    ``counts`` is the notes left per cassette. Returns one timestamp per
+    cassette; ``inf`` where that cassette saw no demand in the window.
+    """
+    counts = np.asarray(counts, dtype=np.int64)
+    recent = times >= now - window
+    offsets = times[recent] - (now - window)   # when, within each repeat of the window
+    cumulative = np.cumsum(drawn[recent], axis=0)
+    per_window = cumulative[-1] if len(cumulative) else np.zeros_like(counts)
+    used = per_window > 0
+    # Whole windows the cassette lasts, then the dispense within the next
+    # one that takes its last note
+    windows = np.where(used, (counts - 1) // np.maximum(per_window, 1), 0)
+    left = counts - windows * per_window
+    last = np.argmax(cumulative >= left, axis=0) if len(cumulative) else np.zeros_like(counts)
+    at = now + windows * window + (offsets[last] if len(offsets) else 0.0)
+    return np.where(used, np.where(counts > 0, at, now), np.inf)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("terminal", help="terminal name, e.g. atm1")
+    parser.add_argument("--days", type=float, default=28, help="days of recorded demand to repeat")
+    parser.add_argument("--root", default=CASSETTE_DIR, help="directory holding the cassette logs")
+    args = parser.parse_args(argv)
+
+    path = os.path.join(args.root, f"{args.terminal}.log")
+    if not os.path.exists(path):
+        parser.error(f"no cassette log at {path}")
+    cassettes = Cassettes(path)
+    cassettes.close()
+    times, drawn = load_demand(path, cassettes.denominations)
+    empty_at = forecast(times, drawn, cassettes.counts, time.time(), args.days * DAY)
+    for denomination, count, at in zip(cassettes.denominations, cassettes.counts, empty_at):
+        when = "no recent demand" if np.isinf(at) else datetime.datetime.fromtimestamp(at).strftime("%Y-%m-%d %H:%M")
+        print(f"₹{denomination // 100:>5}  {count:>6} notes  empty {when}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import time
+from array import array
+from bisect import bisect_left
+
+NO_BALANCE = -1  # for front-ends that do not show the balance after each entry
+
+# Fixed-width columns of a history: name, array typecode
+COLUMNS = (
+    ("times", "d"),             # seconds since the epoch, never decreasing
+    ("kind_codes", "b"),        # index into History.kinds
+    ("amounts", "q"),           # paise
+    ("counterparty_ids", "q"),  # index into History.strings, 0 for none
+    ("balances", "q"),          # paise after the transaction, or NO_BALANCE
+    ("note_ids", "q"),          # index into History.strings, 0 for none
+)
+
+
+class Transaction:
+    """One history record, built only when a row is read for display."""
+
+    __slots__ = ("timestamp", "kind", "amount", "counterparty", "balance", "note")
+
+    def __init__(self, timestamp, kind, amount, counterparty="", balance=NO_BALANCE, note=""):
+        self.timestamp = timestamp
+        self.kind = kind
+        self.amount = amount            # paise
+        self.counterparty = counterparty
+        self.balance = balance          # paise after the transaction, or NO_BALANCE
+        self.note = note
+
+    def __eq__(self, other):
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"Transaction({fields})"
+
+
+class Names:
+    """Strings numbered in order of first use; ``""`` is always 0 in a string table."""
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, number):
+        return self.names[number]
+
+    def get(self, name):
+        return self.ids.get(name)
+
+    def number(self, name):
+        number = self.ids.get(name)
+        if number is None:
+            number = self.ids[name] = len(self.names)
+            self.names.append(name)
+            self.added(name)
+        return number
+
+    def added(self, name):
+        pass  # hook for tables kept on disk
+
+
+class History:
+    """Append-only transaction history with secondary indexes.
+
+    Records are kept as fixed-width parallel columns (see ``COLUMNS``)
+    rather than formatted strings or one object per row, so ``add`` only
+    appends numbers; a ``Transaction`` is built when a row is read, and
+    formatting is left to whoever displays it. Types, counterparties and
+    notes are stored once in small name tables and referenced by number.
+    Every record number is also filed under its type, its counterparty and
+    the pair of both. Timestamps never go backwards, so each of those lists is sorted by
+    time as well as by position, and ``query`` narrows any of them to a
+    time range with two binary searches: filtered screens cost O(log n)
+    however long the history gets. Indexes are brought up to date on the
+    first query after new records, which keeps ``add`` cheap.
+    """
+
+    def __init__(self):
+        self._attach({name: array(typecode) for name, typecode in COLUMNS}, Names(), Names([""]))
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, position):
+        strings = self.strings
+        return Transaction(self.times[position], self.kinds[self.kind_codes[position]], self.amounts[position],
+                           strings[self.counterparty_ids[position]], self.balances[position],
+                           strings[self.note_ids[position]])
+
+    def add(self, kind, amount, counterparty="", balance=NO_BALANCE, note="", timestamp=None):
+        position = len(self.times)
+        timestamp = time.time() if timestamp is None else timestamp
+        if position and timestamp < self.times[-1]:
+            timestamp = self.times[-1]  # clock stepped back; keep the time index sorted
+        self.times.append(timestamp)
+        self.kind_codes.append(self.kinds.number(kind))
+        self.amounts.append(amount)
+        self.counterparty_ids.append(self.strings.number(counterparty))
+        self.balances.append(balance)
+        self.note_ids.append(self.strings.number(note))
+        return position
+
+    def query(self, kind=None, counterparty=None, since=None, until=None):
+        """Records of ``kind`` with ``counterparty`` in ``since <= t < until``.
+
+        Any filter may be left out. Returns a ``Selection`` in time order.
+        """
+        if kind is None and not counterparty:
+            return Selection(self, None, *self._span(self.times, since, until, None))
+        self._index_new()
+        code = None if kind is None else self.kinds.get(kind)
+        number = self.strings.get(counterparty) if counterparty else None
+        if kind is not None and counterparty:
+            positions = self._by_pair.get((code, number))
+        elif kind is not None:
+            positions = self._by_kind.get(code)
+        else:
+            positions = self._by_counterparty.get(number)
+        if positions is None:
+            return Selection(self, None, 0, 0)
+        return Selection(self, positions, *self._span(positions, since, until, self.times.__getitem__))
+
+    def clear(self):
+        self.__init__()
+
+    def _attach(self, columns, kinds, strings):
+        for name, _ in COLUMNS:
+            setattr(self, name, columns[name])
+        self.kinds = kinds
+        self.strings = strings
+        self._by_kind = {}
+        self._by_counterparty = {}
+        self._by_pair = {}
+        self._indexed = 0
+
+    def _index_new(self):
+        start, stop = self._indexed, len(self)
+        if start == stop:
+            return
+        for position, code, number in zip(range(start, stop), self.kind_codes[start:stop],
+                                          self.counterparty_ids[start:stop]):
+            _file(self._by_kind, code, position)
+            if number:
+                _file(self._by_counterparty, number, position)
+                _file(self._by_pair, (code, number), position)
+        self._indexed = stop
+
+    def _span(self, sequence, since, until, key):
+        lo = 0 if since is None else bisect_left(sequence, since, key=key)
+        hi = len(sequence) if until is None else bisect_left(sequence, until, lo, key=key)
+        return lo, hi
+
+
+class Selection:
+    """Result of ``History.query``: a read-only sequence of records.
+
+    Holds only the bounds into an index, so slicing out the rows of one
+    screen is O(page size) whatever the number of matches. Records added
+    after the query are not included.
+    """
+
+    def __init__(self, history, positions, lo, hi):
+        self.history = history
+        self._positions = positions  # None means every record
+        self._lo = lo
+        self._hi = hi
+
+    def __len__(self):
+        return self._hi - self._lo
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.history[position] for position in self.positions(index)]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.history[self._position(self._lo + index)]
+
+    def positions(self, window=slice(None)):
+        # Record numbers for a slice of the selection, for callers that read
+        # the columns directly
+        start, stop, step = window.indices(len(self))
+        offsets = range(self._lo + start, self._lo + stop, step)
+        if self._positions is None:
+            return offsets
+        return [self._positions[offset] for offset in offsets]
+
+    def _position(self, offset):
+        return offset if self._positions is None else self._positions[offset]
+
+
+def _file(index, key, position):
+    positions = index.get(key)
+    if positions is None:
+        positions = index[key] = array("q")
+    positions.append(position)
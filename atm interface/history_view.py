@@ -0,0 +1,157 @@
+import time
+import tkinter as tk
+
+
+class HistoryView(tk.Frame):
+    """Scrollable transaction table that only renders the rows on screen.
+
+    The view owns a fixed grid of ``visible_rows`` labels and asks
+    ``fetch_rows(start, count)`` for the window currently scrolled into view,
+    so opening it costs the same with ten rows of history or a million.
+    ``row_count()`` gives the total used to size the scrollbar.
+    """
+
+    def __init__(self, parent, columns, row_count, fetch_rows, visible_rows=15,
+                 font=("Courier New", 10), bg="#262626", fg="white", header_fg="cyan", **kwargs):
+        super().__init__(parent, bg=bg, **kwargs)
+        self.columns = columns
+        self.row_count = row_count
+        self.fetch_rows = fetch_rows
+        self.visible_rows = visible_rows
+        self.first = 0
+
+        for col, title in enumerate(columns):
+            tk.Label(self, text=title, font=font, bg=bg, fg=header_fg, anchor="w",
+                     padx=10).grid(row=0, column=col, sticky="ew")
+            self.grid_columnconfigure(col, weight=1)
+
+        self.cells = []
+        for row in range(visible_rows):
+            cells = []
+            for col in range(len(columns)):
+                cell = tk.Label(self, text="", font=font, bg=bg, fg=fg, anchor="w", padx=10, pady=2)
+                cell.grid(row=row + 1, column=col, sticky="ew")
+                cells.append(cell)
+            self.cells.append(cells)
+
+        self.empty_label = tk.Label(self, text="No transactions yet.", font=font, bg=bg, fg="gray")
+
+        self.scrollbar = tk.Scrollbar(self, orient="vertical", command=self.on_scroll)
+        self.scrollbar.grid(row=0, column=len(columns), rowspan=visible_rows + 1, sticky="ns")
+
+        for widget in [self] + [cell for cells in self.cells for cell in cells]:
+            widget.bind("<MouseWheel>", self.on_mousewheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_to(self.first - 3))
+            widget.bind("<Button-5>", lambda e: self.scroll_to(self.first + 3))
+
+        self.refresh()
+
+    def refresh(self):
+        total = self.row_count()
+        self.first = max(0, min(self.first, total - self.visible_rows))
+        rows = self.fetch_rows(self.first, self.visible_rows) if total else []
+        for cells, row in zip(self.cells, rows):
+            if isinstance(row, str):
+                row = (row,)
+            for cell, value in zip(cells, row):
+                cell.config(text=value)
+        for cells in self.cells[len(rows):]:
+            for cell in cells:
+                cell.config(text="")
+
+        if total:
+            self.empty_label.grid_forget()
+            self.scrollbar.set(self.first / total, min(1.0, (self.first + self.visible_rows) / total))
+        else:
+            self.empty_label.grid(row=1, column=0, columnspan=len(self.columns))
+            self.scrollbar.set(0.0, 1.0)
+
+    def scroll_to(self, first):
+        self.first = first
+        self.refresh()
+
+    def on_scroll(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * self.row_count()))
+        elif unit == "pages":
+            self.scroll_to(self.first + int(amount) * self.visible_rows)
+        else:
+            self.scroll_to(self.first + int(amount))
+
+    def on_mousewheel(self, event):
+        self.scroll_to(self.first + (-3 if event.delta > 0 else 3))
+
+
+def list_source(items, newest_first=False):
+    # Adapt an in-memory list to the (row_count, fetch_rows) pair HistoryView
+    # expects, without copying it
+    def row_count():
+        return len(items)
+
+    def fetch_rows(start, count):
+        if not newest_first:
+            return items[start:start + count]
+        end = len(items) - start
+        return items[max(0, end - count):end][::-1]
+
+    return row_count, fetch_rows
+
+
+def query_source(history, format_row, newest_first=False, **filters):
+    # Adapt a History query to HistoryView; the query is re-run on every
+    # refresh (it is two binary searches) so new records show up, and only
+    # the rows on screen are formatted
+    def row_count():
+        return len(history.query(**filters))
+
+    def fetch_rows(start, count):
+        selection = history.query(**filters)
+        if not newest_first:
+            records = selection[start:start + count]
+        else:
+            end = len(selection) - start
+            records = selection[max(0, end - count):end][::-1]
+        return [format_row(record) for record in records]
+
+    return row_count, fetch_rows
+
+
+class FilterBar(tk.Frame):
+    """Type, period and counterparty filters driving a HistoryView over a History."""
+
+    ALL_TYPES = "All types"
+    PERIODS = {"All time": None, "Today": 1, "Last 7 days": 7, "Last 30 days": 30}
+
+    def __init__(self, parent, table, history, format_row, kinds, newest_first=False,
+                 font=("Courier New", 10), bg="#262626", fg="white", **kwargs):
+        super().__init__(parent, bg=bg, **kwargs)
+        self.table = table
+        self.history = history
+        self.format_row = format_row
+        self.newest_first = newest_first
+
+        self.kind = tk.StringVar(self, self.ALL_TYPES)
+        self.period = tk.StringVar(self, "All time")
+        for variable, choices in ((self.kind, (self.ALL_TYPES, *kinds)), (self.period, tuple(self.PERIODS))):
+            menu = tk.OptionMenu(self, variable, *choices, command=lambda _: self.apply())
+            menu.config(font=font, bg=bg, fg=fg, highlightthickness=0)
+            menu.pack(side="left", padx=5)
+        tk.Label(self, text="To:", font=font, bg=bg, fg=fg).pack(side="left", padx=(10, 2))
+        self.counterparty = tk.Entry(self, font=font, width=16)
+        self.counterparty.pack(side="left", padx=5)
+        self.counterparty.bind("<Return>", lambda e: self.apply())
+        tk.Button(self, text="Filter", font=font, command=self.apply).pack(side="left", padx=5)
+        self.apply()
+
+    def apply(self):
+        kind = self.kind.get()
+        days = self.PERIODS[self.period.get()]
+        since = None
+        if days is not None:
+            midnight = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+            since = midnight - (days - 1) * 86400
+        self.table.row_count, self.table.fetch_rows = query_source(
+            self.history, self.format_row, self.newest_first,
+            kind=None if kind == self.ALL_TYPES else kind,
+            counterparty=self.counterparty.get().strip() or None, since=since)
+        self.table.scroll_to(0)
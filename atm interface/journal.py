@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, one process per data directory is up to the operator
+    fcntl = None
+
+
+class Journal:
+    """Append-only transaction log with group commit.
+
+    Records are buffered and written by a single flusher thread, which
+    fsyncs once per batch. A batch is closed when ``commit_window`` seconds
+    have passed since its first record or when it reaches ``max_batch``
+    records, so many transactions share the cost of one fsync.
+    """
+
+    def __init__(self, path, commit_window=0.005, max_batch=1024, truncate_at=None):
+        self.path = path
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+
+        self._file = open(path, "ab")
+        if fcntl is not None:
+            # A second process appending to the same log (or snapshotting
+            # over its balance file) would corrupt both, so refuse to start
+            try:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                self._file.close()
+                raise RuntimeError(f"{path} is in use by another process") from None
+        self._durable_offset = self._appended_offset = self._file.seek(0, os.SEEK_END)
+        if truncate_at is not None:
+            self.truncate(truncate_at)
+        self._pending = []
+        self._appended = 0   # sequence number of the last appended record
+        self._durable = 0    # sequence number of the last fsynced record
+        self._closed = False
+        self._cond = threading.Condition()
+        # Called from the flusher thread with the newest durable sequence
+        # number, for callers that cannot block in append() (the switch server)
+        self.on_durable = None
+
+        self._flusher = threading.Thread(target=self._run, name="journal-flusher", daemon=True)
+        self._flusher.start()
+
+    def truncate(self, offset):
+        # Drop a torn tail left behind by a crash mid-write; only before the
+        # first append
+        if offset < self._durable_offset:
+            self._file.truncate(offset)
+            self._durable_offset = self._appended_offset = self._file.seek(0, os.SEEK_END)
+
+    def append(self, kind, account, amount, counterparty="", wait=True, timestamp=None):
+        line = encode_record(time.time() if timestamp is None else timestamp, kind, account, amount, counterparty)
+        return self.append_line(line, wait)
+
+    def append_line(self, line, wait=True):
+        # A record from encode_record(), for callers that encode it before
+        # changing any state of their own
+        with self._cond:
+            if self._closed:
+                raise ValueError("journal is closed")
+            self._pending.append(line)
+            self._appended += 1
+            self._appended_offset += len(line)
+            seq = self._appended
+            self._cond.notify_all()
+            if wait:
+                while self._durable < seq:
+                    self._cond.wait()
+        return seq
+
+    @property
+    def appended(self):
+        return self._appended
+
+    @property
+    def durable(self):
+        return self._durable
+
+    def append_many(self, records, timestamp=None):
+        # Queue many (kind, account, amount, counterparty) records under one
+        # lock; returns the sequence number of the last one for wait_for()
+        now = time.time() if timestamp is None else timestamp
+        lines = [encode_record(now, *record) for record in records]
+        with self._cond:
+            if self._closed:
+                raise ValueError("journal is closed")
+            self._pending.extend(lines)
+            self._appended += len(lines)
+            self._appended_offset += sum(map(len, lines))
+            self._cond.notify_all()
+            return self._appended
+
+    def wait_for(self, seq):
+        # Block until the record append() numbered ``seq`` is durable
+        with self._cond:
+            while self._durable < seq:
+                self._cond.wait()
+
+    def sync(self):
+        with self._cond:
+            seq = self._appended
+            self._cond.notify_all()
+            while self._durable < seq:
+                self._cond.wait()
+
+    def offset(self):
+        # Byte offset just past everything made durable so far
+        self.sync()
+        return self._durable_offset
+
+    def mark(self):
+        # (sequence number, byte offset) just past everything appended so
+        # far, without waiting for an fsync; wait_for(seq) before relying on
+        # the offset being on disk
+        with self._cond:
+            return self._appended, self._appended_offset
+
+    def close(self):
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._flusher.join()
+        self._file.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                deadline = time.monotonic() + self.commit_window
+                while len(self._pending) < self.max_batch and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._pending
+                self._pending = []
+                seq = self._appended
+
+            self._file.write(b"".join(batch))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+            with self._cond:
+                self._durable = seq
+                self._durable_offset = self._file.tell()
+                self._cond.notify_all()
+            if self.on_durable is not None:
+                self.on_durable(seq)
+
+
+def encode_record(timestamp, kind, account, amount, counterparty=""):
+    # amount is an integer number of paise
+    counterparty = counterparty.replace("\t", " ").replace("\n", " ")
+    return f"{timestamp:.6f}\t{kind}\t{account}\t{amount:d}\t{counterparty}\n".encode("utf-8")
+
+
+def replay(path, offset=0):
+    """Yield ``(timestamp, kind, account, amount, counterparty, end_offset)``.
+
+    A torn final line left by a crash is ignored; ``end_offset`` of the last
+    yielded record is where the next append should start.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                return
+            offset += len(raw)
+            ts, kind, account, amount, counterparty = raw[:-1].decode("utf-8").split("\t")
+            yield float(ts), kind, account, int(amount), counterparty, offset
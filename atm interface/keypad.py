@@ -0,0 +1,44 @@
+import tkinter as tk
+
+
+class Keypad(tk.Frame):
+    """The 0-9 / Clear / Enter keypad, built once and shared by every screen.
+
+    Screens don't own a keypad; ``attach`` packs the single instance right
+    after a widget of the screen being shown and points its buttons at that
+    screen's digit, clear and enter handlers.
+    """
+
+    def __init__(self, parent, btn_font):
+        super().__init__(parent, bg="black")
+        self.num_cmd = self.clear_cmd = self.enter_cmd = None
+
+        # Buttons 1-9
+        for i in range(1, 10):
+            btn = tk.Button(self, text=str(i), font=btn_font, fg="white", bg="#222",
+                            activebackground="cyan", width=5, height=2,
+                            command=lambda x=i: self.num_cmd(x))
+            btn.grid(row=(i-1)//3, column=(i-1)%3, padx=8, pady=8)
+        # Clear, 0, Enter
+        btn_clear = tk.Button(self, text="Clear", font=btn_font, fg="white", bg="#b22222",
+                              activebackground="#ff5555", width=5, height=2,
+                              command=lambda: self.clear_cmd())
+        btn_clear.grid(row=3, column=0, padx=8, pady=8)
+
+        btn_zero = tk.Button(self, text="0", font=btn_font, fg="white", bg="#222",
+                             activebackground="cyan", width=5, height=2,
+                             command=lambda: self.num_cmd(0))
+        btn_zero.grid(row=3, column=1, padx=8, pady=8)
+
+        btn_enter = tk.Button(self, text="Enter", font=btn_font, fg="white", bg="#228b22",
+                              activebackground="#55ff55", width=5, height=2,
+                              command=lambda: self.enter_cmd())
+        btn_enter.grid(row=3, column=2, padx=8, pady=8)
+
+    def attach(self, after, num_cmd, clear_cmd, enter_cmd, pady=10):
+        self.num_cmd = num_cmd
+        self.clear_cmd = clear_cmd
+        self.enter_cmd = enter_cmd
+        self.pack(after=after, pady=pady)
+        # The screen frames are our siblings; stay on top of the one shown
+        self.lift()
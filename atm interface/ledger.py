@@ -0,0 +1,346 @@
+import contextlib
+import os
+import threading
+import time
+
+from accounts import AccountStore
+from config import DATA_DIR
+from credentials import hash_pin, pin_record, verify_pin
+from events import make_event
+from journal import Journal, encode_record, replay
+from limits import LimitEngine
+from ratelimit import AttemptLimiter, TokenBuckets
+from snapshot import read_snapshot, write_snapshot
+
+LOG_PATH = os.path.join(DATA_DIR, "transactions.log")
+SNAPSHOT_PATH = os.path.join(DATA_DIR, "balance.txt")
+
+# Cards the bundled front-ends log in with, opened on first start
+DEMO_ACCOUNTS = (
+    ("123456", "654321"),  # atm.py
+    ("100001", "1234"),    # atm1.py, atm2.py
+    ("100002", "2004"),    # ATM-INTERFACE.py, ATM_Simulator.py
+)
+DEMO_BALANCE = 10000000  # paise
+
+
+class TransactionError(ValueError):
+    pass
+
+
+class InvalidAmount(TransactionError):
+    pass
+
+
+class InsufficientBalance(TransactionError):
+    pass
+
+
+class LimitExceeded(TransactionError):
+    pass
+
+
+class PinLocked(TransactionError):
+    """Too many wrong PINs for the card or terminal; try again after ``retry_after`` seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(retry_after)
+        self.retry_after = float(retry_after)
+
+
+class Ledger:
+    """Balance rules shared by every ATM front-end, with no Tk dependency.
+
+    Amounts and balances are integer paise (see ``money``). Each operation
+    validates the amount, applies it to the account and returns the balance
+    after the transaction. Failures raise a ``TransactionError`` subclass so
+    the GUIs can keep catching ``ValueError`` for bad input. When a journal is attached, every applied
+    operation is appended to it before returning, and a snapshot of the
+    account table is taken every ``snapshot_every`` operations or
+    ``snapshot_interval`` seconds, whichever comes first; the snapshot is
+    written on a thread of its own, so no posting waits for it. With
+    ``sync_commit=False`` operations return as soon as they are queued on
+    the journal and the caller is responsible for waiting on durability.
+
+    The ledger is safe to share between threads. Each account maps to one
+    of ``stripes`` locks, so the balance check and the debit happen as one
+    step while postings to accounts on other stripes run in parallel; a
+    transfer holds the stripes of both accounts. Opening an account and
+    taking a snapshot hold every stripe; opening also waits for a snapshot
+    being written, since only the balances are copied for one.
+
+    Every accepted posting is also emitted as an event (see ``events``) to
+    the projections added with ``subscribe``. One is always there:
+    ``limits``, whose daily counters are checked before each debit (raising
+    ``LimitExceeded``) and saved with the account table in the snapshot.
+
+    ``check_pin`` counts wrong PINs per card in ``pin_attempts`` (an
+    ``AttemptLimiter``) and per terminal in ``terminals`` (``TokenBuckets``),
+    and raises ``PinLocked`` for a locked card or terminal without computing
+    the hash.
+    """
+
+    def __init__(self, accounts=None, journal=None, snapshot_path=None,
+                 snapshot_every=10000, snapshot_interval=60.0, sync_commit=True, stripes=64, pin_attempts=None, terminals=None, limits=None):
+        self.accounts = accounts if accounts is not None else AccountStore()
+        self.journal = journal
+        self.sync_commit = sync_commit
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self.snapshot_interval = snapshot_interval
+        self._since_snapshot = 0
+        self._last_snapshot = time.monotonic()
+        self._stripes = [threading.Lock() for _ in range(stripes)]
+        self._snapshot_lock = threading.Lock()
+        self._opening = threading.Lock()  # held by opens and by snapshot writes
+        self.pin_attempts = pin_attempts if pin_attempts is not None else AttemptLimiter()
+        self.terminals = terminals if terminals is not None else TokenBuckets()
+        self.limits = limits if limits is not None else LimitEngine()
+        self.projections = [self.limits]
+
+    def open_account(self, account, pin, balance=0):
+        if balance < 0:
+            raise InvalidAmount(balance)
+        # Only the hash is journalled; it is computed before any lock is taken
+        self.post("open", account, balance, hash_pin(pin).hex())
+
+    def check_pin(self, account, pin, terminal=None):
+        wait = self.pin_attempts.retry_after(account)
+        if not wait and terminal is not None:
+            wait = self.terminals.retry_after(terminal)
+        if wait:
+            raise PinLocked(wait)
+        with self._stripe(account):
+            pin_hash = self.accounts.pin_hash(account)
+        # The slow hash runs with no stripe held
+        ok = pin_hash is not None and verify_pin(pin, pin_hash)
+        if ok:
+            self.pin_attempts.succeeded(account)
+        else:
+            if pin_hash is not None:
+                # Unknown cards are metered by terminal alone: counting them
+                # per card would let made-up numbers fill the limiter
+                self.pin_attempts.failed(account)
+            if terminal is not None:
+                self.terminals.spend(terminal)
+        return ok
+
+    def balance(self, account):
+        with self._stripe(account):
+            return self.accounts.balances[self.accounts.slot(account)]
+
+    def deposit(self, account, amount):
+        return self.post("deposit", account, amount)
+
+    def withdraw(self, account, amount):
+        return self.post("withdraw", account, amount)
+
+    def transfer(self, account, amount, recipient):
+        return self.post("transfer", account, amount, recipient)
+
+    def phonepe(self, account, amount, phone):
+        return self.post("phonepe", account, amount, phone)
+
+    def pipeline(self, calls):
+        # Same call as LedgerClient.pipeline; locally there is no round trip to save
+        return [getattr(self, op)(*args) for op, *args in calls]
+
+    def subscribe(self, projection):
+        # Keep ``projection`` up to date from every posting from now on
+        with self.exclusive():
+            self.projections.append(projection)
+
+    def post(self, kind, account, amount, counterparty="", timestamp=None):
+        # Generic entry point for batch jobs and replay: kind is "open" or one
+        # of OPERATIONS
+        timestamp = time.time() if timestamp is None else timestamp
+        # Write-ahead: the record is encoded before anything changes, so a
+        # posting that cannot be journalled leaves no balance behind, and it
+        # is journalled before projections see it
+        line = None if self.journal is None else encode_record(timestamp, kind, account, amount, counterparty)
+        if kind == "open":
+            # Adding an account may rehash the whole index under every stripe
+            locks = [self._opening, *self._stripes]
+        elif amount <= 0:
+            raise InvalidAmount(amount)
+        elif kind == "transfer" and counterparty:
+            locks = self._stripes_for(account, counterparty)
+        else:
+            with self._stripe(account):
+                balance = self._apply(kind, account, amount, counterparty)
+                seq = self._record(line)
+                self._emit(timestamp, kind, account, amount, counterparty)
+            self._committed(seq)
+            return balance
+        for lock in locks:
+            lock.acquire()
+        try:
+            balance = self._apply(kind, account, amount, counterparty)
+            seq = self._record(line)
+            self._emit(timestamp, kind, account, amount, counterparty)
+        finally:
+            for lock in reversed(locks):
+                lock.release()
+        self._committed(seq)
+        return balance
+
+    def emit_many(self, timestamp, records):
+        # For batch jobs that apply (kind, account, amount, counterparty)
+        # records to the account table themselves; call inside exclusive()
+        if self.projections:
+            events = [event for event in (make_event(timestamp, *record) for record in records) if event]
+            for projection in self.projections:
+                projection.apply_many(events)
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        # Hold every stripe, for work that touches the whole table at once
+        for lock in self._stripes:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(self._stripes):
+                lock.release()
+
+    def state(self):
+        # Arrays written to the snapshot; subclasses append their own
+        return self.accounts.state() + self.limits.state()
+
+    def restore(self, arrays):
+        self.accounts = AccountStore.from_state(arrays[:5])
+        if len(arrays) > 5:  # snapshots from before daily limits have none
+            self.limits.restore(arrays[5:])
+
+    def snapshot(self):
+        with self._snapshot_lock:
+            self._write_snapshot()
+
+    def close(self):
+        if self.journal is None:
+            return
+        self.snapshot()
+        self.journal.close()
+        self.journal = None
+
+    def _apply(self, kind, account, amount, counterparty):
+        accounts = self.accounts
+        if kind == "open":
+            accounts.add(account, pin_record(counterparty), amount)
+            return amount
+        balances = accounts.balances
+        slot = accounts.slot(account)
+        if kind == "deposit":
+            balances[slot] += amount
+        elif kind in DEBITS:
+            if kind != "withdraw" and not counterparty:
+                raise TransactionError(f"{kind} needs a recipient")
+            if amount > balances[slot]:
+                raise InsufficientBalance(amount)
+            self._check_limits(kind, account, amount, counterparty)
+            balances[slot] -= amount
+            if kind == "transfer" and counterparty in accounts:
+                # Recipient banks with us: credit it in the same posting
+                balances[accounts.slot(counterparty)] += amount
+        else:
+            raise TransactionError(f"unknown operation {kind!r}")
+        return balances[slot]
+
+    def _check_limits(self, kind, account, amount, counterparty):
+        refusal = self.limits.refusal(kind, account, amount, counterparty)
+        if refusal:
+            raise LimitExceeded(refusal)
+
+    def _emit(self, timestamp, kind, account, amount, counterparty):
+        event = make_event(timestamp, kind, account, amount, counterparty)
+        if event is not None:
+            for projection in self.projections:
+                projection.apply(event)
+
+    def _stripe(self, account):
+        return self._stripes[hash(account) % len(self._stripes)]
+
+    def _stripes_for(self, *accounts):
+        # Always acquired in index order, so two transfers between the same
+        # pair of accounts in opposite directions cannot deadlock
+        stripes = self._stripes
+        return [stripes[i] for i in sorted({hash(account) % len(stripes) for account in accounts})]
+
+    def _record(self, line):
+        # Appended while the account's stripe is held so the journal order
+        # matches the order postings were applied in
+        if line is None or self.journal is None:
+            return 0
+        self._since_snapshot += 1
+        return self.journal.append_line(line, wait=False)
+
+    def _committed(self, seq):
+        if not seq:
+            return
+        if self.sync_commit:
+            self.journal.wait_for(seq)
+        if ((self._since_snapshot >= self.snapshot_every
+                or time.monotonic() - self._last_snapshot >= self.snapshot_interval)
+                and self._snapshot_lock.acquire(blocking=False)):
+            # The posting thread may be the switch's event loop, which must
+            # not wait on an fsync
+            threading.Thread(target=self._snapshot_in_background, name="ledger-snapshot", daemon=True).start()
+
+    def _snapshot_in_background(self):
+        try:
+            self._write_snapshot()
+        finally:
+            self._snapshot_lock.release()
+
+    def _write_snapshot(self):
+        if self.journal is None or not self.snapshot_path:
+            return
+        # Stop postings just long enough to copy the balances at the journal
+        # offset, then write with the stripes released. The other account
+        # columns only change when an account is opened, which waits for the
+        # write, so they are written as they stand rather than copied
+        with self._opening:
+            with self.exclusive():
+                seq, offset = self.journal.mark()
+                balances = self.accounts.balances
+                arrays = [column[:] if column is balances else column for column in self.state()]
+                self._since_snapshot = 0
+            # A snapshot must never point past the end of the journal on disk
+            self.journal.wait_for(seq)
+            write_snapshot(self.snapshot_path, offset, arrays)
+        self._last_snapshot = time.monotonic()
+
+
+OPERATIONS = ("deposit", "withdraw", "transfer", "phonepe")
+DEBITS = ("withdraw", "transfer", "phonepe")
+
+
+def open_ledger(log_path=LOG_PATH, snapshot_path=SNAPSHOT_PATH, demo_accounts=DEMO_ACCOUNTS,
+                snapshot_every=10000, snapshot_interval=60.0, sync_commit=True, ledger_class=Ledger,
+                terminals=None, **journal_options):
+    # Lock the journal first, so no other process writes it or the snapshot
+    # while they are read
+    journal = Journal(log_path, **journal_options)
+    try:
+        # Start from the last snapshot of the account table and the limit
+        # counters, and replay only the journal tail written after it
+        offset, arrays = read_snapshot(snapshot_path)
+        ledger = ledger_class(snapshot_every=snapshot_every, snapshot_interval=snapshot_interval,
+                              sync_commit=sync_commit, terminals=terminals)
+        if arrays:
+            ledger.restore(arrays)
+        # These postings passed the limits in force when they were made
+        ledger.limits.enforce = False
+        for timestamp, kind, account, amount, counterparty, offset in replay(log_path, offset):
+            ledger.post(kind, account, amount, counterparty, timestamp)
+        ledger.limits.enforce = True
+        journal.truncate(offset)
+    except BaseException:
+        journal.close()
+        raise
+    ledger.journal = journal
+    ledger.snapshot_path = snapshot_path
+    for account, pin in demo_accounts:
+        if account not in ledger.accounts:
+            ledger.open_account(account, pin, DEMO_BALANCE)
+    return ledger
@@ -0,0 +1,121 @@
+"""Daily limits on debits, checked in constant time.
+
+Each debit kind is a channel with its own cap per local day, in paise and
+in number of postings: cash at the ATM (``withdraw``), ``transfer`` and
+``phonepe``. Transfers and PhonePe payments are also capped per recipient.
+The ledger asks ``refusal`` before every debit, with the account's stripe
+held, and the engine counts each posting as the ledger emits it (see
+``events``), so a check is two dictionary lookups however long the history.
+
+Counters are kept for the current day only; each records the day it
+belongs to, so a counter from yesterday reads as zero and midnight needs
+no sweep. They are saved in the ledger snapshot, which also drops the
+stale ones, and the journal tail replays into them on start-up.
+"""
+import hashlib
+from array import array
+
+from accounts import _key
+from events import Days, Projection
+from money import format_amount
+
+# Debit kind: (paise per day, postings per day)
+DAILY_LIMITS = {
+    "withdraw": (5000000, 10),   # ₹50,000 in cash
+    "transfer": (20000000, 20),  # ₹2,00,000
+    "phonepe": (10000000, 20),   # ₹1,00,000
+}
+RECIPIENT_LIMIT = 5000000  # paise a day to any one recipient, by transfer or PhonePe
+CHANNELS = ("withdraw", "transfer", "phonepe")
+NAMES = {"withdraw": "cash withdrawal", "transfer": "transfer", "phonepe": "PhonePe payment"}
+
+
+class LimitEngine(Projection):
+    """Per-account daily counters for each channel and each recipient.
+
+    ``enforce`` is switched off while the ledger replays its journal, since
+    those postings were accepted when they were made.
+    """
+
+    def __init__(self, limits=None, per_recipient=RECIPIENT_LIMIT):
+        self.limits = DAILY_LIMITS if limits is None else limits
+        self.per_recipient = per_recipient
+        self.enforce = True
+        self.day = Days()
+        self._spent = {}  # (account, kind) -> (day, paise, count)
+        self._sent = {}   # (account, recipient hash) -> (day, paise)
+
+    def refusal(self, kind, account, amount, counterparty=""):
+        """Why a debit would go over a limit today, or None if it would not."""
+        limit = self.limits.get(kind)
+        if limit is None or not self.enforce:
+            return None
+        today = self.day()
+        cap, max_count = limit
+        day, paise, count = self._spent.get((account, kind), (today, 0, 0))
+        if day != today:
+            paise = count = 0
+        if paise + amount > cap:
+            return (f"Daily {NAMES[kind]} limit is ₹{format_amount(cap, True)}; "
+                    f"₹{format_amount(max(0, cap - paise), True)} left today")
+        if count >= max_count:
+            return f"Daily limit of {max_count} {NAMES[kind]}s reached"
+        if counterparty and self.per_recipient is not None:
+            day, paise = self._sent.get((account, _recipient(counterparty)), (today, 0))
+            if day != today:
+                paise = 0
+            if paise + amount > self.per_recipient:
+                return (f"Daily limit to {counterparty} is ₹{format_amount(self.per_recipient, True)}; "
+                        f"₹{format_amount(max(0, self.per_recipient - paise), True)} left today")
+        return None
+
+    def count(self, kind, account, amount, counterparty, timestamp):
+        if kind not in self.limits:
+            return
+        day = self.day(timestamp)
+        key = (account, kind)
+        spent_day, paise, count = self._spent.get(key, (day, 0, 0))
+        if spent_day < day:
+            paise = count = 0
+        elif spent_day > day:
+            return  # a posting from before midnight replayed late
+        self._spent[key] = (day, paise + amount, count + 1)
+        if counterparty:
+            key = (account, _recipient(counterparty))
+            sent_day, paise = self._sent.get(key, (day, 0))
+            self._sent[key] = (day, (paise if sent_day == day else 0) + amount)
+
+    def apply(self, event):
+        self.count(event.kind, event.account, event.amount, event.counterparty, event.timestamp)
+
+    def state(self):
+        # Today's counters as arrays for the snapshot. The ledger takes it
+        # with every stripe held, so stale counters are dropped here too
+        today = self.day()
+        self._spent = {key: value for key, value in self._spent.items() if value[0] == today}
+        self._sent = {key: value for key, value in self._sent.items() if value[0] == today}
+        spent, sent = self._spent.items(), self._sent.items()
+        return [
+            array("q", [today]),
+            array("q", [_key(account) for (account, _), _ in spent]),
+            array("b", [CHANNELS.index(kind) for (_, kind), _ in spent]),
+            array("q", [paise for _, (_, paise, _) in spent]),
+            array("q", [count for _, (_, _, count) in spent]),
+            array("q", [_key(account) for (account, _), _ in sent]),
+            array("q", [recipient for (_, recipient), _ in sent]),
+            array("q", [paise for _, (_, paise) in sent]),
+        ]
+
+    def restore(self, arrays):
+        (day,), accounts, kinds, amounts, counts, senders, recipients, sent = arrays
+        self._spent = {(str(account)[1:], CHANNELS[kind]): (day, paise, count)
+                       for account, kind, paise, count in zip(accounts, kinds, amounts, counts)}
+        self._sent = {(str(account)[1:], recipient): (day, paise)
+                      for account, recipient, paise in zip(senders, recipients, sent)}
+
+
+def _recipient(counterparty):
+    # Recipients are free text (names, phone numbers, card ids); a stable
+    # 64-bit digest keeps the counters compact and fits the snapshot arrays
+    digest = hashlib.blake2b(counterparty.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
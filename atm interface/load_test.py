@@ -0,0 +1,97 @@
+"""Drive many simulated terminals against a running switch server.
+
+Every terminal is a coroutine that logs in, pipelines its balance and PIN
+checks, runs a few operations and logs out again, all through one
+``LedgerClient`` and its small connection pool. A login refused with
+``PinLocked`` ends that session and is counted. Reports p50/p99 latency per
+call and overall requests/sec.
+
+    python server.py --listen /tmp/atm.sock &
+    python load_test.py --server /tmp/atm.sock --terminals 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from benchmark import FRONTENDS, parse_mix, percentile
+from client import LedgerClient
+from ledger import DEMO_ACCOUNTS, PinLocked, TransactionError
+
+clock = time.perf_counter
+
+
+async def terminal(client, rng, mix, sessions, ops_per_session, latencies):
+    ops, weights = zip(*mix.items())
+    refused = 0
+    for _ in range(sessions):
+        card, pin = rng.choice(DEMO_ACCOUNTS)
+
+        # Login and the opening balance go out together in one write
+        t = clock()
+        futures = client.pipeline_async([("check_pin", card, pin), ("balance", card)])
+        try:
+            await asyncio.gather(*map(asyncio.wrap_future, futures))
+        except PinLocked:
+            refused += 1
+            continue
+        finally:
+            latencies["login"].append(clock() - t)
+
+        for op in rng.choices(ops, weights, k=ops_per_session):
+            args = (card, rng.randrange(100, 50000))
+            if op == "transfer":
+                args += (rng.choice(DEMO_ACCOUNTS)[0],)
+            elif op == "phonepe":
+                args += ("98%08d" % rng.randrange(10 ** 8),)
+            t = clock()
+            try:
+                await asyncio.wrap_future(client.call_async(op, *args))
+            except TransactionError:
+                pass
+            latencies[op].append(clock() - t)
+    return refused
+
+
+async def run(address, terminals, pool_size, mix, sessions, ops_per_session, seed):
+    client = LedgerClient(address, pool_size=pool_size)
+    latencies = {name: [] for name in ("login", *mix)}
+    rng = random.Random(seed)
+    try:
+        started = clock()
+        refused = await asyncio.gather(*(terminal(client, random.Random(rng.random()), mix, sessions,
+                                                  ops_per_session, latencies)
+                                         for _ in range(terminals)))
+        elapsed = clock() - started
+    finally:
+        client.close()
+    return latencies, sum(refused), elapsed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", default="127.0.0.1:7070", help="host:port or a Unix socket path")
+    parser.add_argument("--terminals", type=int, default=10000)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--frontend", choices=sorted(FRONTENDS), default="atm2")
+    parser.add_argument("--mix", help="weights such as deposit=40,withdraw=40,transfer=10,phonepe=10")
+    parser.add_argument("--sessions", type=int, default=1, help="sessions per terminal")
+    parser.add_argument("--ops-per-session", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix, args.frontend)
+    latencies, refused, elapsed = asyncio.run(run(args.server, args.terminals, args.pool_size, mix,
+                                         args.sessions, args.ops_per_session, args.seed))
+    total = sum(len(samples) for samples in latencies.values())
+    print(f"terminals: {args.terminals} over {args.pool_size} connections")
+    print(f"{'call':<10} {'count':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    for name, samples in latencies.items():
+        print(f"{name:<10} {len(samples):>9} {percentile(samples, 0.50) * 1e3:>9.2f} "
+              f"{percentile(samples, 0.99) * 1e3:>9.2f}")
+    print(f"refused logins: {refused} (card or terminal locked)")
+    print(f"calls/sec: {total / elapsed:,.0f} ({total} calls in {elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
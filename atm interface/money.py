@@ -0,0 +1,28 @@
+PAISE_PER_RUPEE = 100
+
+
+def parse_amount(text):
+    """Parse a rupee amount such as ``"500"`` or ``"12.5"`` into integer paise.
+
+    Raises ``ValueError`` for anything that is not a plain non-negative
+    decimal with at most two fractional digits.
+    """
+    text = text.strip()
+    if text.isdigit():
+        # Keypad input is digits only, so this is the common case
+        return int(text) * PAISE_PER_RUPEE
+    rupees, dot, fraction = text.partition(".")
+    if not dot or len(fraction) > 2 or not (rupees or fraction):
+        raise ValueError(f"invalid amount {text!r}")
+    if (rupees and not rupees.isdigit()) or (fraction and not fraction.isdigit()):
+        raise ValueError(f"invalid amount {text!r}")
+    return int(rupees or 0) * PAISE_PER_RUPEE + int(fraction.ljust(2, "0"))
+
+
+def format_amount(paise, grouping=False):
+    # "1234.50", or "1,234.50" with grouping
+    rupees, paise_part = divmod(abs(paise), PAISE_PER_RUPEE)
+    sign = "-" if paise < 0 else ""
+    if grouping:
+        return f"{sign}{rupees:,}.{paise_part:02d}"
+    return f"{sign}{rupees}.{paise_part:02d}"
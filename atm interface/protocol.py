@@ -0,0 +1,55 @@
+"""Wire format between the ATM switch server and terminal clients.
+
+One request or reply per line, tab separated, UTF-8:
+
+    request:  <id> TAB <op> TAB <arg>...
+    reply:    <id> TAB ok TAB <value>
+              <id> TAB error TAB <exception class> TAB <message>
+
+Request ids are chosen by the client and echoed back, so a connection can
+have many requests in flight and replies may arrive out of order. Amounts
+and balances are integer paise, as everywhere else.
+
+A client opens each connection with ``hello TAB <terminal id>``, which
+names the terminal the switch meters wrong PINs against.
+"""
+from accounts import UnknownAccount
+from ledger import InsufficientBalance, InvalidAmount, LimitExceeded, OPERATIONS, PinLocked, TransactionError
+
+READS = ("ping", "check_pin", "balance")
+WRITES = OPERATIONS
+ERRORS = {cls.__name__: cls for cls in (TransactionError, InvalidAmount, InsufficientBalance, LimitExceeded,
+                                        PinLocked, UnknownAccount, KeyError, ValueError, TypeError)}
+
+
+def _clean(value):
+    return str(value).replace("\t", " ").replace("\n", " ")
+
+
+def encode_request(request_id, op, args):
+    return "\t".join([str(request_id), op, *map(_clean, args)]).encode("utf-8") + b"\n"
+
+
+def decode_request(line):
+    request_id, op, *args = line.decode("utf-8").rstrip("\n").split("\t")
+    return int(request_id), op, args
+
+
+def encode_reply(request_id, value):
+    return f"{request_id}\tok\t{_clean(value)}\n".encode("utf-8")
+
+
+def encode_error(request_id, exc):
+    message = exc.args[0] if exc.args else ""
+    return f"{request_id}\terror\t{type(exc).__name__}\t{_clean(message)}\n".encode("utf-8")
+
+
+def decode_reply(line):
+    """Return ``(request_id, value)``; ``value`` is an exception instance for errors."""
+    if not line.endswith(b"\n"):
+        raise ConnectionError("ledger server closed the connection")
+    request_id, status, *rest = line.decode("utf-8").rstrip("\n").split("\t")
+    if status == "ok":
+        return int(request_id), rest[0]
+    name, message = rest
+    return int(request_id), ERRORS.get(name, TransactionError)(message)
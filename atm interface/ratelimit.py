@@ -0,0 +1,136 @@
+"""Limits on PIN attempts, cheap enough to keep for every card.
+
+``AttemptLimiter`` counts failed attempts per card over a sliding window
+and locks the card once ``limit`` failures fall inside it. ``TokenBuckets``
+meters failures per terminal, so one machine cannot spray guesses across
+many cards. Both are checked before the (deliberately slow) PIN
+hash is computed, so a locked-out attacker costs a dict lookup.
+"""
+import threading
+import time
+
+
+class AttemptLimiter:
+    """Sliding-window count of failures per key, with lockout.
+
+    Counts live in two generations of plain dicts, one per ``window``
+    seconds: the current window and the one before it. A key's estimate is
+    its current count plus the previous count weighted by how much of the
+    previous window still overlaps the sliding window. When a window ends
+    the older dict is dropped whole, so expiry costs nothing per key and
+    memory is bounded by the keys that failed in the last two windows. If a
+    storm fills ``max_keys`` before the window is up, the keys still below
+    the limit are dropped; locked keys are never dropped. Should locked keys
+    alone fill the table, further failures go uncounted until the window
+    ends, and the per-terminal buckets still slow the storm. Successful
+    logins leave no state behind.
+    """
+
+    def __init__(self, limit=5, window=900.0, max_keys=250_000, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._start = clock()
+        self._current = {}
+        self._previous = {}
+        self._full = False  # only locked keys left, until the window ends
+
+    def __len__(self):
+        return len(self._current) + len(self._previous)
+
+    def retry_after(self, key):
+        """Seconds until ``key`` may try again; 0.0 if it may try now."""
+        with self._lock:
+            now = self.clock()
+            self._roll(now)
+            current = self._current.get(key, 0)
+            previous = self._previous.get(key, 0)
+            if not current and not previous:
+                return 0.0
+            elapsed = (now - self._start) / self.window
+            if current + previous * (1 - elapsed) < self.limit:
+                return 0.0
+            if current >= self.limit:
+                # Wait for this window to end and its weight to decay enough
+                return self._start + self.window * (2 - self.limit / current) - now
+            return self._start + self.window * (1 - (self.limit - current) / previous) - now
+
+    def failed(self, key):
+        with self._lock:
+            now = self.clock()
+            self._roll(now)
+            if key not in self._current and len(self) >= self.max_keys:
+                if not self._full:
+                    self._evict(now)
+                if len(self) >= self.max_keys:
+                    self._full = True
+                    return
+            self._current[key] = self._current.get(key, 0) + 1
+
+    def succeeded(self, key):
+        with self._lock:
+            self._current.pop(key, None)
+            self._previous.pop(key, None)
+
+    def _evict(self, now):
+        # Keep only the keys that are locked out now
+        weight = 1 - (now - self._start) / self.window
+        locked = {key for key, count in self._current.items()
+                  if count + self._previous.get(key, 0) * weight >= self.limit}
+        locked.update(key for key, count in self._previous.items() if count * weight >= self.limit)
+        self._current = {key: count for key, count in self._current.items() if key in locked}
+        self._previous = {key: count for key, count in self._previous.items() if key in locked}
+
+    def _roll(self, now):
+        windows = int((now - self._start) // self.window)
+        if windows <= 0:
+            return
+        self._previous = self._current if windows == 1 else {}
+        self._current = {}
+        self._start += windows * self.window
+        self._full = False
+
+
+class TokenBuckets:
+    """Token bucket per key: ``burst`` failures, refilled at ``rate`` a second.
+
+    Only failures spend tokens, so a terminal whose customers type their
+    PINs right is never held up. A bucket left alone long enough to refill
+    is the same as no bucket, so full ones are swept out every
+    ``burst / rate`` seconds.
+    """
+
+    def __init__(self, rate=0.2, burst=10, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, time of last update)
+        self._swept = clock()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def retry_after(self, key):
+        """Seconds until ``key`` has a token again; 0.0 if it has one now."""
+        with self._lock:
+            tokens = self._tokens(key, self.clock())
+            return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+    def spend(self, key):
+        with self._lock:
+            now = self.clock()
+            refill = self.burst / self.rate
+            if now - self._swept >= refill:
+                self._buckets = {k: v for k, v in self._buckets.items() if now - v[1] < refill}
+                self._swept = now
+            self._buckets[key] = (max(0.0, self._tokens(key, now) - 1), now)
+
+    def _tokens(self, key, now):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return self.burst
+        tokens, stamp = bucket
+        return min(self.burst, tokens + (now - stamp) * self.rate)
@@ -0,0 +1,30 @@
+import tkinter as tk
+
+
+class ScreenCache:
+    """Builds each screen frame once and swaps between them on navigation.
+
+    ``show(name, build)`` creates the frame and calls ``build(frame)`` the
+    first time a screen is requested; afterwards the same frame is simply
+    re-packed, so callers only need to reset whatever state the screen
+    shows (entries, displays, labels).
+    """
+
+    def __init__(self, container, **frame_options):
+        self.container = container
+        self.frame_options = frame_options
+        self.frames = {}
+        self.current = None
+
+    def show(self, name, build, **pack_options):
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = tk.Frame(self.container, **self.frame_options)
+            build(frame)
+            self.frames[name] = frame
+        if frame is not self.current:
+            if self.current is not None:
+                self.current.pack_forget()
+            frame.pack(**(pack_options or {"expand": True}))
+            self.current = frame
+        return frame
@@ -0,0 +1,214 @@
+"""ATM switch: one process that owns the accounts and the journal.
+
+Terminals connect over TCP or a Unix socket and speak the line protocol in
+``protocol``. Requests are applied to the ledger in arrival order on the
+event loop; reads are answered at once, while writes are answered only
+after the journal batch holding them has been fsynced. A connection can
+therefore keep many requests in flight, and a slow fsync never stalls
+other terminals. With ``--shards N`` the accounts are spread over N
+ledger processes (see ``shards``) and every request is forwarded to them.
+Wrong PINs are limited per card and per terminal by the ledger; a
+terminal names itself in the first request on each connection (see
+``protocol``), and each host may name only ``--terminals-per-host`` of them.
+
+    python server.py --listen 127.0.0.1:7070
+    python server.py --listen /tmp/atm.sock --shards 4
+"""
+import argparse
+import asyncio
+import collections
+import signal
+
+from ledger import OPERATIONS, TransactionError, open_ledger
+from protocol import READS, decode_request, encode_error, encode_reply
+from ratelimit import TokenBuckets
+from shards import ShardedLedger
+
+
+class LedgerServer:
+    def __init__(self, ledger, terminals_per_host=16):
+        self.ledger = ledger
+        self.sharded = isinstance(ledger, ShardedLedger)
+        self.terminals_per_host = terminals_per_host
+        self.connections = 0
+        self._named = collections.defaultdict(set)  # host -> terminal ids it has said hello as
+        self._waiters = collections.deque()  # (journal sequence number, future), in order
+        self._loop = None
+
+    async def start(self, address):
+        self._loop = asyncio.get_running_loop()
+        journal = getattr(self.ledger, "journal", None)
+        if journal is not None:
+            journal.on_durable = lambda seq: self._loop.call_soon_threadsafe(self._durable, seq)
+        if ":" in address:
+            host, port = address.rsplit(":", 1)
+            return await asyncio.start_server(self.handle, host, int(port))
+        return await asyncio.start_unix_server(self.handle, address)
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        peer = writer.get_extra_info("peername")
+        host = terminal = peer[0] if isinstance(peer, tuple) else "local"  # Unix socket: same machine
+        try:
+            line = await reader.readline()
+            named = self.hello(line, writer, host)
+            if named is not None:
+                terminal = named
+                line = await reader.readline()
+            while line:
+                self.execute(line, writer, terminal)
+                if writer.transport.get_write_buffer_size() > 65536:
+                    await writer.drain()
+                line = await reader.readline()
+        except ConnectionError:
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def hello(self, line, writer, host):
+        # The terminal a connection speaks for, if its first request names
+        # one. The host stays in the key, so a client cannot spend the
+        # budget of a terminal on another machine; clients that skip the
+        # handshake share their host's budget. So do the names a host makes up
+        # past its quota, or every hello would bring a fresh bucket
+        try:
+            request_id, op, args = decode_request(line)
+        except ValueError:
+            return None
+        if op != "hello" or len(args) != 1 or not args[0]:
+            return None
+        writer.write(encode_reply(request_id, "ok"))
+        names = self._named[host]
+        if args[0] not in names:
+            if len(names) >= self.terminals_per_host:
+                return host
+            names.add(args[0])
+        return f"{host}/{args[0]}"
+
+    def execute(self, line, writer, terminal=None):
+        request_id = 0
+        try:
+            request_id, op, args = decode_request(line)
+            if op == "check_pin":
+                self.check_pin(request_id, args, writer, terminal)
+                return
+            if self.sharded:
+                self.forward(request_id, op, args, writer)
+                return
+            result = self.dispatch(op, args)
+        except (TransactionError, KeyError, ValueError, TypeError, IndexError) as exc:
+            writer.write(encode_error(request_id, exc))
+            return
+        if op in OPERATIONS:
+            self.durable().add_done_callback(
+                lambda _: writer.is_closing() or writer.write(encode_reply(request_id, result)))
+        else:
+            writer.write(encode_reply(request_id, result))
+
+    def check_pin(self, request_id, args, writer, terminal):
+        account, pin = args[:2]  # the terminal is the connection's, whatever the request says
+        if self.sharded:
+            future = self.ledger.call_async("check_pin", account, pin, terminal)
+            future.add_done_callback(
+                lambda future: self._loop.call_soon_threadsafe(self._reply, writer, request_id, future))
+        else:
+            # The PIN hash takes tens of milliseconds; keep it off the loop
+            self._loop.run_in_executor(None, self.ledger.check_pin, account, pin, terminal).add_done_callback(
+                lambda future: self._reply(writer, request_id, future))
+
+    def forward(self, request_id, op, args, writer):
+        # Only what dispatch() answers; the shards' own verbs (holds, credits,
+        # PIN hashes) stay on the coordinator's pipes
+        if op in OPERATIONS:
+            args = posting_args(op, args)
+        elif op not in READS:
+            raise TransactionError(f"unknown operation {op!r}")
+        # Shards fsync before they reply, so the answer can go straight out
+        self.ledger.call_async(op, *args).add_done_callback(
+            lambda future: self._loop.call_soon_threadsafe(self._reply, writer, request_id, future))
+
+    def _reply(self, writer, request_id, future):
+        if writer.is_closing():
+            return
+        exc = future.exception()
+        if exc is not None:
+            writer.write(encode_error(request_id, exc))
+        else:
+            result = future.result()
+            writer.write(encode_reply(request_id, int(result) if isinstance(result, bool) else result))
+
+    def dispatch(self, op, args):
+        ledger = self.ledger
+        if op == "balance":
+            return ledger.balance(*args)
+        if op == "check_pin":
+            return int(ledger.check_pin(*args))
+        if op == "ping":
+            return "pong"
+        if op in OPERATIONS:
+            return ledger.post(op, *posting_args(op, args))
+        raise TransactionError(f"unknown operation {op!r}")
+
+    def durable(self):
+        # Future resolved once everything appended so far is on disk
+        future = self._loop.create_future()
+        journal = self.ledger.journal
+        if journal is None or journal.durable >= journal.appended:
+            future.set_result(None)
+        else:
+            self._waiters.append((journal.appended, future))
+        return future
+
+    def _durable(self, seq):
+        waiters = self._waiters
+        while waiters and waiters[0][0] <= seq:
+            waiters.popleft()[1].set_result(None)
+
+
+def posting_args(op, args):
+    # account, amount[, counterparty] and nothing more: any further field
+    # would reach Ledger.post as its timestamp
+    if not 2 <= len(args) <= 3:
+        raise TransactionError(f"{op} takes an account, an amount and an optional counterparty")
+    return [args[0], int(args[1]), *args[2:]]
+
+
+async def serve(address, shards=0, login_rate=0.2, login_burst=10, terminals_per_host=16):
+    # Wrong PINs each terminal may send: a burst, then one per 1/rate seconds
+    terminals = TokenBuckets(login_rate, login_burst)
+    if shards:
+        ledger = ShardedLedger(shards, terminals=terminals)
+    else:
+        ledger = open_ledger(sync_commit=False, terminals=terminals)
+    server = LedgerServer(ledger, terminals_per_host)
+    listener = await server.start(address)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+    try:
+        async with listener:
+            await stop.wait()
+    finally:
+        ledger.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listen", default="127.0.0.1:7070", help="host:port or a Unix socket path")
+    parser.add_argument("--shards", type=int, default=0, help="ledger processes to spread accounts over")
+    parser.add_argument("--login-rate", type=float, default=0.2,
+                        help="wrong PINs per second each terminal earns back")
+    parser.add_argument("--login-burst", type=int, default=10, help="wrong PINs a terminal may send at once")
+    parser.add_argument("--terminals-per-host", type=int, default=16,
+                        help="terminal ids one host may meter separately; the rest share the host's budget")
+    args = parser.parse_args(argv)
+    asyncio.run(serve(args.listen, args.shards, args.login_rate, args.login_burst, args.terminals_per_host))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""End-of-day settlement: post a whole transaction file in one pass.
+
+Each row of the file is ``kind,account,amount[,counterparty]`` with the
+amount in rupees as typed at a terminal, e.g. ``withdraw,100001,2500.50``.
+Rows get the same checks the terminals make (positive amount with at most
+two decimals, known account, a recipient for transfers and PhonePe, no
+overdraft), but the checks and the posting run with NumPy over whole
+columns instead of one Python call per transaction.
+
+Debits are checked per account in file order against the opening balance
+plus the deposits before them. Credits from transfers between our own
+accounts land after every debit, so money moved inside the batch cannot be
+spent again in the same batch. Accepted rows are journalled in file order,
+then a fresh snapshot is taken. Needs numpy.
+
+    python settle.py eod.csv --rejections rejected.csv
+"""
+import argparse
+import csv
+import time
+
+import numpy as np
+
+from accounts import EMPTY, _MULTIPLIER, _key
+from ledger import DEBITS, open_ledger
+from money import parse_amount
+
+KINDS = ("deposit",) + DEBITS
+DEPOSIT, WITHDRAW, TRANSFER, PHONEPE = range(len(KINDS))
+REASONS = ("posted", "invalid amount", "unknown operation", "unknown account",
+           "missing recipient", "insufficient balance")
+OK, INVALID_AMOUNT, UNKNOWN_OPERATION, UNKNOWN_ACCOUNT, MISSING_RECIPIENT, INSUFFICIENT = range(len(REASONS))
+VECTOR_ROUNDS = 32  # accounts still overdrawn after this many rounds are walked row by row
+CHUNK = 65536       # rows per byte matrix when parsing columns
+
+
+class Batch:
+    """A transaction file loaded into columns, one entry per row."""
+
+    def __init__(self, lines, kinds, accounts, amounts, counterparties):
+        self.lines = lines                    # source line numbers, for the report
+        self.kinds = np.array(kinds, dtype=np.int8)
+        self.accounts = accounts
+        self.amount_text = amounts            # as written in the file
+        self.amounts = _column(amounts, _parse_amounts, 15, _paise)
+        self.counterparties = counterparties
+        self.reasons = np.zeros(len(lines), dtype=np.int8)
+
+    def __len__(self):
+        return len(self.lines)
+
+
+def load_batch(path):
+    kind_codes = {kind: code for code, kind in enumerate(KINDS)}
+    lines, rows = [], []
+    with open(path, newline="", encoding="utf-8") as f:
+        for line, row in enumerate(csv.reader(f), 1):
+            if row and row[0] != "kind" and not row[0].startswith("#"):
+                lines.append(line)
+                rows.append(row if len(row) >= 4 else (row + ["", "", ""])[:4])
+    return Batch(lines,
+                 [kind_codes.get(row[0].strip(), -1) for row in rows],
+                 [row[1].strip() for row in rows],
+                 [row[2].strip() for row in rows],
+                 [row[3].strip() for row in rows])
+
+
+def settle(ledger, batch):
+    """Validate and post ``batch`` on ``ledger``; fills ``batch.reasons``."""
+    with ledger.exclusive():
+        _post(ledger.accounts, batch)
+        accepted = np.flatnonzero(batch.reasons == OK)
+        records = [(KINDS[batch.kinds[i]], batch.accounts[i], int(batch.amounts[i]), batch.counterparties[i])
+                   for i in accepted.tolist()]
+        now = time.time()
+        ledger.emit_many(now, records)
+        seq = 0
+        if ledger.journal is not None:
+            seq = ledger.journal.append_many(records, now)
+    if seq:
+        ledger.journal.wait_for(seq)
+        ledger.snapshot()
+    return batch
+
+
+def _post(accounts, batch):
+    # NumPy views straight onto the account table's arrays; they must not
+    # outlive this call or the table could no longer grow
+    _, _, balances, table_keys, table_slots = accounts.state()
+    balances = np.frombuffer(balances, dtype=np.int64)
+    table = (np.frombuffer(table_keys, dtype=np.int64), np.frombuffer(table_slots, dtype=np.int64))
+
+    kinds, amounts, reasons = batch.kinds, batch.amounts, batch.reasons
+    slots = _lookup(table, _keys(batch.accounts))
+    has_recipient = np.array([bool(c) for c in batch.counterparties], dtype=bool)
+    reasons[((kinds == TRANSFER) | (kinds == PHONEPE)) & ~has_recipient] = MISSING_RECIPIENT
+    reasons[slots < 0] = UNKNOWN_ACCOUNT
+    reasons[amounts <= 0] = INVALID_AMOUNT
+    reasons[kinds < 0] = UNKNOWN_OPERATION
+
+    delta = np.where(kinds == DEPOSIT, amounts, -amounts)
+    delta[reasons != OK] = 0
+    _reject_overdrafts(balances, slots, delta, reasons)
+
+    accepted = reasons == OK
+    np.add.at(balances, slots[accepted], delta[accepted])
+    # Transfers to our own accounts are credited after every debit
+    transfers = np.flatnonzero(accepted & (kinds == TRANSFER))
+    if transfers.size:
+        recipients = _lookup(table, _keys([batch.counterparties[i] for i in transfers.tolist()]))
+        internal = recipients >= 0
+        np.add.at(balances, recipients[internal], amounts[transfers[internal]])
+
+
+def _reject_overdrafts(balances, slots, delta, reasons):
+    # Group the candidate rows by account, keeping file order inside each
+    # group, and compute every running balance with one cumulative sum.
+    # Rejecting the first overdraft in an account raises the balances after
+    # it, so repeat on what follows it, with the rows before it folded into
+    # the opening balance, until no account is overdrawn.
+    opening = balances.copy()
+    candidates = np.flatnonzero(delta)
+    order = candidates[np.argsort(slots[candidates], kind="stable")]
+    for _ in range(VECTOR_ROUNDS):
+        if not order.size:
+            return
+        s, d = slots[order], delta[order]
+        boundary = np.empty(len(s), dtype=bool)
+        boundary[0] = True
+        np.not_equal(s[1:], s[:-1], out=boundary[1:])
+        group = np.cumsum(boundary) - 1
+        total = np.cumsum(d)
+        starts = np.flatnonzero(boundary)
+        running = opening[s] + total - (total[starts] - d[starts])[group]
+        overdrawn = np.flatnonzero((running < 0) & (d < 0))
+        if not overdrawn.size:
+            return
+        first = overdrawn[np.r_[True, group[overdrawn[1:]] != group[overdrawn[:-1]]]]
+        rejected = order[first]
+        delta[rejected] = 0
+        reasons[rejected] = INSUFFICIENT
+
+        cut = np.full(len(starts), -1)
+        cut[group[first]] = first
+        position = np.arange(len(s))
+        settled = position < cut[group]
+        np.add.at(opening, s[settled], d[settled])
+        order = order[position > np.where(cut >= 0, cut, len(s))[group]]
+
+    # Pathological accounts with many overdrafts: finish them row by row
+    balance = None
+    previous = EMPTY
+    for row in order.tolist():
+        slot = int(slots[row])
+        if slot != previous:
+            balance, previous = int(opening[slot]), slot
+        change = int(delta[row])
+        if balance + change < 0:
+            delta[row] = 0
+            reasons[row] = INSUFFICIENT
+        else:
+            balance += change
+
+
+def _lookup(table, keys):
+    # The AccountStore hash probe, run for every key at once
+    table_keys, table_slots = table
+    mask = len(table_keys) - 1
+    slots = np.full(len(keys), EMPTY, dtype=np.int64)
+    pending = np.flatnonzero(keys != EMPTY)
+    index = ((keys[pending].astype(np.uint64) * np.uint64(_MULTIPLIER)) >> np.uint64(20)).astype(np.int64) & mask
+    while pending.size:
+        found = table_keys[index]
+        hit = found == keys[pending]
+        slots[pending[hit]] = table_slots[index[hit]]
+        probing = ~hit & (found != EMPTY)
+        pending = pending[probing]
+        index = (index[probing] + 1) & mask
+    return slots
+
+
+def _keys(account_ids):
+    return _column(account_ids, _parse_keys, 18, _account_key)
+
+
+def _column(texts, parse, width, fallback):
+    # Parse a column of short ASCII strings as byte matrices, CHUNK rows at
+    # a time; anything longer or non-ASCII goes through ``fallback``
+    odd = []
+    if not "".join(texts).isascii() or max(map(len, texts), default=0) > width:
+        odd = [i for i, text in enumerate(texts) if len(text) > width or not text.isascii()]
+    clean = texts
+    if odd:
+        clean = list(texts)
+        for i in odd:
+            clean[i] = ""
+    values = np.empty(len(texts), dtype=np.int64)
+    for start in range(0, len(texts), CHUNK):
+        chunk = clean[start:start + CHUNK]
+        values[start:start + len(chunk)] = parse(np.array(chunk, dtype=f"S{width}"))
+    for i in odd:
+        values[i] = fallback(texts[i])
+    return values
+
+
+def _digits(raw):
+    # (n, width) digit values, string lengths and a digit mask from an "S" array
+    matrix = raw.view(np.uint8).reshape(len(raw), raw.dtype.itemsize)
+    columns = np.arange(matrix.shape[1])
+    length = np.where(matrix == 0, columns, matrix.shape[1]).min(axis=1)
+    inside = columns < length[:, None]
+    is_digit = (matrix >= ord("0")) & (matrix <= ord("9")) & inside
+    return matrix, columns, length, inside, is_digit
+
+
+def _parse_amounts(raw):
+    # parse_amount() for every row at once; -1 marks an invalid amount
+    matrix, columns, length, inside, is_digit = _digits(raw)
+    is_dot = matrix == ord(".")
+    dot = np.where(is_dot & inside, columns, matrix.shape[1]).min(axis=1)
+    has_dot = dot < length
+    dot = np.minimum(dot, length)
+    valid = (~inside | is_digit | (columns == dot[:, None])).all(axis=1)
+    valid &= np.where(has_dot, length - dot - 1, 0) <= 2
+    valid &= length > has_dot
+    exponent = np.where(columns < dot[:, None], dot[:, None] + 1 - columns, dot[:, None] + 2 - columns)
+    digits = np.where(is_digit, matrix - ord("0"), 0).astype(np.int64)
+    paise = (digits * 10 ** np.where(is_digit, np.maximum(exponent, 0), 0)).sum(axis=1)
+    return np.where(valid, paise, -1)
+
+
+def _parse_keys(raw):
+    # accounts._key() for every row at once; EMPTY marks an invalid id
+    matrix, columns, length, inside, is_digit = _digits(raw)
+    valid = (is_digit == inside).all(axis=1) & (length > 0)
+    digits = np.where(is_digit, matrix - ord("0"), 0).astype(np.int64)
+    value = (digits * 10 ** np.where(is_digit, length[:, None] - 1 - columns, 0)).sum(axis=1)
+    return np.where(valid, 10 ** length + value, EMPTY)
+
+
+def _paise(text):
+    try:
+        return parse_amount(text)
+    except ValueError:
+        return -1
+
+
+def _account_key(account):
+    try:
+        return _key(account)
+    except ValueError:
+        return EMPTY
+
+
+def write_report(path, batch):
+    rejected = np.flatnonzero(batch.reasons != OK).tolist()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(("line", "kind", "account", "amount", "counterparty", "reason"))
+        for i in rejected:
+            kind = KINDS[batch.kinds[i]] if batch.kinds[i] >= 0 else "?"
+            writer.writerow((batch.lines[i], kind, batch.accounts[i], batch.amount_text[i],
+                             batch.counterparties[i], REASONS[batch.reasons[i]]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", help="transaction file to post")
+    parser.add_argument("--rejections", help="write rejected rows and the reason to this CSV")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    batch = load_batch(args.file)
+    loaded = time.perf_counter()
+    ledger = open_ledger()
+    try:
+        settle(ledger, batch)
+    finally:
+        ledger.close()
+    elapsed = time.perf_counter() - loaded
+
+    counts = np.bincount(batch.reasons, minlength=len(REASONS))
+    for reason, count in zip(REASONS, counts.tolist()):
+        if count:
+            print(f"{reason:<22} {count:>10}")
+    print(f"{len(batch)} rows: loaded in {loaded - started:.2f}s, settled in {elapsed:.2f}s")
+    if args.rejections:
+        write_report(args.rejections, batch)
+
+
+if __name__ == "__main__":
+    main()
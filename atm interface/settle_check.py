@@ -0,0 +1,145 @@
+"""Check batch settlement against a plain sequential reference.
+
+Writes a random transaction file, with bad amounts, unknown accounts,
+missing recipients and overdrafts mixed in, and settles it with ``settle``
+on a fresh ledger in a temporary directory. The same rows are then walked
+one at a time in plain Python under the batch rules (debits in file order,
+credits between our own accounts after every debit). The balances, the
+reason given for every row, and the ledger reopened from its journal alone
+must all agree with the walk; the exit status is 1 if they do not. Needs
+numpy.
+
+    python settle_check.py --rows 200000 --accounts 5000
+    python settle_check.py --vector-rounds 1    # exercise the row-by-row fallback
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import settle
+from credentials import hash_pin
+from ledger import open_ledger
+from money import parse_amount
+from settle import (INSUFFICIENT, INVALID_AMOUNT, KINDS, MISSING_RECIPIENT, OK, REASONS, UNKNOWN_ACCOUNT,
+                    UNKNOWN_OPERATION)
+
+FIRST_CARD = 700000
+
+
+def write_rows(path, rng, accounts, rows):
+    # Mostly valid rows, plus a trickle of every kind of bad one
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("kind,account,amount,counterparty\n")
+        for _ in range(rows):
+            kind = rng.choice(("deposit", "withdraw", "withdraw", "transfer", "phonepe"))
+            if rng.random() < 0.001:
+                kind = "refund"
+            account = rng.choice(accounts)
+            if rng.random() < 0.002:
+                account = rng.choice(("999", "12a4", ""))
+            amount = f"{rng.randrange(1, 3000)}.{rng.randrange(100):02d}"
+            if rng.random() < 0.002:
+                amount = rng.choice(("-5", "0", "1.234", "abc", ""))
+            counterparty = ""
+            if kind == "transfer":
+                counterparty = rng.choice(accounts) if rng.random() < 0.9 else "555555555"
+            elif kind == "phonepe":
+                counterparty = "98%08d" % rng.randrange(10 ** 8)
+            if rng.random() < 0.001:
+                counterparty = ""
+            f.write(f"{kind},{account},{amount},{counterparty}\n")
+
+
+def reference(batch, opening):
+    """Balances and per-row reasons from posting ``batch`` one row at a time."""
+    balances = dict(opening)
+    reasons = []
+    credits = []
+    for kind, account, text, counterparty in zip(batch.kinds.tolist(), batch.accounts, batch.amount_text,
+                                                 batch.counterparties):
+        try:
+            amount = parse_amount(text)
+        except ValueError:
+            amount = 0
+        if kind < 0:
+            reason = UNKNOWN_OPERATION
+        elif amount <= 0:
+            reason = INVALID_AMOUNT
+        elif account not in balances:
+            reason = UNKNOWN_ACCOUNT
+        elif KINDS[kind] in ("transfer", "phonepe") and not counterparty:
+            reason = MISSING_RECIPIENT
+        elif KINDS[kind] != "deposit" and amount > balances[account]:
+            reason = INSUFFICIENT
+        else:
+            reason = OK
+            if KINDS[kind] == "deposit":
+                balances[account] += amount
+            else:
+                balances[account] -= amount
+                if KINDS[kind] == "transfer" and counterparty in balances:
+                    credits.append((counterparty, amount))
+        reasons.append(reason)
+    for account, amount in credits:
+        balances[account] += amount
+    return balances, reasons
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--accounts", type=int, default=2000)
+    parser.add_argument("--vector-rounds", type=int, default=settle.VECTOR_ROUNDS,
+                        help="overdraft rounds done with NumPy before the row-by-row fallback")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    settle.VECTOR_ROUNDS = args.vector_rounds
+    rng = random.Random(args.seed)
+    tmpdir = tempfile.mkdtemp(prefix="atm-settle-")
+    log_path, snapshot_path = os.path.join(tmpdir, "transactions.log"), os.path.join(tmpdir, "balance.txt")
+    try:
+        accounts = [str(FIRST_CARD + i) for i in range(args.accounts)]
+        ledger = open_ledger(log_path, snapshot_path, demo_accounts=())
+        pin_hash = hash_pin("1234", 4).hex()  # one salt for every card keeps setup fast
+        for account in accounts:
+            ledger.post("open", account, rng.randrange(0, 200000), pin_hash)
+        opening = {account: ledger.balance(account) for account in accounts}
+
+        path = os.path.join(tmpdir, "eod.csv")
+        write_rows(path, rng, accounts, args.rows)
+        batch = settle.load_batch(path)
+        try:
+            settle.settle(ledger, batch)
+        finally:
+            ledger.close()
+        balances, reasons = reference(batch, opening)
+
+        failures = 0
+        wrong = [i for i, reason in enumerate(reasons) if batch.reasons[i] != reason]
+        for i in wrong[:10]:
+            print(f"line {batch.lines[i]}: settle says {REASONS[batch.reasons[i]]}, "
+                  f"reference says {REASONS[reasons[i]]}")
+        failures += len(wrong)
+        os.remove(snapshot_path)  # reopen from the journal alone
+        ledger = open_ledger(log_path, snapshot_path, demo_accounts=())
+        try:
+            off = [account for account in accounts if ledger.balance(account) != balances[account]]
+        finally:
+            ledger.close()
+        for account in off[:10]:
+            print(f"account {account}: reference balance {balances[account]}")
+        failures += len(off)
+
+        print(f"{len(batch)} rows, {reasons.count(OK)} posted, {args.accounts} accounts: "
+              f"{len(wrong)} reasons and {len(off)} balances differ from the reference")
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
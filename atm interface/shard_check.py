@@ -0,0 +1,146 @@
+"""Check that two-phase transfers between shards conserve money across crashes.
+
+Starts a ``ShardedLedger`` on a temporary data directory and fires
+concurrent transfers between accounts on different shards, including
+refused ones and payments out of the bank. Money must be conserved, with
+only the outgoing payments leaving the total. It then leaves behind what a
+crash would, one case per restart:
+
+- a hold that was never committed, which must be released;
+- a committed transfer that was never credited, which must be finished;
+- a committed transfer that was credited but not settled, which must not
+  be credited twice.
+
+After each restart the total must still add up. Last, the shard snapshots
+must have forgotten the credits below the coordinator's watermark. The
+exit status is 1 if any check fails.
+
+    python shard_check.py --shards 4 --transfers 5000
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+
+from ledger import InsufficientBalance, LimitExceeded
+from shards import ShardedLedger, shard_of
+from snapshot import read_snapshot
+
+FIRST_CARD = 600000
+OUTSIDE = "999999999"  # an account at another bank
+
+
+def total(ledger, accounts):
+    return sum(ledger.balance(account) for account in accounts)
+
+
+def transfer_storm(ledger, accounts, transfers, threads, seed):
+    # Returns the paise paid out of the bank
+    paid_out = []
+
+    def run(rng, count):
+        out = 0
+        for _ in range(count):
+            account = rng.choice(accounts)
+            recipient = OUTSIDE if rng.random() < 0.02 else rng.choice(accounts)
+            amount = rng.randrange(1, 10 ** 6)
+            try:
+                ledger.transfer(account, amount, recipient)
+            except (InsufficientBalance, LimitExceeded):
+                continue
+            if recipient == OUTSIDE:
+                out += amount
+        paid_out.append(out)
+
+    rng = random.Random(seed)
+    workers = [threading.Thread(target=run, args=(random.Random(rng.random()), transfers // threads))
+               for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return sum(paid_out)
+
+
+def crash_case(name, data_dir, shards, accounts, expected, leave_behind):
+    """Leave a half-done transfer behind, restart and check the total."""
+    ledger = ShardedLedger(shards, data_dir, demo_accounts=accounts)
+    try:
+        leave_behind(ledger)
+    finally:
+        ledger.close()
+    ledger = ShardedLedger(shards, data_dir, demo_accounts=accounts)
+    try:
+        found = total(ledger, [account for account, _ in accounts])  # source included
+    finally:
+        ledger.close()
+    ok = found == expected
+    print(f"{name:<34} {'ok' if ok else f'total {found}, expected {expected}'}")
+    return ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--shards", type=int, default=4)
+    parser.add_argument("--accounts", type=int, default=40)
+    parser.add_argument("--transfers", type=int, default=4800)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    data_dir = tempfile.mkdtemp(prefix="atm-shards-")
+    accounts = [(str(FIRST_CARD + i), "1234") for i in range(args.accounts + 1)]
+    ids = [account for account, _ in accounts]
+    # The crash cases start from an account the storm left under its daily limits
+    source = ids.pop()
+    recipient = next(account for account in ids if shard_of(account, args.shards) != shard_of(source, args.shards))
+    results = []
+    try:
+        ledger = ShardedLedger(args.shards, data_dir, demo_accounts=accounts)
+        try:
+            before = total(ledger, ids)
+            paid_out = transfer_storm(ledger, ids, args.transfers, args.threads, args.seed)
+            after = total(ledger, ids)
+            expected = after + ledger.balance(source)  # what every restart must keep
+        finally:
+            ledger.close()
+        results.append(after == before - paid_out)
+        print(f"{args.transfers} transfers over {args.shards} shards"
+              f"{'':<7} {'ok' if results[-1] else f'total {after}, expected {before - paid_out}'}")
+
+        def hold_only(ledger):
+            ledger.shard(source).call("hold", source, 777, f"{ledger._next_txid}:{recipient}")
+
+        def committed_only(ledger):
+            txid = str(ledger._next_txid)
+            ledger.shard(source).call("hold", source, 888, f"{txid}:{recipient}")
+            ledger._log.append("commit", source, 888, f"{txid}:{recipient}")
+
+        def credited_only(ledger):
+            txid = str(ledger._next_txid)
+            ledger.shard(source).call("hold", source, 999, f"{txid}:{recipient}")
+            ledger._log.append("commit", source, 999, f"{txid}:{recipient}")
+            ledger.shard(recipient).call("credit", recipient, 999, txid)
+
+        results.append(crash_case("hold never committed", data_dir, args.shards, accounts, expected, hold_only))
+        results.append(crash_case("committed, never credited", data_dir, args.shards, accounts, expected,
+                                  committed_only))
+        results.append(crash_case("credited, never settled", data_dir, args.shards, accounts, expected,
+                                  credited_only))
+
+        remembered = 0
+        for index in range(args.shards):
+            _, arrays = read_snapshot(os.path.join(data_dir, f"shard{index}-balance.txt"))
+            remembered += sum(1 for txid in arrays[-1] if txid >= 0)
+        results.append(remembered <= args.threads * 2)
+        print(f"credits remembered by the shards{'':<3} {remembered}")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""Account space partitioned across worker processes.
+
+Each shard is a separate process owning the accounts whose id hashes to it,
+with its own journal and snapshot in the data directory, so postings to
+different shards run on different cores. ``ShardedLedger`` is the
+coordinator: it routes each call to the owning shard and runs transfers
+between shards as a two-phase commit:
+
+1. prepare: the source shard places a hold on the funds (debit plus a
+   journalled hold record) while the target shard confirms the recipient;
+2. the decision is made durable in ``coordinator.log``;
+3. commit: the target credits the recipient and the source settles the
+   hold. Both steps are idempotent by transaction id.
+
+Every credit also carries the coordinator's watermark, the lowest
+transaction id still in flight. Everything below it has finished, so its
+credit is never sent again and the shard can forget it.
+
+On start-up, committed-but-unfinished transfers are driven to completion
+and any other hold left by a crash is released. The shard count is part of
+the data layout; changing it needs the data directory rebuilt.
+"""
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+import zlib
+from array import array
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config import DATA_DIR
+from credentials import verify_pin
+from journal import Journal, replay
+from ledger import DEMO_ACCOUNTS, InsufficientBalance, Ledger, PinLocked, TransactionError, open_ledger
+from ratelimit import AttemptLimiter, TokenBuckets
+
+
+def shard_of(account, shards):
+    # Stable across processes, unlike hash(); card numbers are sequential,
+    # so hashing spreads them where plain id ranges would not
+    return zlib.crc32(account.encode("utf-8")) % shards
+
+
+class ShardLedger(Ledger):
+    """One shard's ledger, plus the participant side of two-phase transfers.
+
+    Adds four posting kinds, each carrying the transaction id in the
+    counterparty field: ``hold`` (debit into a hold), ``settle`` (drop the
+    hold, the money has left), ``release`` (return the held funds) and
+    ``credit`` (pay in a transfer from another shard). A hold's field is
+    ``txid:recipient`` and a credit's ``txid:watermark``; the hold is checked
+    against and counted in the daily transfer limits. Holds, the ids
+    credited at or above the watermark and the watermark itself go into the
+    snapshot with the account table.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.holds = {}       # txid -> (account, amount)
+        self.credited = set()
+        self.credited_below = 0  # every credit below this id has been paid
+
+    def execute(self, op, args):
+        if op == "pin_hash":
+            return self.accounts.pin_hash(*args)
+        if op == "balance":
+            return self.balance(*args)
+        if op == "has_account":
+            return args[0] in self.accounts
+        if op == "holds":
+            return [(txid, account, amount) for txid, (account, amount) in self.holds.items()]
+        return self.post(op, *args)
+
+    def state(self):
+        accounts = self.accounts
+        holds = self.holds.items()
+        return super().state() + [
+            array("q", [int(txid) for txid, _ in holds]),
+            array("q", [accounts.slot(account) for _, (account, _) in holds]),
+            array("q", [amount for _, (_, amount) in holds]),
+            # The watermark rides along as its one's complement, the only
+            # negative entry, so snapshots from before it still read
+            array("q", [~self.credited_below, *self._prune_credited()]),
+        ]
+
+    def restore(self, arrays):
+        super().restore(arrays[:-4])
+        txids, slots, amounts, credited = arrays[-4:]
+        account_id = self.accounts.account_id
+        self.holds = {str(txid): (account_id(slot), amount) for txid, slot, amount in zip(txids, slots, amounts)}
+        self.credited = {txid for txid in credited if txid >= 0}
+        self.credited_below = max((~txid for txid in credited if txid < 0), default=0)
+
+    def _apply(self, kind, account, amount, txid):
+        balances = self.accounts.balances
+        if kind == "hold":
+            slot = self.accounts.slot(account)
+            txid, _, recipient = txid.partition(":")  # no recipient in journals from before limits
+            if txid not in self.holds:
+                if amount > balances[slot]:
+                    raise InsufficientBalance(amount)
+                self._check_limits("transfer", account, amount, recipient)
+                balances[slot] -= amount
+                self.holds[txid] = (account, amount)
+            return balances[slot]
+        if kind in ("settle", "release"):
+            slot = self.accounts.slot(account)
+            held = self.holds.pop(txid, None)
+            if held is not None and kind == "release":
+                balances[slot] += held[1]
+            return balances[slot]
+        if kind == "credit":
+            slot = self.accounts.slot(account)
+            txid, _, watermark = txid.partition(":")  # no watermark in older journals
+            txid = int(txid)
+            self.credited_below = max(self.credited_below, int(watermark or 0))
+            if txid >= self.credited_below and txid not in self.credited:
+                balances[slot] += amount
+                self.credited.add(txid)
+            return balances[slot]
+        return super()._apply(kind, account, amount, txid)
+
+    def _prune_credited(self):
+        below = self.credited_below
+        self.credited = {txid for txid in self.credited if txid >= below}
+        return self.credited
+
+    def _emit(self, timestamp, kind, account, amount, counterparty):
+        if kind == "hold":
+            # The debit side of a transfer to another shard
+            _, _, recipient = counterparty.partition(":")
+            self.limits.count("transfer", account, amount, recipient, timestamp)
+            return
+        super()._emit(timestamp, kind, account, amount, counterparty)
+
+
+def run_shard(conn, index, shards, data_dir, demo_accounts):
+    # Ctrl+C and service stops reach the whole process group; leave the
+    # shutdown to the coordinator so queued work is flushed and replied to
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    ledger = open_ledger(os.path.join(data_dir, f"shard{index}-transactions.log"),
+                         os.path.join(data_dir, f"shard{index}-balance.txt"),
+                         demo_accounts=[a for a in demo_accounts if shard_of(a[0], shards) == index],
+                         sync_commit=False, ledger_class=ShardLedger)
+    try:
+        while True:
+            # Take everything queued, apply it, then one fsync acknowledges
+            # the whole batch
+            batch = [conn.recv()]
+            while conn.poll():
+                batch.append(conn.recv())
+            replies = []
+            for message in batch:
+                if message is None:
+                    break
+                request_id, op, args = message
+                try:
+                    replies.append((request_id, ledger.execute(op, args), None))
+                except (TransactionError, KeyError, ValueError, TypeError) as exc:
+                    replies.append((request_id, None, exc))
+            ledger.journal.sync()
+            conn.send(replies)
+            if message is None:
+                return
+    finally:
+        ledger.close()
+
+
+class Shard:
+    """Coordinator-side handle on one shard process; ``submit`` returns a future."""
+
+    def __init__(self, context, index, shards, data_dir, demo_accounts):
+        self.conn, child = context.Pipe()
+        self.process = context.Process(target=run_shard, name=f"ledger-shard-{index}", daemon=True,
+                                       args=(child, index, shards, data_dir, demo_accounts))
+        self.process.start()
+        child.close()
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._ids = itertools.count(1)
+        self._reader = threading.Thread(target=self._read_replies, name=f"shard-{index}-replies", daemon=True)
+        self._reader.start()
+
+    def submit(self, op, *args):
+        future = Future()
+        with self._lock:
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self.conn.send((request_id, op, args))
+        return future
+
+    def call(self, op, *args):
+        return self.submit(op, *args).result()
+
+    def close(self):
+        with self._lock:
+            self.conn.send(None)
+        self._reader.join()
+        self.process.join()
+
+    def _read_replies(self):
+        try:
+            while True:
+                for request_id, value, error in self.conn.recv():
+                    future = self._pending.pop(request_id)
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(value)
+        except (EOFError, OSError):
+            pass
+        for future in self._pending.values():
+            future.set_exception(ConnectionError("ledger shard exited"))
+
+
+class ShardedLedger:
+    """Drop-in for ``Ledger`` that spreads the accounts over shard processes.
+
+    The blocking methods mirror ``Ledger``; ``call_async`` returns a future
+    so one thread (the switch server's event loop) can keep many postings
+    in flight across all shards at once. Wrong PINs are counted here, per
+    card and per terminal, for every shard.
+    """
+
+    def __init__(self, shards=None, data_dir=DATA_DIR, demo_accounts=DEMO_ACCOUNTS, coordinators=32,
+                 terminals=None):
+        shards = shards or os.cpu_count() or 1
+        context = multiprocessing.get_context("spawn")
+        self.shards = [Shard(context, i, shards, data_dir, demo_accounts) for i in range(shards)]
+        self._transfers = ThreadPoolExecutor(coordinators, thread_name_prefix="transfer")
+        self._open = set()  # transaction ids handed out and not yet finished
+        self._open_lock = threading.Lock()
+        self._next_txid = 0
+        self._recover(os.path.join(data_dir, "coordinator.log"))
+        self.pin_attempts = AttemptLimiter()
+        self.terminals = terminals if terminals is not None else TokenBuckets()
+
+    def shard(self, account):
+        return self.shards[shard_of(account, len(self.shards))]
+
+    def call_async(self, op, *args):
+        if op == "ping":
+            future = Future()
+            future.set_result("pong")
+            return future
+        if op == "transfer" and len(args) == 3 and args[2] and self.shard(args[2]) is not self.shard(args[0]):
+            return self._transfers.submit(self._transfer, *args)
+        if op == "check_pin":
+            wait = self.pin_attempts.retry_after(args[0])
+            if not wait and len(args) > 2 and args[2] is not None:
+                wait = self.terminals.retry_after(args[2])
+            if wait:
+                # Locked cards are turned away before queueing behind real hashes
+                future = Future()
+                future.set_exception(PinLocked(wait))
+                return future
+            # Hash on a coordinator thread so the shard never stalls on it
+            return self._transfers.submit(self._check_pin, *args)
+        return self.shard(args[0]).submit(op, *args)
+
+    def call(self, op, *args):
+        return self.call_async(op, *args).result()
+
+    def check_pin(self, account, pin, terminal=None):
+        return self.call("check_pin", account, pin, terminal)
+
+    def balance(self, account):
+        return self.call("balance", account)
+
+    def deposit(self, account, amount):
+        return self.post("deposit", account, amount)
+
+    def withdraw(self, account, amount):
+        return self.post("withdraw", account, amount)
+
+    def transfer(self, account, amount, recipient):
+        return self.post("transfer", account, amount, recipient)
+
+    def phonepe(self, account, amount, phone):
+        return self.post("phonepe", account, amount, phone)
+
+    def post(self, kind, account, amount, counterparty=""):
+        return self.call(kind, account, amount, counterparty)
+
+    def close(self):
+        self._transfers.shutdown(wait=True)
+        for shard in self.shards:
+            shard.close()
+        self._log.close()
+
+    def _check_pin(self, account, pin, terminal=None):
+        pin_hash = self.shard(account).call("pin_hash", account)
+        ok = pin_hash is not None and verify_pin(pin, pin_hash)
+        if ok:
+            self.pin_attempts.succeeded(account)
+        else:
+            if pin_hash is not None:  # unknown cards are metered by terminal alone
+                self.pin_attempts.failed(account)
+            if terminal is not None:
+                self.terminals.spend(terminal)
+        return ok
+
+    def _transfer(self, account, amount, recipient):
+        source, target = self.shard(account), self.shard(recipient)
+        with self._open_lock:
+            txid = str(self._next_txid)
+            self._next_txid += 1
+            self._open.add(txid)
+        # Phase 1: hold the funds while the target confirms the recipient
+        held = source.submit("hold", account, amount, f"{txid}:{recipient}")
+        exists = target.submit("has_account", recipient)
+        try:
+            balance = held.result()
+        except Exception:
+            self._finished(txid)  # refused or never held, so nothing to credit
+            raise
+        if not exists.result():
+            # Not one of our accounts: an outgoing transfer, the hold is final
+            source.call("settle", account, amount, txid)
+            self._finished(txid)
+            return balance
+        self._commit(txid, account, amount, recipient)
+        return balance
+
+    def _commit(self, txid, account, amount, recipient):
+        record = f"{txid}:{recipient}"
+        self._log.append("commit", account, amount, record)
+        # Phase 2
+        credit = self.shard(recipient).submit("credit", recipient, amount, f"{txid}:{self._watermark()}")
+        settle = self.shard(account).submit("settle", account, amount, txid)
+        credit.result()
+        settle.result()
+        self._log.append("done", account, amount, record, wait=False)
+        # Only now: a transfer that fails half way stays open until the
+        # restart that finishes it
+        self._finished(txid)
+
+    def _finished(self, txid):
+        with self._open_lock:
+            self._open.discard(txid)
+
+    def _watermark(self):
+        # Every id below this has been credited if it ever will be
+        with self._open_lock:
+            return min(map(int, self._open), default=self._next_txid)
+
+    def _recover(self, log_path):
+        self._log = Journal(log_path)  # locked before it is read
+        committed = {}
+        next_txid = offset = 0
+        for _, kind, account, amount, record, offset in replay(log_path):
+            txid, recipient = record.split(":", 1)
+            if kind == "commit":
+                committed[txid] = (account, amount, recipient)
+            else:
+                committed.pop(txid, None)
+            next_txid = max(next_txid, int(txid) + 1)
+        self._log.truncate(offset)
+        self._next_txid = next_txid
+        self._open.update(committed)
+
+        for txid, (account, amount, recipient) in committed.items():
+            self._commit(txid, account, amount, recipient)
+        for shard in self.shards:
+            for txid, account, amount in shard.call("holds"):
+                # Prepared but never committed: hand the money back
+                shard.call("release", account, amount, txid)
+                self._next_txid = max(self._next_txid, int(txid) + 1)
@@ -0,0 +1,48 @@
+import os
+import struct
+from array import array
+
+# magic, format version, journal offset, number of arrays
+HEADER = struct.Struct("<4sHQI")
+# typecode, element count
+ARRAY_HEADER = struct.Struct("<cxxxQ")
+MAGIC = b"ATMS"
+VERSION = 2
+
+
+def write_snapshot(path, offset, arrays):
+    """Atomically replace ``path`` with a binary image of ``arrays``.
+
+    ``offset`` is the journal position the arrays are consistent with;
+    startup replays only the records written after it.
+    """
+    tmp = f"{path}.{os.getpid()}.tmp"  # never another process's half-written file
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, offset, len(arrays)))
+        for data in arrays:
+            f.write(ARRAY_HEADER.pack(data.typecode.encode("ascii"), len(data)))
+            data.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def read_snapshot(path):
+    # Returns (offset, arrays); a missing, empty or foreign file yields (0, None)
+    try:
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                return 0, None
+            magic, version, offset, n_arrays = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION:
+                return 0, None
+            arrays = []
+            for _ in range(n_arrays):
+                typecode, count = ARRAY_HEADER.unpack(f.read(ARRAY_HEADER.size))
+                data = array(typecode.decode("ascii"))
+                data.fromfile(f, count)
+                arrays.append(data)
+    except (FileNotFoundError, EOFError, struct.error):
+        return 0, None
+    return offset, arrays
@@ -0,0 +1,62 @@
+import collections
+import time
+
+
+class Statement:
+    __slots__ = ("balance", "rows", "loaded")
+
+    def __init__(self, balance, rows, loaded):
+        self.balance = balance  # paise
+        self.rows = rows        # newest first, already formatted for display
+        self.loaded = loaded
+
+
+class StatementCache:
+    """Balance and mini-statement of recently used accounts, kept in memory.
+
+    ``get(account, on_ready)`` calls ``on_ready`` with a ``Statement``: at
+    once on a hit, and on a miss once ``worker`` (a ``LedgerWorker``) has
+    fetched the balance, so the Tk thread never waits on the ledger.
+    ``rows_for(account, rows)`` supplies the newest ``rows`` formatted
+    history rows. ``put(account, balance)`` stores a balance the caller
+    already has, such as the one fetched with the login or returned by a
+    posting; callers that post without one ``invalidate`` the account. At
+    most ``capacity`` accounts are kept, least recently used going first.
+    Entries older than ``max_age`` seconds are reloaded, so credits posted
+    from other terminals show up. Not thread-safe: the front-ends use it from the
+    Tk thread only.
+    """
+
+    def __init__(self, worker, rows_for=None, rows=10, capacity=1024, max_age=30.0):
+        self.worker = worker
+        self.rows_for = rows_for
+        self.rows = rows
+        self.capacity = capacity
+        self.max_age = max_age
+        self._entries = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    def get(self, account, on_ready, on_error=None):
+        entry = self._entries.get(account)
+        if entry is not None and time.monotonic() - entry.loaded < self.max_age:
+            self._entries.move_to_end(account)
+            self.hits += 1
+            on_ready(entry)
+            return
+        self.misses += 1
+        self.worker.submit("balance", account, on_success=lambda balance: on_ready(self.put(account, balance)),
+                           on_error=on_error)
+
+    def put(self, account, balance):
+        rows = self.rows_for(account, self.rows) if self.rows_for else []
+        entry = self._entries[account] = Statement(balance, rows, time.monotonic())
+        self._entries.move_to_end(account)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, account):
+        self._entries.pop(account, None)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,32 @@
+"""The parts every front-end needs to run as one ATM terminal.
+
+``open_terminal(app, name)`` gives a Tk app:
+
+- ``terminal``: the name it goes by, to the switch (which meters wrong
+  PINs per terminal) and in its cassette log;
+- ``ledger``: the switch server when ATM_SERVER is set, otherwise the
+  local journal (see ``client.connect_ledger``);
+- ``worker``: a ``LedgerWorker`` that runs postings on a background thread,
+  so the window never freezes, and calls back on the Tk thread once a
+  posting is done;
+- ``cassettes``: the notes left in this terminal's dispenser;
+- ``statements``: a ``StatementCache`` of the balance and newest history
+  rows of recent cards, which the front-ends refresh with the balance each
+  posting returns.
+
+Close it with ``app.worker.close()`` once the main loop ends.
+"""
+from cassettes import open_cassettes
+from client import connect_ledger
+from statements import StatementCache
+from worker import LedgerWorker
+
+
+def open_terminal(app, name, statement_rows=None, rows=10):
+    # statement_rows(account, rows) formats the newest history rows; without
+    # it the cache holds balances only
+    app.terminal = name
+    app.ledger = connect_ledger(terminal=name)
+    app.worker = LedgerWorker(app, app.ledger, name)
+    app.cassettes = open_cassettes(name)
+    app.statements = StatementCache(app.worker, statement_rows, rows=rows if statement_rows else 0)
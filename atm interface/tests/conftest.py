@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# The modules import each other by flat name and read these at import time:
+# keep the data files out of the working tree and the PIN hashes cheap
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["ATM_DATA_DIR"] = tempfile.mkdtemp(prefix="atm-tests-")
+os.environ["ATM_PIN_COST"] = "4"
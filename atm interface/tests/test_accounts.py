@@ -0,0 +1,51 @@
+import pytest
+
+from accounts import AccountStore, UnknownAccount
+from credentials import hash_pin
+
+PIN_HASH = hash_pin("1234")
+
+
+def test_lookups_survive_rehashing():
+    store = AccountStore(capacity=4)
+    ids = [str(100000 + i * 7) for i in range(1000)]
+    for i, account in enumerate(ids):
+        assert store.add(account, PIN_HASH, i) == i
+    assert len(store._table_keys) >= len(ids) / 0.7
+    assert [store.balances[store.slot(account)] for account in ids] == list(range(1000))
+    assert "100001" not in store
+
+
+def test_leading_zeros_are_significant():
+    store = AccountStore()
+    store.add("0123", PIN_HASH)
+    assert "0123" in store
+    assert "123" not in store
+    assert store.account_id(store.slot("0123")) == "0123"
+
+
+def test_bad_rows_leave_the_columns_aligned():
+    store = AccountStore()
+    store.add("100001", PIN_HASH, 5)
+    for args in (("100001", PIN_HASH), ("100002", b"short"), ("100002", PIN_HASH, -1), ("12a4", PIN_HASH)):
+        with pytest.raises(ValueError):
+            store.add(*args)
+    assert len(store.ids) == len(store.balances) == len(store.pin_hashes) // len(PIN_HASH) == 1
+
+
+def test_unknown_and_malformed_accounts():
+    store = AccountStore()
+    with pytest.raises(UnknownAccount):
+        store.slot("100001")
+    assert store.pin_hash("100001") is None
+    assert store.pin_hash("not a card") is None
+
+
+def test_state_round_trip():
+    store = AccountStore(capacity=2)
+    for i in range(10):
+        store.add(str(100000 + i), PIN_HASH, i * 100)
+    copy = AccountStore.from_state([a[:] for a in store.state()])
+    assert copy.balances[copy.slot("100009")] == 900
+    assert copy.check_pin("100003", "1234")
+    assert not copy.check_pin("100003", "4321")
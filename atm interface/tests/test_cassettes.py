@@ -0,0 +1,63 @@
+import itertools
+
+from cassettes import Cassettes
+
+
+def fewest_notes(denominations, counts, max_notes, amount):
+    # Brute force over every mix the cassettes could pay
+    best = None
+    for mix in itertools.product(*(range(min(count, max_notes) + 1) for count in counts)):
+        if sum(mix) <= max_notes and sum(d * n for d, n in zip(denominations, mix)) == amount:
+            if best is None or sum(mix) < best:
+                best = sum(mix)
+    return best
+
+
+def check_against_brute_force(cassettes):
+    for amount in range(10000, cassettes.max_notes * 50000 + 1, 10000):
+        mix = cassettes.plan(amount)
+        best = fewest_notes(cassettes.denominations, cassettes.counts, cassettes.max_notes, amount)
+        if best is None:
+            assert mix is None, amount
+        else:
+            assert sum(mix) == best, amount
+            assert sum(d * n for d, n in zip(cassettes.denominations, mix)) == amount
+
+
+def test_plan_uses_fewest_notes(tmp_path):
+    cassettes = Cassettes(str(tmp_path / "t1.log"), max_notes=8)
+    try:
+        check_against_brute_force(cassettes)
+        assert cassettes.plan(70000) == (1, 1, 0)
+        assert cassettes.plan(15000) is None
+        assert "multiples of ₹100" in cassettes.refusal(15000)
+    finally:
+        cassettes.close()
+
+
+def test_plan_follows_the_notes_left(tmp_path):
+    cassettes = Cassettes(str(tmp_path / "t1.log"), max_notes=8)
+    try:
+        cassettes.load({50000: 2, 20000: 3, 10000: 1})
+        check_against_brute_force(cassettes)
+        assert cassettes.pay_out((1, 1, 0)) == "1 x ₹500, 1 x ₹200"
+        assert cassettes.counts == [1, 2, 1]
+        check_against_brute_force(cassettes)
+        assert cassettes.plan(cassettes.available() + 10000) is None
+    finally:
+        cassettes.close()
+
+
+def test_counts_replay_from_the_log(tmp_path):
+    path = str(tmp_path / "t1.log")
+    cassettes = Cassettes(path)
+    cassettes.load({50000: 10, 20000: 10, 10000: 10})
+    cassettes.dispense((2, 1, 0))
+    cassettes.close()
+    with open(path, "ab") as f:
+        f.write(b"1.0\tdispense\t1,")  # torn by a crash
+    cassettes = Cassettes(path)
+    try:
+        assert cassettes.counts == [8, 9, 10]
+    finally:
+        cassettes.close()
@@ -0,0 +1,81 @@
+import pytest
+
+from journal import Journal, encode_record, replay
+from ledger import DEMO_BALANCE, open_ledger
+
+
+def test_replay_returns_what_was_appended(tmp_path):
+    path = str(tmp_path / "transactions.log")
+    journal = Journal(path)
+    journal.append("deposit", "100001", 500, timestamp=1.5)
+    journal.append("transfer", "100001", 250, "tab\there", timestamp=2.5)
+    journal.close()
+    records = list(replay(path))
+    assert [record[:5] for record in records] == [
+        (1.5, "deposit", "100001", 500, ""),
+        (2.5, "transfer", "100001", 250, "tab here"),
+    ]
+    assert records[-1][5] == (tmp_path / "transactions.log").stat().st_size
+
+
+def test_replay_skips_a_torn_tail(tmp_path):
+    path = tmp_path / "transactions.log"
+    whole = encode_record(1.0, "deposit", "100001", 500)
+    path.write_bytes(whole + encode_record(2.0, "withdraw", "100001", 100)[:-3])
+    records = list(replay(str(path)))
+    assert len(records) == 1
+    assert records[0][5] == len(whole)
+
+
+def test_journal_truncates_the_torn_tail_before_appending(tmp_path):
+    path = tmp_path / "transactions.log"
+    whole = encode_record(1.0, "deposit", "100001", 500)
+    path.write_bytes(whole + b"2.0\twith")
+    journal = Journal(str(path), truncate_at=len(whole))
+    journal.append("withdraw", "100001", 100, timestamp=3.0)
+    journal.close()
+    assert [record[1] for record in replay(str(path))] == ["deposit", "withdraw"]
+
+
+def test_second_journal_on_the_same_log_is_refused(tmp_path):
+    path = str(tmp_path / "transactions.log")
+    journal = Journal(path)
+    try:
+        with pytest.raises(RuntimeError, match="in use"):
+            Journal(path)
+    finally:
+        journal.close()
+    Journal(path).close()  # free again once closed
+
+
+def test_ledger_reopens_from_snapshot_and_journal_tail(tmp_path):
+    log_path, snapshot_path = str(tmp_path / "transactions.log"), str(tmp_path / "balance.txt")
+    ledger = open_ledger(log_path, snapshot_path)
+    ledger.deposit("100001", 500)
+    ledger.close()  # snapshots
+    ledger = open_ledger(log_path, snapshot_path)
+    ledger.withdraw("100001", 200)
+    ledger.journal.close()  # a crash: no snapshot of the withdrawal
+    ledger.journal = None
+    ledger = open_ledger(log_path, snapshot_path)
+    try:
+        assert ledger.balance("100001") == DEMO_BALANCE + 300
+    finally:
+        ledger.close()
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_posting_that_cannot_be_journalled_changes_nothing(tmp_path):
+    log_path, snapshot_path = str(tmp_path / "transactions.log"), str(tmp_path / "balance.txt")
+    ledger = open_ledger(log_path, snapshot_path)
+    try:
+        with pytest.raises(ValueError):
+            ledger.post("deposit", "100001", 500, "", "not a timestamp")
+        assert ledger.balance("100001") == DEMO_BALANCE
+    finally:
+        ledger.close()
+    ledger = open_ledger(log_path, snapshot_path)
+    try:
+        assert ledger.balance("100001") == DEMO_BALANCE
+    finally:
+        ledger.close()
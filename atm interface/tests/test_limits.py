@@ -0,0 +1,55 @@
+import time
+
+from limits import LimitEngine
+
+LIMITS = {"withdraw": (10000, 3), "transfer": (50000, 10)}
+
+
+def test_cap_in_paise():
+    engine = LimitEngine(LIMITS, per_recipient=None)
+    now = time.time()
+    assert engine.refusal("withdraw", "100001", 10000) is None
+    engine.count("withdraw", "100001", 6000, "", now)
+    assert "₹40.00 left" in engine.refusal("withdraw", "100001", 5000)
+    assert engine.refusal("withdraw", "100001", 4000) is None
+    assert engine.refusal("withdraw", "100002", 10000) is None
+
+
+def test_cap_in_postings():
+    engine = LimitEngine(LIMITS, per_recipient=None)
+    now = time.time()
+    for _ in range(3):
+        engine.count("withdraw", "100001", 1, "", now)
+    assert engine.refusal("withdraw", "100001", 1) == "Daily limit of 3 cash withdrawals reached"
+
+
+def test_cap_per_recipient():
+    engine = LimitEngine(LIMITS, per_recipient=20000)
+    engine.count("transfer", "100001", 15000, "100002", time.time())
+    assert "Daily limit to 100002" in engine.refusal("transfer", "100001", 10000, "100002")
+    assert engine.refusal("transfer", "100001", 10000, "100003") is None
+
+
+def test_yesterday_reads_as_zero():
+    engine = LimitEngine(LIMITS, per_recipient=None)
+    engine.count("withdraw", "100001", 10000, "", time.time() - 86400 * 2)
+    assert engine.refusal("withdraw", "100001", 10000) is None
+
+
+def test_not_enforced_while_replaying():
+    engine = LimitEngine(LIMITS)
+    engine.enforce = False
+    assert engine.refusal("withdraw", "100001", 10 ** 9) is None
+
+
+def test_state_round_trip():
+    engine = LimitEngine(LIMITS, per_recipient=20000)
+    now = time.time()
+    engine.count("withdraw", "100001", 6000, "", now)
+    engine.count("transfer", "100001", 15000, "100002", now)
+    engine.count("withdraw", "100003", 100, "", now - 86400 * 2)  # stale, dropped
+    copy = LimitEngine(LIMITS, per_recipient=20000)
+    copy.restore(engine.state())
+    assert copy._spent == engine._spent
+    assert ("100003", "withdraw") not in copy._spent
+    assert copy.refusal("transfer", "100001", 10000, "100002") is not None
@@ -0,0 +1,23 @@
+import pytest
+
+from money import format_amount, parse_amount
+
+
+@pytest.mark.parametrize("text, paise", [
+    ("500", 50000), (" 500 ", 50000), ("12.5", 1250), ("12.05", 1205), (".5", 50), ("7.", 700), ("0", 0),
+])
+def test_parse_amount(text, paise):
+    assert parse_amount(text) == paise
+
+
+@pytest.mark.parametrize("text", ["", ".", "-5", "1.234", "abc", "1,000", "1e3"])
+def test_parse_amount_rejects(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+
+def test_format_amount():
+    assert format_amount(123450) == "1234.50"
+    assert format_amount(123450, grouping=True) == "1,234.50"
+    assert format_amount(-5) == "-0.05"
+    assert parse_amount(format_amount(987654321)) == 987654321
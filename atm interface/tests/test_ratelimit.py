@@ -0,0 +1,83 @@
+from ratelimit import AttemptLimiter, TokenBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_locks_at_the_limit_and_unlocks_as_the_window_slides():
+    clock = Clock()
+    limiter = AttemptLimiter(limit=3, window=100, clock=clock)
+    for _ in range(2):
+        limiter.failed("100001")
+    assert limiter.retry_after("100001") == 0.0
+    limiter.failed("100001")
+    wait = limiter.retry_after("100001")
+    assert wait > 0
+    clock.now = wait - 1
+    assert limiter.retry_after("100001") > 0
+    clock.now = wait + 1e-6
+    assert limiter.retry_after("100001") == 0.0
+
+
+def test_success_forgets_the_card():
+    limiter = AttemptLimiter(limit=3, clock=Clock())
+    for _ in range(3):
+        limiter.failed("100001")
+    limiter.succeeded("100001")
+    assert limiter.retry_after("100001") == 0.0
+    assert len(limiter) == 0
+
+
+def test_old_windows_are_dropped_whole():
+    clock = Clock()
+    limiter = AttemptLimiter(limit=3, window=100, clock=clock)
+    limiter.failed("100001")
+    clock.now = 250
+    limiter.failed("100002")
+    assert len(limiter) == 1
+
+
+def test_overflow_keeps_locked_cards():
+    clock = Clock()
+    limiter = AttemptLimiter(limit=3, window=100, max_keys=10, clock=clock)
+    for _ in range(3):
+        limiter.failed("locked")
+    for i in range(100):
+        limiter.failed(f"guess{i}")
+        assert len(limiter) <= 10
+    assert limiter.retry_after("locked") > 0
+
+
+def test_overflow_of_locked_cards_stops_counting_new_ones():
+    limiter = AttemptLimiter(limit=1, window=100, max_keys=3, clock=Clock())
+    for card in "abcde":
+        limiter.failed(card)
+    assert len(limiter) == 3
+    assert all(limiter.retry_after(card) > 0 for card in "abc")
+    assert limiter.retry_after("e") == 0.0
+
+
+def test_token_buckets_refill():
+    clock = Clock()
+    buckets = TokenBuckets(rate=0.5, burst=2, clock=clock)
+    buckets.spend("t1")
+    assert buckets.retry_after("t1") == 0.0
+    buckets.spend("t1")
+    assert buckets.retry_after("t1") == 2.0
+    assert buckets.retry_after("t2") == 0.0
+    clock.now = 2.0
+    assert buckets.retry_after("t1") == 0.0
+
+
+def test_full_buckets_are_swept():
+    clock = Clock()
+    buckets = TokenBuckets(rate=1, burst=2, clock=clock)
+    buckets.spend("t1")
+    clock.now = 10
+    buckets.spend("t2")
+    assert len(buckets) == 1
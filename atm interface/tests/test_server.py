@@ -0,0 +1,44 @@
+import pytest
+
+from ledger import TransactionError
+from protocol import encode_request
+from server import LedgerServer, posting_args
+
+
+class Writer:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+
+@pytest.mark.parametrize("args", [["100001"], ["100001", "500", "100002", "1700000000.0"]])
+def test_postings_take_no_extra_fields(args):
+    with pytest.raises(TransactionError):
+        posting_args("deposit", args)
+
+
+def test_posting_args():
+    assert posting_args("deposit", ["100001", "500"]) == ["100001", 500]
+    assert posting_args("transfer", ["100001", "500", "100002"]) == ["100001", 500, "100002"]
+
+
+def test_hello_names_the_terminal_within_the_host_quota():
+    server = LedgerServer(ledger=None, terminals_per_host=2)
+    writer = Writer()
+
+    def hello(host, name):
+        return server.hello(encode_request(1, "hello", [name]), writer, host)
+
+    assert hello("10.0.0.1", "a") == "10.0.0.1/a"
+    assert hello("10.0.0.1", "b") == "10.0.0.1/b"
+    assert hello("10.0.0.1", "c") == "10.0.0.1"  # past the quota: the host's budget
+    assert hello("10.0.0.1", "a") == "10.0.0.1/a"
+    assert hello("10.0.0.2", "c") == "10.0.0.2/c"
+    assert len(writer.written) == 5
+
+
+def test_first_request_without_hello_is_not_consumed():
+    server = LedgerServer(ledger=None)
+    assert server.hello(encode_request(1, "balance", ["100001"]), Writer(), "local") is None
@@ -0,0 +1,29 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+from shards import ShardedLedger
+
+
+class BrokenShard:
+    # A shard whose process died with the hold in flight
+    def submit(self, op, *args):
+        future = Future()
+        if op == "hold":
+            future.set_exception(ConnectionError("ledger shard exited"))
+        else:
+            future.set_result(True)
+        return future
+
+
+def test_failed_hold_closes_the_transfer_id():
+    ledger = ShardedLedger.__new__(ShardedLedger)
+    ledger.shards = [BrokenShard()]
+    ledger._open = set()
+    ledger._open_lock = threading.Lock()
+    ledger._next_txid = 7
+    with pytest.raises(ConnectionError):
+        ledger._transfer("100001", 500, "100002")
+    assert not ledger._open
+    assert ledger._watermark() == 8
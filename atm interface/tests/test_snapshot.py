@@ -0,0 +1,28 @@
+from array import array
+
+from snapshot import read_snapshot, write_snapshot
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "balance.txt")
+    arrays = [array("q", [1, -2, 1 << 62]), array("B", b"\x00\xff"), array("b"), array("d", [0.5])]
+    write_snapshot(path, 1234, arrays)
+    assert read_snapshot(path) == (1234, arrays)
+    assert [p.name for p in tmp_path.iterdir()] == ["balance.txt"]
+
+
+def test_missing_or_foreign_file_reads_as_none(tmp_path):
+    path = tmp_path / "balance.txt"
+    assert read_snapshot(str(path)) == (0, None)
+    path.write_bytes(b"100001 1234 5000\n")  # the text format before snapshots
+    assert read_snapshot(str(path)) == (0, None)
+    path.write_bytes(b"")
+    assert read_snapshot(str(path)) == (0, None)
+
+
+def test_truncated_file_reads_as_none(tmp_path):
+    path = str(tmp_path / "balance.txt")
+    write_snapshot(path, 7, [array("q", range(100))])
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 8)
+    assert read_snapshot(path) == (0, None)
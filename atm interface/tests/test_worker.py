@@ -0,0 +1,81 @@
+import time
+
+import pytest
+
+pytest.importorskip("tkinter")
+
+import worker  # noqa: E402
+from ledger import DEMO_BALANCE, open_ledger  # noqa: E402
+from worker import LedgerWorker  # noqa: E402
+
+
+class Root:
+    """Just enough of a Tk root to run the worker's callbacks."""
+
+    def __init__(self):
+        self.pending = []
+        self.errors = []
+
+    def after(self, ms, callback):
+        self.pending.append(callback)
+
+    def report_callback_exception(self, kind, exc, traceback):
+        self.errors.append(exc)
+
+    def run(self, worker):
+        while worker.busy:
+            time.sleep(0.001)
+            pending, self.pending = self.pending, []
+            for callback in pending:
+                callback()
+
+
+class Ledger:
+    # Records which calls reach the ledger
+    def __init__(self, ledger):
+        self.ledger = ledger
+        self.calls = []
+
+    def __getattr__(self, name):
+        self.calls.append(name)
+        return getattr(self.ledger, name)
+
+
+@pytest.fixture
+def login(tmp_path, monkeypatch):
+    shown = []
+    monkeypatch.setattr(worker.messagebox, "showerror", lambda *args: shown.append(args))
+    ledger = Ledger(open_ledger(str(tmp_path / "transactions.log"), str(tmp_path / "balance.txt")))
+    root = Root()
+    atm = LedgerWorker(root, ledger, "t1")
+
+    def login(account, pin):
+        results, locked = [], []
+        atm.login(account, pin, on_success=lambda ok, balance: results.append((ok, balance)),
+                  on_locked=lambda: locked.append(True))
+        root.run(atm)
+        assert not root.errors
+        return results[0] if results else ("locked" if locked else None)
+
+    login.ledger = ledger
+    login.shown = shown
+    yield login
+    atm.close()
+
+
+def test_balance_only_after_the_right_pin(login):
+    assert login("100001", "0000") == (False, None)
+    assert "balance" not in login.ledger.calls
+    assert login("100001", "1234") == (True, DEMO_BALANCE)
+
+
+@pytest.mark.parametrize("account", ["999999", "12a4", ""])
+def test_unknown_card_is_a_failed_login(login, account):
+    assert login(account, "1234") == (False, None)
+
+
+def test_locked_card_is_reported(login):
+    for _ in range(5):
+        login("100001", "0000")
+    assert login("100001", "1234") == "locked"
+    assert login.shown[0][0] == "Card locked"
@@ -0,0 +1,222 @@
+"""Screen-transition latency benchmark for the Tk front-ends.
+
+Drives each front-end under a virtual X server (Xvfb is started when no
+DISPLAY is set), times every screen transition and history render at
+several history sizes, and prints one comparable table per front-end.
+The last row is the longest gap between 16 ms frames while a deliberately
+slowed transaction is pending on the ledger worker.
+State is written to a throwaway ATM_DATA_DIR, never to the repo.
+
+    python ui_benchmark.py
+    python ui_benchmark.py --frontends atm1 atm2 --history-sizes 0 1000 100000
+"""
+import argparse
+import importlib.util
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FRONTENDS = ("atm", "atm1", "atm2", "ATM-INTERFACE", "ATM_Simulator")
+clock = time.perf_counter
+
+
+def start_xvfb(display=":99"):
+    if shutil.which("Xvfb") is None:
+        raise SystemExit("no DISPLAY set and Xvfb is not installed")
+    proc = subprocess.Popen(["Xvfb", display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    socket = f"/tmp/.X11-unix/X{display.lstrip(':')}"
+    deadline = time.monotonic() + 10
+    while not os.path.exists(socket):
+        if proc.poll() is not None or time.monotonic() > deadline:
+            raise SystemExit(f"Xvfb failed to start on {display}")
+        time.sleep(0.05)
+    os.environ["DISPLAY"] = display
+    return proc
+
+
+def load_frontend(name):
+    spec = importlib.util.spec_from_file_location(name.replace("-", "_"), os.path.join(HERE, name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(app, action):
+    # Time the handler plus the redraw it triggers
+    t = clock()
+    action()
+    app.update()
+    return clock() - t
+
+
+def click_delay(app):
+    # Time from a click on an animated button until its callback runs
+    import tkinter as tk
+    widget = tk.Label(app, text="probe")
+    fired = []
+    t = clock()
+    app.animate_click(widget, lambda: fired.append(clock()))
+    while not fired:
+        app.update()
+        time.sleep(0.001)
+    widget.destroy()
+    return fired[0] - t
+
+
+def pending_frame_gap(app, account, delay):
+    # Longest gap between 16 ms ticks while a slow posting is in flight
+    worker = app.worker
+    worker.delay = delay
+    done = []
+    worker.submit("deposit", account, 100, on_success=done.append, on_error=done.append)
+    ticks = [clock()]
+
+    def tick():
+        ticks.append(clock())
+        if not done:
+            app.after(16, tick)
+    app.after(16, tick)
+    while not done:
+        app.update()
+        time.sleep(0.001)
+    worker.delay = 0.0
+    return max(b - a for a, b in zip(ticks, ticks[1:]))
+
+
+def settle_worker(app):
+    # Logins and balances are fetched on the worker; wait for the answer to
+    # reach the UI
+    while app.worker.busy:
+        app.update()
+        time.sleep(0.001)
+
+
+def transitions(name, app):
+    """Return [(label, action)] for ``name``; actions take no arguments."""
+    if name == "atm":
+        login = app.frames["LoginScreen"]
+
+        def do_login():
+            login.user_entry.insert(0, "123456")
+            login.pin_entry.insert(0, "654321")
+            login.check_login()
+            settle_worker(app)
+        return [
+            ("login -> menu", do_login),
+            ("menu -> deposit", lambda: app.show_screen("DepositScreen")),
+            ("deposit -> menu", lambda: app.show_screen("MenuScreen")),
+            ("menu -> balance", lambda: (app.show_screen("BalanceScreen"), settle_worker(app))),
+            ("balance -> menu", lambda: app.show_screen("MenuScreen")),
+        ]
+    if name in ("atm1", "atm2"):
+        def do_login():
+            app.show_login_screen()
+            app.input_value = "1234"
+            app.login_attempt()
+            settle_worker(app)
+        steps = [
+            ("login -> menu", do_login),
+            ("menu -> deposit", app.show_deposit_screen),
+            ("deposit -> menu", app.show_main_menu),
+            ("menu -> withdraw", app.show_withdraw_screen),
+            ("menu -> transfer", app.show_transfer_screen),
+            ("menu -> balance", lambda: (app.show_balance_screen(), settle_worker(app))),
+            ("menu -> history", app.show_transactions_screen),
+            ("history -> menu", app.show_main_menu),
+        ]
+        if name == "atm2":
+            steps.append(("menu -> phonepay", app.show_phonepay_screen))
+        return steps
+
+    def do_login():
+        app.show_login_screen()
+        app.pin_entry.insert(0, "2004")
+        app.login()
+        settle_worker(app)
+    steps = [
+        ("login -> menu", do_login),
+        ("menu -> deposit", app.deposit_screen),
+        ("deposit -> menu", app.show_main_menu),
+        ("menu -> withdraw", app.withdraw_screen),
+        ("menu -> phonepe", app.phonepe_screen),
+        ("menu -> history", app.show_transactions),
+        ("history -> menu", app.show_main_menu),
+    ]
+    return steps
+
+
+def fill_history(name, app, rows):
+    app.statements.clear()
+    if not hasattr(app, "history"):
+        return  # atm.py shows no history
+    app.history.clear()
+    for _ in range(rows):
+        app.history.add("Deposit", 50000, "", 10050000)
+
+
+def bench_frontend(name, history_sizes, repeats, backend_delay, out):
+    from tkinter import messagebox
+    messagebox.showinfo = messagebox.showerror = lambda *args, **kwargs: None
+
+    module = load_frontend(name)
+    app_class = getattr(module, "ATMApp", None) or module.ATMPhonePeApp
+    try:
+        app = app_class()
+    except Exception as exc:  # e.g. atm.py's state('zoomed') is Windows-only
+        print(f"{name}: could not start ({exc})\n", file=out)
+        return
+    try:
+        app.update()
+        print(f"frontend: {name}", file=out)
+        print(f"{'transition':<20} {'rows':>8} {'first ms':>9} {'median ms':>10}", file=out)
+        for rows in history_sizes:
+            fill_history(name, app, rows)
+            for label, action in transitions(name, app):
+                samples = [timed(app, action) for _ in range(repeats)]
+                print(f"{label:<20} {rows:>8} {samples[0] * 1e3:>9.2f} "
+                      f"{statistics.median(samples) * 1e3:>10.2f}", file=out)
+        if hasattr(app, "animate_click"):
+            samples = [click_delay(app) for _ in range(repeats)]
+            print(f"{'animate_click delay':<20} {'-':>8} {samples[0] * 1e3:>9.2f} "
+                  f"{statistics.median(samples) * 1e3:>10.2f}", file=out)
+        account = getattr(app, "card_number", None) or app.account
+        samples = [pending_frame_gap(app, account, backend_delay) for _ in range(repeats)]
+        print(f"{'frame gap (pending)':<20} {'-':>8} {samples[0] * 1e3:>9.2f} "
+              f"{statistics.median(samples) * 1e3:>10.2f}", file=out)
+        print(file=out)
+    finally:
+        app.destroy()
+        app.worker.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frontends", nargs="+", choices=FRONTENDS, default=list(FRONTENDS))
+    parser.add_argument("--history-sizes", nargs="+", type=int, default=[0, 100, 10000, 100000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--backend-delay", type=float, default=0.25,
+                        help="seconds each posting is held back for the frame-gap row")
+    parser.add_argument("--display", default=":99", help="display number for the Xvfb we start")
+    args = parser.parse_args(argv)
+
+    xvfb = None if os.environ.get("DISPLAY") else start_xvfb(args.display)
+    data_dir = tempfile.mkdtemp(prefix="atm-ui-bench-")
+    os.environ["ATM_DATA_DIR"] = data_dir
+    sys.path.insert(0, HERE)
+    try:
+        for name in args.frontends:
+            bench_frontend(name, args.history_sizes, args.repeats, args.backend_delay, sys.stdout)
+    finally:
+        shutil.rmtree(data_dir)
+        if xvfb is not None:
+            xvfb.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import messagebox
+
+from accounts import UnknownAccount
+from ledger import PinLocked
+
+
+class LedgerWorker:
+    """Runs ledger operations off the Tk event thread.
+
+    ``submit("withdraw", account, amount, on_success=..., on_error=...)``
+    queues the call on a single background thread, so postings still happen
+    one at a time and in order, and returns immediately. Results come back
+    through a queue that the Tk side drains with ``after()``, so both
+    callbacks always run on the event thread and may touch widgets freely.
+
+    ``login`` checks a PIN and, only if it is right, fetches the account's
+    balance, passing ``terminal`` along so a ledger in the same process
+    meters wrong PINs from this terminal as the switch would. An unknown or
+    malformed card number is a failed login like a wrong PIN. It tells the
+    customer itself when the card or terminal is locked, then calls
+    ``on_locked``.
+
+    ``delay`` (or the ATM_BACKEND_DELAY environment variable, in seconds)
+    holds each call back to simulate a slow journal or network debit.
+    """
+
+    def __init__(self, root, ledger, terminal=None, poll_ms=15, delay=0.0):
+        self.root = root
+        self.ledger = ledger
+        self.terminal = terminal
+        self.poll_ms = poll_ms
+        self.delay = float(os.environ.get("ATM_BACKEND_DELAY", delay))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ledger")
+        self._done = queue.SimpleQueue()
+        self._pending = 0
+
+    @property
+    def busy(self):
+        return self._pending > 0
+
+    def submit(self, operation, *args, on_success, on_error=None):
+        self._pending += 1
+        self._executor.submit(self._call, operation, args, on_success, on_error)
+        if self._pending == 1:
+            self.root.after(self.poll_ms, self._poll)
+
+    def pipeline(self, calls, on_success, on_error=None):
+        self.submit("pipeline", calls, on_success=on_success, on_error=on_error)
+
+    def login(self, account, pin, on_success, on_locked=None):
+        # Hashed PINs are slow to check on purpose, which is why every
+        # front-end logs in here rather than on the Tk thread.
+        # on_success(ok, balance); the balance primes the balance screen
+        # and is None when the login failed
+        self.submit(self._check_login, account, pin,
+                    on_success=lambda results: on_success(*results),
+                    on_error=lambda exc: self._login_refused(exc, on_locked))
+
+    def close(self):
+        # Let queued postings reach the journal before it is closed
+        self._executor.shutdown(wait=True)
+        self.ledger.close()
+
+    def _check_login(self, account, pin):
+        # Runs on the worker thread
+        try:
+            ok = self.ledger.check_pin(account, pin, self.terminal)
+        except PinLocked:
+            raise
+        except (UnknownAccount, ValueError):
+            return False, None
+        return ok, self.ledger.balance(account) if ok else None
+
+    def _login_refused(self, exc, on_locked):
+        if not isinstance(exc, PinLocked):
+            raise exc
+        minutes = max(1, round(exc.retry_after / 60))
+        messagebox.showerror("Card locked", f"Too many incorrect PINs. Try again in {minutes} min.")
+        if on_locked is not None:
+            on_locked()
+
+    def _call(self, operation, args, on_success, on_error):
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            call = operation if callable(operation) else getattr(self.ledger, operation)
+            result = call(*args)
+        except Exception as exc:
+            self._done.put((on_error, exc))
+        else:
+            self._done.put((on_success, result))
+
+    def _poll(self):
+        while True:
+            try:
+                callback, value = self._done.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            try:
+                if callback is not None:
+                    callback(value)
+                elif isinstance(value, Exception):
+                    raise value
+            except Exception as exc:
+                # Same reporting Tk gives any other failing callback
+                self.root.report_callback_exception(type(exc), exc, exc.__traceback__)
+        if self._pending:
+            self.root.after(self.poll_ms, self._poll)